@@ -0,0 +1,93 @@
+"""
+Compare two benchmark results files
+
+    python -m benchmarks.compare benchmarks/results/1k-abc1234.json benchmarks/results/1k-def5678.json
+
+A benchmark counts as a regression when its ops/s drops, or its p99 latency rises, by more than the threshold
+percentage. The exit status is 1 if anything regressed, so it can gate CI.
+"""
+from typing import Any, Dict, List, Optional
+import argparse
+import json
+import sys
+
+
+def _change(old: Optional[float], new: Optional[float]) -> Optional[float]:
+    """
+    Percentage change from old to new, None if either is missing
+    """
+    if not old or new is None:
+        return None
+    return round((new - old) / old * 100, 1)
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 10.0) -> List[Dict[str, Any]]:
+    """
+    Compare the benchmarks present in both results
+
+    :param baseline:
+        Earlier results, as written by benchmarks.run
+    :param current:
+        New results
+    :param threshold:
+        Percent drop in ops/s, or rise in p99, that counts as a regression
+
+    :return:
+        One dictionary per benchmark: name, old / new ops/s, throughput and p99 change (%), and regression flag
+    """
+    rows = []
+    for name, new in current['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        throughput = _change(old.get('ops_per_sec'), new.get('ops_per_sec'))
+        p99 = _change(old.get('p99_ms'), new.get('p99_ms'))
+        rows.append(
+            {
+                'name': name,
+                'old_ops_per_sec': old.get('ops_per_sec'),
+                'new_ops_per_sec': new.get('ops_per_sec'),
+                'throughput_change': throughput,
+                'p99_change': p99,
+                'regression': (throughput is not None and throughput < -threshold)
+                or (p99 is not None and p99 > threshold),
+            }
+        )
+    return rows
+
+
+def print_comparison(rows: List[Dict[str, Any]]) -> None:
+    """
+    Print a comparison table, marking regressions
+    """
+
+    def percent(value: Optional[float]) -> str:
+        return '-' if value is None else f'{value:+.1f}%'
+
+    print(f'{"benchmark":<18}{"old ops/s":>12}{"new ops/s":>12}{"ops/s":>10}{"p99":>10}')
+    for row in rows:
+        print(
+            f'{row["name"]:<18}{row["old_ops_per_sec"] or 0:>12.1f}{row["new_ops_per_sec"] or 0:>12.1f}'
+            f'{percent(row["throughput_change"]):>10}{percent(row["p99_change"]):>10}'
+            f'{"  REGRESSION" if row["regression"] else ""}'
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Compare two benchmark results files')
+    parser.add_argument('baseline', help='earlier results file')
+    parser.add_argument('current', help='new results file')
+    parser.add_argument('--threshold', type=float, default=10.0, help='percent change counted as a regression')
+    options = parser.parse_args(argv)
+
+    with open(options.baseline, encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)
+    with open(options.current, encoding='utf-8') as current_file:
+        current = json.load(current_file)
+    rows = compare(baseline, current, options.threshold)
+    print_comparison(rows)
+    return 1 if any(row['regression'] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
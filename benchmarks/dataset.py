@@ -0,0 +1,100 @@
+"""
+Deterministic synthetic task datasets for the benchmarks
+
+The same DatasetSpec (including the seed) always generates the same tasks, so results from different commits
+are measured against identical data.
+"""
+from array import array
+from typing import Any, Dict, Iterator, NamedTuple, Tuple
+from sqlalchemy.engine import Engine
+from task_tracker.transfer import ImportResult, import_rows
+import datetime as dt
+import random
+
+
+SIZES = {'1k': 1_000, '100k': 100_000, '1M': 1_000_000}
+STATUSES = ('to-do', 'in-progress', 'done')
+BASE_DATE = dt.datetime(2025, 1, 1)  # fixed, so the data doesn't depend on the day it's generated
+WORDS = (
+    'report', 'review', 'deploy', 'fix', 'update', 'plan', 'write', 'test', 'design', 'migrate',
+    'budget', 'meeting', 'invoice', 'release', 'refactor', 'audit', 'draft', 'sync', 'backup', 'research',
+)
+
+
+class DatasetSpec(NamedTuple):
+    """
+    Shape of a synthetic dataset
+    """
+
+    tasks: int = 1_000
+    tags: int = 50  # distinct tag names
+    max_tags_per_task: int = 3
+    link_density: float = 0.5  # average number of links per task
+    subtask_ratio: float = 0.4  # share of tasks that have a parent
+    max_depth: int = 5  # deepest subtask level
+    due_ratio: float = 0.6  # share of tasks with a due date
+    seed: int = 42
+
+
+def parse_size(size: str) -> int:
+    """
+    Number of tasks from a size name (1k, 100k, 1M) or a plain number
+    """
+    return SIZES[size] if size in SIZES else int(size)
+
+
+def generate_rows(spec: DatasetSpec) -> Iterator[Dict[str, Any]]:
+    """
+    Generate tasks in the export row format, ids 1..spec.tasks
+    Parents and links only point to earlier tasks, and one byte per task tracks its depth, so memory stays small
+
+    :param spec:
+        Dataset shape and seed
+    """
+    rng = random.Random(spec.seed)
+    tag_names = [f'tag{index}' for index in range(spec.tags)]
+    depth = array('B', [0]) * (spec.tasks + 1)  # task id -> subtask depth
+
+    for task_id in range(1, spec.tasks + 1):
+        parent_id = None
+        if task_id > 1 and rng.random() < spec.subtask_ratio:
+            candidate = rng.randint(max(1, task_id - 1000), task_id - 1)  # recent tasks, like real projects
+            if depth[candidate] < spec.max_depth:
+                parent_id = candidate
+                depth[task_id] = depth[candidate] + 1
+
+        links = []
+        if task_id > 1:
+            # whole links plus a chance of one more, averaging link_density
+            count = int(spec.link_density) + (rng.random() < spec.link_density % 1)
+            links = sorted({rng.randint(1, task_id - 1) for _ in range(count)})
+
+        due = None
+        if rng.random() < spec.due_ratio:
+            due = (BASE_DATE + dt.timedelta(days=rng.randint(-60, 120))).isoformat()
+
+        yield {
+            'id': task_id,
+            'title': ' '.join(rng.choice(WORDS) for _ in range(3)) + f' {task_id}',
+            'description': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(0, 12))) or None,
+            'status': rng.choice(STATUSES),
+            'dueDate': due,
+            'parent_id': parent_id,
+            'tags': rng.sample(tag_names, rng.randint(0, min(spec.max_tags_per_task, spec.tags))),
+            'links': links,
+        }
+
+
+def load_dataset(spec: DatasetSpec, bind: Engine, batch_size: int = 5_000) -> ImportResult:
+    """
+    Generate a dataset straight into a database, through the batched importer
+
+    :param spec:
+        Dataset shape and seed
+    :param bind:
+        SQLAlchemy engine of an initialised (empty) database
+    :param batch_size:
+        Number of tasks per transaction
+    """
+    numbered: Iterator[Tuple[int, Dict[str, Any]]] = enumerate(generate_rows(spec), start=1)
+    return import_rows(numbered, bind=bind, batch_size=batch_size)
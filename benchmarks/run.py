@@ -0,0 +1,294 @@
+"""
+Benchmark the core operations and CLI list rendering against a synthetic dataset
+
+    python -m benchmarks.run --size 100k
+    python -m benchmarks.run --size 1k --compare benchmarks/results/1k-abc1234.json
+
+Each benchmark runs an operation a number of times and reports ops/s, p50 / p99 latency and the peak RSS of the
+process so far. Results are written as JSON (by default to benchmarks/results/<size>-<commit>.json), and
+--compare checks them against an earlier run, see benchmarks.compare.
+"""
+from contextlib import redirect_stdout
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from benchmarks.compare import compare, print_comparison
+from benchmarks.dataset import DatasetSpec, load_dataset, parse_size
+from task_tracker.cli import DISPLAY_FIELDS, handle_list_command, persistent_session
+from task_tracker.config import PROFILES
+from task_tracker.core import add_task, delete_task, list_task_rows, list_tasks, update_task
+from task_tracker.models import Task, init_db, make_engine
+import argparse
+import datetime as dt
+import io
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource  # not on Windows
+except ImportError:  # pragma: no cover
+    resource = None
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+# MEASURING
+def peak_rss_mb() -> Optional[float]:
+    """
+    Peak resident memory of this process so far, in MB (None where the platform can't tell)
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)  # bytes on macOS, KB on Linux
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of sorted values
+    """
+    return values[min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))]
+
+
+def measure(operation: Callable[[int], Any], ops: int) -> Dict[str, Any]:
+    """
+    Time an operation ops times
+
+    :param operation:
+        Called with the run index, 0 to ops - 1
+    :param ops:
+        Number of runs
+
+    :return:
+        Dictionary of ops, total seconds, ops/s, p50 and p99 latency in ms, and peak RSS in MB
+    """
+    latencies = []
+    for index in range(ops):
+        start = time.perf_counter()
+        operation(index)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        'ops': ops,
+        'seconds': round(total, 4),
+        'ops_per_sec': round(ops / total, 2) if total else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def bytes_per_row(bind, fetch: Callable[[Session], List[Any]]) -> Optional[int]:
+    """
+    Memory still held per row after a fetch, objects plus any session bookkeeping for them (tracemalloc)
+
+    :param bind:
+        SQLAlchemy engine
+    :param fetch:
+        Called with a new session, returns the rows
+    """
+    with Session(bind) as db:
+        tracemalloc.start()
+        try:
+            rows = fetch(db)
+            retained, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return round(retained / len(rows)) if rows else None
+
+
+def git_commit() -> str:
+    """
+    Short hash of the checked out commit, or 'unknown' outside a git checkout
+    """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(__file__),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+# BENCHMARKS
+def run_benchmarks(bind, task_count: int, ops: int, list_ops: int, seed: int) -> Dict[str, Dict[str, Any]]:
+    """
+    Run every benchmark against a loaded database, in an order that leaves the dataset comparable for each one
+    (adds and updates first, deletes last)
+
+    :param bind:
+        SQLAlchemy engine of the loaded database
+    :param task_count:
+        Number of tasks loaded, ids 1..task_count
+    :param ops:
+        Runs of each add / update / delete benchmark
+    :param list_ops:
+        Runs of each list benchmark, which read many more rows
+    :param seed:
+        Seed for the ids picked to update and delete
+    """
+    rng = random.Random(seed)
+    results = {}
+
+    with Session(bind) as db:
+        results['add_task'] = measure(
+            lambda index: add_task(f'Benchmark task {index}', tags=['bench', f'tag{index % 50}'], db=db), ops
+        )
+        update_ids = [rng.randint(1, task_count) for _ in range(ops)]
+        results['update_task'] = measure(
+            lambda index: update_task(update_ids[index], status=('to-do', 'in-progress', 'done')[index % 3], db=db),
+            ops,
+        )
+
+    def list_with(**filters) -> Callable[[int], Any]:
+        def operation(index: int) -> None:
+            with Session(bind) as db:  # new session each run, so nothing is served from the identity map
+                list_tasks(db, load=DISPLAY_FIELDS, **filters)
+        return operation
+
+    def rows_with(**filters) -> Callable[[int], Any]:
+        def operation(index: int) -> None:
+            with Session(bind) as db:
+                list_task_rows(db, **filters)
+        return operation
+
+    # ORM objects with eager loaded relationships, against the read-only TaskRow projection
+    results['list_status'] = measure(list_with(status='in-progress'), list_ops)
+    results['list_rows_status'] = measure(rows_with(status='in-progress'), list_ops)
+    results['list_tag'] = measure(list_with(tags=['tag1']), list_ops)
+    results['list_rows_tag'] = measure(rows_with(tags=['tag1']), list_ops)
+    results['list_status_tag'] = measure(list_with(status='done', tags=['tag2']), list_ops)
+    results['list_rows_status_tag'] = measure(rows_with(status='done', tags=['tag2']), list_ops)
+    # top-N views, ORDER BY ... LIMIT read from an index - should cost the same at every dataset size
+    results['list_due_soon'] = measure(rows_with(status='to-do', sort='due', limit=20), list_ops)
+    results['list_recently_updated'] = measure(rows_with(sort='updated', desc=True, limit=20), list_ops)
+    results['list_status']['bytes_per_row'] = bytes_per_row(
+        bind, lambda db: list_tasks(db, status='in-progress', load=DISPLAY_FIELDS)
+    )
+    results['list_rows_status']['bytes_per_row'] = bytes_per_row(
+        bind, lambda db: list_task_rows(db, status='in-progress')
+    )
+
+    # CLI rendering, through the persistent session the REPL uses
+    with persistent_session(bind=bind):
+        def cli_list(index: int) -> None:
+            with redirect_stdout(io.StringIO()):
+                handle_list_command(['--status', 'to-do', '--limit', '1000'])
+        results['cli_list'] = measure(cli_list, list_ops)
+
+    with Session(bind) as db:
+        delete_ids = rng.sample(range(1, task_count + 1), min(ops, task_count))
+        results['delete_task'] = measure(lambda index: delete_task(delete_ids[index], db=db), len(delete_ids))
+
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Task Tracker benchmarks')
+    parser.add_argument('--size', default='1k', help='dataset size: 1k, 100k, 1M or a number of tasks (default 1k)')
+    parser.add_argument('--ops', type=int, default=200, help='runs of each add / update / delete benchmark')
+    parser.add_argument('--list-ops', type=int, default=10, help='runs of each list benchmark')
+    parser.add_argument('--seed', type=int, default=42, help='seed for the dataset and the ids picked')
+    parser.add_argument('--tags', type=int, default=50, help='distinct tag names in the dataset')
+    parser.add_argument('--link-density', type=float, default=0.5, help='average links per task')
+    parser.add_argument('--max-depth', type=int, default=5, help='deepest subtask level')
+    parser.add_argument('--engine-profile', default='default', choices=sorted(PROFILES), help='engine pragmas')
+    parser.add_argument('--db', help='database file to use (default: a temporary file, removed afterwards)')
+    parser.add_argument('--out', help='results file (default: benchmarks/results/<size>-<commit>.json)')
+    parser.add_argument('--compare', metavar='BASELINE', help='compare against an earlier results file')
+    parser.add_argument('--threshold', type=float, default=10.0, help='percent change counted as a regression')
+    options = parser.parse_args(argv)
+
+    spec = DatasetSpec(
+        tasks=parse_size(options.size),
+        tags=options.tags,
+        link_density=options.link_density,
+        max_depth=options.max_depth,
+        seed=options.seed,
+    )
+    workdir = None
+    db_path = options.db
+    if not db_path:
+        workdir = tempfile.TemporaryDirectory(prefix='task-tracker-bench-')
+        db_path = os.path.join(workdir.name, 'bench.db')
+
+    bind = make_engine(db_path, PROFILES[options.engine_profile])
+    try:
+        init_db(bind)
+        with Session(bind) as db:
+            existing = db.scalar(select(func.count(Task.id)))
+        results = {}
+        if existing:
+            print(f'Using the {existing} tasks already in {db_path}')
+        else:
+            print(f'Generating {spec.tasks} tasks...')
+            start = time.perf_counter()
+            loaded = load_dataset(spec, bind)
+            seconds = time.perf_counter() - start
+            results['load'] = {
+                'ops': loaded.imported,
+                'seconds': round(seconds, 4),
+                'ops_per_sec': round(loaded.imported / seconds, 2) if seconds else None,
+                'peak_rss_mb': peak_rss_mb(),
+            }
+        results.update(
+            run_benchmarks(bind, existing or spec.tasks, options.ops, options.list_ops, options.seed)
+        )
+    finally:
+        bind.dispose()
+        if workdir:
+            workdir.cleanup()
+
+    commit = git_commit()
+    report = {
+        'meta': {
+            'commit': commit,
+            'created': dt.datetime.now().isoformat(timespec='seconds'),
+            'size': options.size,
+            'dataset': spec._asdict(),
+            'engine_profile': options.engine_profile,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+
+    print(f'{"benchmark":<22}{"ops/s":>12}{"p50 ms":>10}{"p99 ms":>10}{"peak MB":>10}{"B/row":>8}')
+    for name, result in results.items():
+        print(
+            f'{name:<22}{result["ops_per_sec"] or 0:>12.1f}{result.get("p50_ms", 0):>10.2f}'
+            f'{result.get("p99_ms", 0):>10.2f}{result["peak_rss_mb"] or 0:>10.1f}{result.get("bytes_per_row") or "":>8}'
+        )
+
+    out = options.out or os.path.join(RESULTS_DIR, f'{options.size}-{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as results_file:
+        json.dump(report, results_file, indent=2)
+    print(f'Results written to {out}')
+
+    if options.compare:
+        with open(options.compare, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        rows = compare(baseline, report, options.threshold)
+        print_comparison(rows)
+        return 1 if any(row['regression'] for row in rows) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
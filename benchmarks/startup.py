@@ -0,0 +1,124 @@
+"""
+Benchmark CLI cold start: the wall time of one-shot invocations, each in a new Python process
+
+    python -m benchmarks.startup --runs 20 --budget-ms 400
+
+Scenarios:
+    import   - python -c "import task_tracker.cli", the floor every invocation pays
+    fresh    - main.py running one command against a new database file (schema created and stamped)
+    current  - main.py running one command against a database already at the current schema version
+
+The run fails (exit status 1) if the p50 of the 'current' scenario is over the budget.
+Results are written as JSON, like benchmarks.run.
+"""
+from typing import Any, Dict, List, Optional
+from benchmarks.run import RESULTS_DIR, git_commit, percentile
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_BUDGET_MS = 500.0
+COMMAND = 'list --limit 1'
+
+
+def time_process(args: List[str], env: Dict[str, str]) -> float:
+    """
+    Run a process to completion and return its wall time in seconds
+
+    :raises subprocess.CalledProcessError:
+        If the process fails
+    """
+    start = time.perf_counter()
+    subprocess.run(args, env=env, cwd=PROJECT_ROOT, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def summarise(samples: List[float]) -> Dict[str, Any]:
+    samples = sorted(samples)
+    return {
+        'runs': len(samples),
+        'min_ms': round(samples[0] * 1000, 2),
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 2),
+    }
+
+
+def run_startup(runs: int) -> Dict[str, Dict[str, Any]]:
+    """
+    Time each scenario runs times
+
+    :param runs:
+        Processes started per scenario
+    """
+    with tempfile.TemporaryDirectory(prefix='task-tracker-startup-') as workdir:
+        commands = os.path.join(workdir, 'commands.txt')
+        with open(commands, 'w', encoding='utf-8') as commands_file:
+            commands_file.write(COMMAND + '\n')
+        db_path = os.path.join(workdir, 'tasks.db')
+        env = dict(os.environ, TASK_TRACKER_DB=db_path, PYTHONPATH=PROJECT_ROOT)
+        cli = [sys.executable, os.path.join(PROJECT_ROOT, 'main.py'), '--batch', commands]
+
+        samples: Dict[str, List[float]] = {'import': [], 'fresh': [], 'current': []}
+        for _ in range(runs):
+            samples['import'].append(time_process([sys.executable, '-c', 'import task_tracker.cli'], env))
+            if os.path.exists(db_path):
+                os.remove(db_path)
+            samples['fresh'].append(time_process(cli, env))
+            samples['current'].append(time_process(cli, env))
+    return {name: summarise(values) for name, values in samples.items()}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Task Tracker CLI startup benchmark')
+    parser.add_argument('--runs', type=int, default=10, help='processes started per scenario (default 10)')
+    parser.add_argument(
+        '--budget-ms',
+        type=float,
+        default=DEFAULT_BUDGET_MS,
+        help=f'p50 budget for starting against a current database (default {DEFAULT_BUDGET_MS:.0f})',
+    )
+    parser.add_argument('--out', help='results file (default: benchmarks/results/startup-<commit>.json)')
+    options = parser.parse_args(argv)
+
+    results = run_startup(options.runs)
+    commit = git_commit()
+    report = {
+        'meta': {
+            'commit': commit,
+            'created': dt.datetime.now().isoformat(timespec='seconds'),
+            'command': COMMAND,
+            'budget_ms': options.budget_ms,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+
+    print(f'{"scenario":<10}{"min ms":>10}{"p50 ms":>10}{"p99 ms":>10}')
+    for name, result in results.items():
+        print(f'{name:<10}{result["min_ms"]:>10.1f}{result["p50_ms"]:>10.1f}{result["p99_ms"]:>10.1f}')
+
+    out = options.out or os.path.join(RESULTS_DIR, f'startup-{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as results_file:
+        json.dump(report, results_file, indent=2)
+    print(f'Results written to {out}')
+
+    within_budget = results['current']['p50_ms'] <= options.budget_ms
+    print(
+        f'Startup p50 {results["current"]["p50_ms"]:.1f} ms is '
+        f'{"within" if within_budget else "OVER"} the {options.budget_ms:.0f} ms budget'
+    )
+    return 0 if within_budget else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""
+Concurrent writers stress test: several processes write to one database file at the same time, half of them through
+the CLI batch runner and half like the API (a session per request), and every write is checked afterwards
+
+    python -m benchmarks.stress --writers 8 --writes 200 --hold-ms 5
+
+Each writer adds its tasks (tagged with its own tag) and after every add marks its open tasks done, a read followed
+by a write in one transaction, which is the pattern that fails with 'database is locked' without BEGIN IMMEDIATE.
+--hold-ms keeps each API-style transaction open between the read and the write, like a slow request.
+The run fails (exit status 1) if any write was lost or failed, or the maintained counts don't match the tasks.
+"""
+from typing import Any, Dict, List, Optional
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from task_tracker.config import PROFILES
+from task_tracker.core import add_task, bulk_update, list_task_rows, verify_stats
+from task_tracker.locking import LockWaitStats, lock_stats
+from task_tracker.models import Task, init_db, make_engine
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+MODES = ('cli', 'api')  # writers alternate between the two
+
+
+# WORKERS - each runs in its own process
+def run_cli_writer(bind, worker: int, writes: int, batch_size: int) -> int:
+    """
+    Write through the CLI batch runner, batch_size commands per transaction
+
+    :return:
+        Number of failed command lines
+    """
+    from task_tracker.cli import run_batch  # the CLI module is only needed by these writers
+    from contextlib import redirect_stdout
+    import io
+
+    lines = []
+    for index in range(writes):
+        lines.append(f'add w{worker}-{index} --tags w{worker}')
+        lines.append(f'update --where status=to-do --tags w{worker} --set status=done')
+    with redirect_stdout(io.StringIO()):
+        summary = run_batch(lines, batch_size=batch_size, bind=bind)
+    return len(summary.failed)
+
+
+def run_api_writer(bind, worker: int, writes: int, hold: float) -> int:
+    """
+    Write like the API, with a new session per request
+
+    :return:
+        Number of failed requests
+    """
+    failed = 0
+    for index in range(writes):
+        try:
+            with Session(bind) as db:
+                add_task(f'w{worker}-{index}', tags=[f'w{worker}'], db=db)
+            with Session(bind) as db:
+                open_tasks = list_task_rows(db, status='to-do', tags=[f'w{worker}'])
+                time.sleep(hold)  # a slow request, holding its transaction open
+                if open_tasks:
+                    bulk_update({'status': 'done'}, db, task_ids=[row.id for row in open_tasks])
+        except Exception as error:  # counted, the run reports it instead of stopping
+            print(f'worker {worker}: {error}', file=sys.stderr)
+            failed += 1
+    return failed
+
+
+def run_worker(options: argparse.Namespace) -> None:
+    """
+    Run one writer and print its result as a JSON line
+    """
+    bind = make_engine(options.db, PROFILES[options.engine_profile])
+    mode = MODES[options.worker % len(MODES)]
+    start = time.perf_counter()
+    if mode == 'cli':
+        failed = run_cli_writer(bind, options.worker, options.writes, options.batch_size)
+    else:
+        failed = run_api_writer(bind, options.worker, options.writes, options.hold_ms / 1000)
+    result = {'worker': options.worker, 'mode': mode, 'seconds': time.perf_counter() - start, 'failed': failed}
+    result.update(lock_stats(bind).snapshot()._asdict())
+    bind.dispose()
+    print(json.dumps(result))
+
+
+# COORDINATOR
+def run_stress(
+    db_path: str,
+    writers: int = 4,
+    writes: int = 50,
+    hold_ms: float = 0.0,
+    batch_size: int = 10,
+    engine_profile: str = 'default',
+) -> Dict[str, Any]:
+    """
+    Start the writers at the same time, wait for them, then check every write made it
+
+    :param db_path:
+        Database file, initialised here if needed
+    :param writers:
+        Number of writer processes
+    :param writes:
+        Tasks added by each writer
+    :param hold_ms:
+        How long API-style writers hold their transaction between reading and writing
+    :param batch_size:
+        Commands per transaction of the CLI writers
+    :param engine_profile:
+        Engine profile (pragmas) every process uses
+
+    :return:
+        Dictionary of expected and found tasks, lost writes, tasks left open, failed writes, count mismatches,
+        the summed lock waits of every writer and the per writer results
+    """
+    bind = make_engine(db_path, PROFILES[engine_profile])
+    init_db(bind)
+    bind.dispose()
+
+    env = dict(os.environ, PYTHONPATH=PROJECT_ROOT)
+    start = time.perf_counter()
+    processes = [
+        subprocess.Popen(
+            [
+                sys.executable, '-m', 'benchmarks.stress', '--worker', str(worker), '--db', db_path,
+                '--writes', str(writes), '--hold-ms', str(hold_ms), '--batch-size', str(batch_size),
+                '--engine-profile', engine_profile,
+            ],
+            cwd=PROJECT_ROOT,
+            env=env,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        for worker in range(writers)
+    ]
+    workers: List[Dict[str, Any]] = []
+    crashed = 0
+    for process in processes:
+        output, _ = process.communicate()
+        if process.returncode != 0 or not output.strip():
+            crashed += 1
+            continue
+        workers.append(json.loads(output.strip().splitlines()[-1]))
+    seconds = time.perf_counter() - start
+
+    bind = make_engine(db_path, PROFILES[engine_profile])
+    with Session(bind) as db:
+        found = db.scalar(select(func.count(Task.id)))
+        open_tasks = db.scalar(select(func.count(Task.id)).where(Task.status != 'done'))
+        mismatches = verify_stats(db)
+    bind.dispose()
+
+    expected = writers * writes
+    locks = {field: sum(worker[field] for worker in workers) for field in LockWaitStats._fields}
+    locks['max_wait_seconds'] = max((worker['max_wait_seconds'] for worker in workers), default=0.0)
+    return {
+        'writers': writers,
+        'seconds': round(seconds, 3),
+        'expected': expected,
+        'found': found,
+        'lost': expected - found,
+        'open': open_tasks,  # updates that didn't land
+        'failed': sum(worker['failed'] for worker in workers) + crashed,
+        'count_mismatches': len(mismatches),
+        'locks': locks,
+        'workers': workers,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Task Tracker concurrent writers stress test')
+    parser.add_argument('--writers', type=int, default=4, help='writer processes (default 4)')
+    parser.add_argument('--writes', type=int, default=100, help='tasks added by each writer (default 100)')
+    parser.add_argument('--hold-ms', type=float, default=0.0, help='API-style writers hold each transaction open')
+    parser.add_argument('--batch-size', type=int, default=10, help='commands per transaction of CLI-style writers')
+    parser.add_argument('--engine-profile', default='default', choices=sorted(PROFILES), help='engine pragmas')
+    parser.add_argument('--db', help='database file (default: a temporary file, removed afterwards)')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)  # set for the writer processes
+    options = parser.parse_args(argv)
+
+    if options.worker is not None:
+        run_worker(options)
+        return 0
+
+    with tempfile.TemporaryDirectory(prefix='task-tracker-stress-') as workdir:
+        result = run_stress(
+            options.db or os.path.join(workdir, 'stress.db'),
+            writers=options.writers,
+            writes=options.writes,
+            hold_ms=options.hold_ms,
+            batch_size=options.batch_size,
+            engine_profile=options.engine_profile,
+        )
+
+    locks = result['locks']
+    print(f'{result["writers"]} writers, {result["expected"]} tasks in {result["seconds"]:.2f} s')
+    print(
+        f'Lost writes: {result["lost"]}, updates not applied: {result["open"]}, failed writes: {result["failed"]}, '
+        f'count mismatches: {result["count_mismatches"]}'
+    )
+    print(
+        f'Lock waits: {locks["contended"]} of {locks["transactions"]} transactions waited, {locks["retries"]} retries, '
+        f'{locks["wait_seconds"]:.2f} s in total, {locks["max_wait_seconds"] * 1000:.1f} ms at most'
+    )
+    ok = not (result['lost'] or result['open'] or result['failed'] or result['count_mismatches'])
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,4 @@
 from task_tracker.cli import main
-from task_tracker.models import init_db
 
 if __name__ == '__main__':
-    init_db()
-    main()
+    main()  # creates / migrates the database if needed, after the arguments are parsed
@@ -1,7 +1,183 @@
-from flask import Flask, render_template
+from flask import Flask, Response, current_app, g, jsonify, render_template, request
+from werkzeug.http import is_resource_modified
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from task_tracker.cache import TaskCache
+from task_tracker.core import (
+    SORT_COLUMNS,
+    TaskRow,
+    add_tasks,
+    calendar_days,
+    delete_task,
+    edit_task,
+    get_stats,
+    get_task,
+    month_window,
+    tasks_version,
+    week_window,
+)
+from task_tracker.graph import DependencyGraph
+from task_tracker.locking import deferred, is_busy, lock_stats
+from task_tracker.models import Task, init_db, sessionLocal
+from typing import Any, Dict, List, Optional, Union
+import datetime as dt
+import hashlib
 
 app = Flask(__name__, template_folder='../templates', static_folder='../static')
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+READ_METHODS = ('GET', 'HEAD')
+BUSY_RETRY_AFTER = 1  # seconds, Retry-After of a 503 when the database stayed locked
+
+task_cache = TaskCache().attach()  # tasks and list pages served to GET requests, see task_tracker.cache
+dependency_graph = DependencyGraph().attach()  # served to GET /api/ready, see task_tracker.graph
+
+
+# DATABASE SESSION PER REQUEST
+def get_db() -> Session:
+    """
+    Get the database session for the current request, creating it on first use
+    The session factory can be swapped with app.config['SESSION_FACTORY'] (e.g. for tests)
+    Reads begin deferred, so they don't queue behind a writer (e.g. a CLI batch) for the write lock
+    """
+    if 'db' not in g:
+        factory = current_app.config.get('SESSION_FACTORY', sessionLocal)
+        if request.method in READ_METHODS:
+            g.db = factory(bind=deferred(factory.kw['bind']))
+        else:
+            g.db = factory()
+    return g.db
+
+
+@app.teardown_appcontext
+def close_db(exception: Optional[BaseException]) -> None:
+    """
+    Close the request's database session, if one was opened
+    """
+    db = g.pop('db', None)
+    if db is not None:
+        db.close()
+
+
+@app.errorhandler(OperationalError)
+def database_busy(exception: OperationalError):
+    """
+    503 with Retry-After when the database stayed locked by another writer, other database errors are re-raised
+    """
+    if not is_busy(exception):
+        raise exception
+    response = error('Database is busy, try again', 503)
+    response.headers['Retry-After'] = str(BUSY_RETRY_AFTER)
+    return response
+
+
+# HELPERS
+def task_to_dict(task: Union[Task, TaskRow]) -> Dict[str, Any]:
+    """
+    Serialise a task for JSON responses
+
+    :param task:
+        Task object, or TaskRow projection, to serialise
+    """
+    return {
+        'id': task.id,
+        'title': task.title,
+        'description': task.description,
+        'status': task.status,
+        'dueDate': task.dueDate.isoformat() if task.dueDate else None,
+        'createdAt': task.createdAt.isoformat(),
+        'updatedAt': task.updatedAt.isoformat(),
+        'parent_id': task.parent_id,
+        'tags': task.tag_names,
+        'links': task.link_ids,
+    }
+
+
+def error(message: str, status: int) -> Response:
+    """
+    JSON error response
+    """
+    response = jsonify({'error': message})
+    response.status_code = status
+    return response
+
+
+def json_object() -> Dict[str, Any]:
+    """
+    Decoded JSON body of the request, an empty body counts as {}
+
+    :raises ValueError:
+        If the body is not a JSON object
+    """
+    data = request.get_json(force=True, silent=True) if request.data else {}
+    if not isinstance(data, dict):
+        raise ValueError('Request body must be a JSON object')
+    return data
+
+
+def _check_list(data: Dict[str, Any], key: str, item_type: type) -> None:
+    """
+    Raise ValueError unless data[key] is missing, null or a list of item_type
+    """
+    value = data.get(key)
+    if value is not None and (
+        not isinstance(value, list)
+        or not all(isinstance(item, item_type) and not isinstance(item, bool) for item in value)
+    ):
+        raise ValueError(f'{key} must be a list of {"strings" if item_type is str else "task IDs"}')
+
+
+def parse_task_fields(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert a JSON request body into core function arguments, dates are YYYY-MM-DD like the CLI
+
+    :param data:
+        Decoded JSON body
+
+    :raises ValueError:
+        If a field has the wrong type (e.g. a title that isn't a string), or the due date is not in YYYY-MM-DD format
+    """
+    for key in ('title', 'description', 'status'):
+        if data.get(key) is not None and not isinstance(data[key], str):
+            raise ValueError(f'{key} must be a string')
+    parent = data.get('parent')
+    if parent is not None and (not isinstance(parent, int) or isinstance(parent, bool)):
+        raise ValueError('parent must be a task ID')
+    for key in ('tags', 'delete_tags'):
+        _check_list(data, key, str)
+    for key in ('links', 'delete_links', 'ids'):
+        _check_list(data, key, int)
+    fields = {
+        key: data[key]
+        for key in ('title', 'description', 'status', 'tags', 'parent', 'links')
+        if key in data
+    }
+    if data.get('dueDate'):
+        try:
+            fields['dueDate'] = dt.datetime.strptime(data['dueDate'], '%Y-%m-%d')
+        except (TypeError, ValueError):
+            raise ValueError('dueDate must be in YYYY-MM-DD format')
+    return fields
+
+
+def list_filters() -> Dict[str, Any]:
+    """
+    Read the status and tag filters from the query string, tags are comma separated:
+    ?tags= (or ?tags_any=) any of the tags, ?tags_all= every one of them, ?tags_none= none of them
+    """
+
+    def tag_list(*names: str) -> Optional[List[str]]:
+        tags = [tag for name in names for tag in request.args.get(name, '').split(',') if tag.strip()]
+        return tags or None
+
+    return {
+        'status': request.args.get('status') or None,
+        'tags': tag_list('tags', 'tags_any'),
+        'tags_all': tag_list('tags_all'),
+        'tags_none': tag_list('tags_none'),
+    }
+
 
 # Main route
 @app.route('/')
@@ -32,8 +208,241 @@ def tasks_page():
     return render_template('tasks.html')
 
 
+# JSON API
+@app.route('/api/tasks', methods=['GET'])
+def api_list_tasks():
+    """
+    List tasks, filtered by ?status= and ?tags=a,b (also ?tags_all=, ?tags_none=), paginated with ?limit= and the ?after= cursor
+    Sorted by id, or by ?sort=due|created|updated|title (?desc=1 for the highest first, tasks without a due date last)
+    The ETag / Last-Modified headers come from the filtered set's count, latest updatedAt and highest id,
+    so a polling client gets a 304 (without the tasks being loaded) until something changes
+    Pages (and single tasks) come from task_cache while nothing has written to the tasks since they were read
+    """
+    db = get_db()
+    filters = list_filters()
+    try:
+        limit = min(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        after = int(request.args['after']) if request.args.get('after') else None
+    except ValueError:
+        return error('limit and after must be numbers', 400)
+    if limit < 1:
+        return error('limit must be at least 1', 400)
+    sort = request.args.get('sort') or 'id'
+    if sort not in SORT_COLUMNS:
+        return error(f'sort must be one of {", ".join(SORT_COLUMNS)}', 400)
+    desc = request.args.get('desc') in ('1', 'true')
+
+    count, last_updated, max_id = tasks_version(db, **filters)
+    etag = hashlib.sha1(
+        f'{count}:{last_updated}:{max_id}:{request.query_string.decode()}'.encode()
+    ).hexdigest()
+    last_modified = last_updated.replace(microsecond=0) if last_updated else None
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = Response(status=304)
+    else:
+        # fetch one extra task to know whether there is another page
+        tasks = task_cache.list_task_rows(db, sort=sort, desc=desc, after=after, limit=limit + 1, **filters)
+        next_cursor = tasks[limit - 1].id if len(tasks) > limit else None
+        response = jsonify(
+            {'tasks': [task_to_dict(task) for task in tasks[:limit]], 'next': next_cursor}
+        )
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    return response
+
+
+@app.route('/api/tasks', methods=['POST'])
+def api_add_task():
+    """
+    Add a task from a JSON body: title, and optional description, dueDate, tags, parent, links
+    """
+    db = get_db()
+    try:
+        fields = parse_task_fields(json_object())
+    except ValueError as e:
+        return error(str(e), 400)
+    fields.pop('status', None)  # new tasks always start as to-do
+
+    result = add_tasks([fields], db=db)
+    if result.failed:
+        return error(result.failed[0][1], 400)
+    response = jsonify(task_to_dict(get_task(result.added[0], db)))
+    response.status_code = 201
+    return response
+
+
+@app.route('/api/tasks/<int:task_id>', methods=['GET'])
+def api_get_task(task_id: int):
+    task = task_cache.get_task_row(task_id, get_db())
+    if not task:
+        return error(f'Task {task_id} not found', 404)
+    return jsonify(task_to_dict(task))
+
+
+@app.route('/api/tasks/<int:task_id>', methods=['PATCH'])
+def api_update_task(task_id: int):
+    """
+    Update a task from a JSON body, with the same fields as edit_task (plus delete_tags, delete_links)
+    """
+    db = get_db()
+    try:
+        data = json_object()
+        fields = parse_task_fields(data)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    result = edit_task(
+        task_id,
+        delete_tags=data.get('delete_tags'),
+        delete_links=data.get('delete_links'),
+        db=db,
+        **fields,
+    )
+    if not result.found:
+        return error(result.error, 404)
+    if not result.ok:
+        return error(result.error, 400)
+    return jsonify(task_to_dict(get_task(task_id, db)))
+
+
+@app.route('/api/tasks/<int:task_id>', methods=['DELETE'])
+def api_delete_task(task_id: int):
+    db = get_db()
+    if not get_task(task_id, db):
+        return error(f'Task {task_id} not found', 404)
+    delete_task(task_id, db=db, subtree=request.args.get('subtree') in ('1', 'true'))  # ?subtree=1 also deletes subtasks
+    return Response(status=204)
+
+
+@app.route('/api/tasks/<int:task_id>/subtasks', methods=['GET'])
+def api_list_subtasks(task_id: int):
+    task = get_task(task_id, get_db())
+    if not task:
+        return error(f'Task {task_id} not found', 404)
+    return jsonify({'tasks': [task_to_dict(subtask) for subtask in task.subtasks]})
+
+
+@app.route('/api/tasks/<int:task_id>/links', methods=['GET'])
+def api_list_links(task_id: int):
+    """
+    Tasks this task links to, and tasks linking to it
+    """
+    task = get_task(task_id, get_db())
+    if not task:
+        return error(f'Task {task_id} not found', 404)
+    return jsonify(
+        {
+            'links': [task_to_dict(link) for link in task.links],
+            'linked_from': [task_to_dict(link) for link in task._links_reverse],
+        }
+    )
+
+
+@app.route('/api/tasks/<int:task_id>/links', methods=['POST'])
+def api_add_links(task_id: int):
+    """
+    Link tasks, from a JSON body {"ids": [...]}
+    """
+    db = get_db()
+    try:
+        data = json_object()
+        parse_task_fields(data)
+    except ValueError as e:
+        return error(str(e), 400)
+    result = edit_task(task_id, links=data.get('ids') or [], db=db)
+    if not result.ok:
+        return error(result.error, 404 if not result.found else 400)
+    return jsonify(task_to_dict(get_task(task_id, db)))
+
+
+@app.route('/api/tasks/<int:task_id>/links/<int:link_id>', methods=['DELETE'])
+def api_delete_link(task_id: int, link_id: int):
+    db = get_db()
+    result = edit_task(task_id, delete_links=[link_id], db=db)
+    if not result.ok:
+        return error(result.error, 404 if not result.found else 400)
+    return Response(status=204)
+
+
+@app.route('/api/calendar', methods=['GET'])
+def api_calendar():
+    """
+    Tasks due per day, for a month (?year=&month=, default this month) or a week (?week=YYYY-MM-DD, any day in it)
+    The response has the query strings of the previous and next windows for navigation
+    """
+    try:
+        if request.args.get('week'):
+            day = dt.date.fromisoformat(request.args['week'])
+            start, end = week_window(day)
+            previous = {'week': (start - dt.timedelta(days=7)).isoformat()}
+            following = {'week': end.isoformat()}
+        else:
+            today = dt.date.today()
+            year = int(request.args.get('year', today.year))
+            month = int(request.args.get('month', today.month))
+            start, end = month_window(year, month)
+            before = start - dt.timedelta(days=1)
+            previous = {'year': before.year, 'month': before.month}
+            following = {'year': end.year, 'month': end.month}
+    except ValueError:
+        return error('expected ?year=&month= or ?week=YYYY-MM-DD', 400)
+
+    return jsonify(
+        {
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'days': calendar_days(start, end, get_db()),
+            'previous': previous,
+            'next': following,
+        }
+    )
+
+
+@app.route('/api/stats', methods=['GET'])
+def api_stats():
+    """
+    Task counts per status, per tag, and overdue / due today / upcoming
+    """
+    return jsonify(get_stats(get_db()))
+
+
+@app.route('/api/ready', methods=['GET'])
+def api_ready():
+    """
+    Tasks that can be started now (every task they link to is done), and groups of tasks linking to each other in a
+    cycle, from the process's dependency graph instead of a scan of the links
+    """
+    db = get_db()
+    graph = dependency_graph.sync(db)
+    ready = graph.ready()
+    titles = dict(db.query(Task.id, Task.title).filter(Task.id.in_(ready)).all()) if ready else {}
+    return jsonify(
+        {
+            'tasks': [{'id': task_id, 'title': titles[task_id]} for task_id in ready if task_id in titles],
+            'cycles': graph.cycles(),
+        }
+    )
+
+
+@app.route('/api/locks', methods=['GET'])
+def api_locks():
+    """
+    Time this server's transactions have waited for the database write lock, see task_tracker.locking
+    """
+    return jsonify(lock_stats(get_db().get_bind()).snapshot()._asdict())
+
+
+@app.route('/api/cache', methods=['GET'])
+def api_cache():
+    """
+    Hits, misses and size of the read cache in front of GET /api/tasks and /api/tasks/<id>, see task_tracker.cache
+    """
+    return jsonify(task_cache.stats()._asdict())
+
+
 if __name__ == '__main__':
     """
     Run the Flask app
     """
+    init_db()
     app.run(debug=True, port=5500)
@@ -0,0 +1,278 @@
+"""
+In-process read cache of TaskRow projections, for views that read the same tasks over and over (API, REPL list)
+
+Single tasks and list pages are kept in two bounded LRUs. Writes made through core (add_task, update_task, bulk_update,
+delete_task, imports, ...) reach the cache as change notifications and drop exactly what they made stale: the task
+itself, the cached rows showing it as their parent or among their links, and the list pages (whose membership and
+order may have changed).
+
+Writes made elsewhere are caught with PRAGMA data_version, read once per lookup on the connection doing the read. Its
+value only changes when another connection commits to the database file, so the cache is cleared whenever it changed
+since that connection last looked. That includes the other pooled connections of this process, whose writes were
+already notified, so the clear can be more than needed but is never less.
+"""
+from collections import OrderedDict, defaultdict
+from itertools import islice
+from typing import Any, Dict, Hashable, List, NamedTuple, Optional, Set
+from sqlalchemy.orm import Session
+from task_tracker.core import (
+    STREAM_CHUNK_SIZE,
+    TaskRow,
+    add_listener,
+    get_task_row,
+    iter_task_rows,
+    remove_listener,
+)
+import threading
+import weakref
+
+
+DEFAULT_MAX_TASKS = 1000  # single tasks kept
+DEFAULT_MAX_LISTS = 32  # list pages kept
+VERSIONS_KEY = 'task_cache_data_version'  # connection info entry, cache -> data_version it last saw there
+
+
+class CacheStats(NamedTuple):
+    """
+    Counters of a TaskCache since it was created
+    """
+
+    hits: int
+    misses: int
+    evictions: int  # entries dropped to stay within the size bounds
+    invalidations: int  # change notifications from core
+    clears: int  # whole cache dropped, after another connection wrote or a rollback (or a new connection / database)
+    tasks: int  # single tasks cached now
+    lists: int  # list pages cached now
+
+
+class TaskCache:
+    """
+    Bounded LRU cache of tasks and list pages, in front of core.get_task_row / iter_task_rows
+    Thread safe, as the API serves requests from threads
+    """
+
+    def __init__(self, max_tasks: int = DEFAULT_MAX_TASKS, max_lists: int = DEFAULT_MAX_LISTS):
+        """
+        :param max_tasks:
+            Number of single tasks kept
+        :param max_lists:
+            Number of list pages kept
+        """
+        self.max_tasks = max_tasks
+        self.max_lists = max_lists
+        self._tasks: 'OrderedDict[int, TaskRow]' = OrderedDict()  # least recently used first
+        self._lists: 'OrderedDict[Hashable, List[TaskRow]]' = OrderedDict()
+        self._shown_in: Dict[int, Set[int]] = defaultdict(set)  # task id -> cached tasks showing it as parent or link
+        self._lock = threading.Lock()
+        self._generation = 0  # bumped by every invalidation, a read that raced with one isn't stored
+        self._pool = None  # weak reference to the pool (database) the cached rows came from
+        self._hits = self._misses = self._evictions = self._invalidations = self._clears = 0
+
+    # INVALIDATION
+    def attach(self) -> 'TaskCache':
+        """
+        Drop stale entries on changes committed through core
+        """
+        add_listener(self.on_change)
+        return self
+
+    def detach(self) -> None:
+        """
+        Stop following core changes
+        """
+        remove_listener(self.on_change)
+
+    def on_change(self, event: str, task_id: int, details: Dict[str, Any]) -> None:
+        """
+        Core change listener, see core.add_listener
+        A new task isn't in any cached row yet, a changed or deleted one can be a cached row's parent or link
+        """
+        if event == 'reset':
+            self.clear()
+            return
+        with self._lock:
+            self._generation += 1
+            self._invalidations += 1
+            self._forget(task_id)
+            if event != 'added':
+                for other_id in list(self._shown_in.get(task_id, ())):
+                    self._forget(other_id)
+            self._lists.clear()
+
+    def clear(self) -> None:
+        """
+        Drop everything cached
+        """
+        with self._lock:
+            self._clear()
+
+    def _clear(self) -> None:
+        self._generation += 1
+        self._clears += 1
+        self._tasks.clear()
+        self._lists.clear()
+        self._shown_in.clear()
+
+    def _forget(self, task_id: int) -> None:
+        """
+        Drop one cached task and its entries in the parent / link index
+        """
+        row = self._tasks.pop(task_id, None)
+        if row is None:
+            return
+        for shown_id in self._shown(row):
+            shown_in = self._shown_in.get(shown_id)
+            if shown_in is not None:
+                shown_in.discard(task_id)
+                if not shown_in:
+                    del self._shown_in[shown_id]
+
+    @staticmethod
+    def _shown(row: TaskRow) -> List[int]:
+        """
+        IDs of the other tasks whose titles a row shows
+        """
+        return ([row.parent_id] if row.parent_id is not None else []) + row.link_ids
+
+    def _validate(self, db: Session) -> int:
+        """
+        Clear the cache if the database was written by another connection since this one last read it
+        (or if the connection or database is new to the cache)
+
+        :return:
+            Generation to store the following read under
+        """
+        conn = db.connection()
+        version = conn.exec_driver_sql('PRAGMA data_version').scalar()
+        versions = conn.info.setdefault(VERSIONS_KEY, weakref.WeakKeyDictionary())  # lives as long as the connection
+        pool = conn.engine.pool
+        with self._lock:
+            if self._pool is None or self._pool() is not pool:
+                self._pool = weakref.ref(pool)
+                self._clear()
+            elif versions.get(self) != version:
+                self._clear()
+            versions[self] = version
+            return self._generation
+
+    # LOOKUPS
+    def get_task_row(self, task_id: int, db: Session) -> Optional[TaskRow]:
+        """
+        Retrieve a task by its ID as a TaskRow, from the cache or else the database
+
+        :param task_id:
+            ID of task to get
+        :param db:
+            SQLAlchemy database session
+        """
+        generation = self._validate(db)
+        with self._lock:
+            row = self._tasks.get(task_id)
+            if row is not None:
+                self._tasks.move_to_end(task_id)
+                self._hits += 1
+                return row
+            self._misses += 1
+
+        row = get_task_row(task_id, db)
+        if row is not None:
+            with self._lock:
+                if generation == self._generation:
+                    self._forget(task_id)
+                    self._tasks[task_id] = row
+                    for shown_id in self._shown(row):
+                        self._shown_in[shown_id].add(task_id)
+                    while len(self._tasks) > self.max_tasks:
+                        self._forget(next(iter(self._tasks)))
+                        self._evictions += 1
+        return row
+
+    def list_task_rows(
+        self,
+        db: Session,
+        status: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        tags_all: Optional[List[str]] = None,
+        tags_none: Optional[List[str]] = None,
+        sort: str = 'id',
+        desc: bool = False,
+        after: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[TaskRow]:
+        """
+        One page of tasks, like core.iter_task_rows, from the cache or else the database
+
+        :param status:
+            The status of the tasks to be listed (optional)
+        :param tags:
+            Only list tasks with any of these tags (optional)
+        :param tags_all:
+            Only list tasks with every one of these tags (optional)
+        :param tags_none:
+            Leave out tasks with any of these tags (optional)
+        :param sort:
+            Sort key, one of core.SORT_COLUMNS
+        :param desc:
+            Sort from the highest value down
+        :param after:
+            ID of the last task already seen, the page starts after it (optional)
+        :param limit:
+            Most tasks in the page (optional, every matching task if not set)
+        :param db:
+            SQLAlchemy database session
+        """
+        key = (
+            status,
+            tuple(sorted(set(tags or ()))),
+            tuple(sorted(set(tags_all or ()))),
+            tuple(sorted(set(tags_none or ()))),
+            sort,
+            desc,
+            after,
+            limit,
+        )
+        generation = self._validate(db)
+        with self._lock:
+            rows = self._lists.get(key)
+            if rows is not None:
+                self._lists.move_to_end(key)
+                self._hits += 1
+                return list(rows)
+            self._misses += 1
+
+        rows = list(
+            islice(
+                iter_task_rows(
+                    db,
+                    status=status,
+                    tags=tags,
+                    tags_all=tags_all,
+                    tags_none=tags_none,
+                    sort=sort,
+                    desc=desc,
+                    after=after,
+                    chunk_size=limit or STREAM_CHUNK_SIZE,
+                ),
+                limit,
+            )
+        )
+        with self._lock:
+            if generation == self._generation:
+                self._lists[key] = rows
+                while len(self._lists) > self.max_lists:
+                    self._lists.popitem(last=False)
+                    self._evictions += 1
+        return list(rows)
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                invalidations=self._invalidations,
+                clears=self._clears,
+                tasks=len(self._tasks),
+                lists=len(self._lists),
+            )
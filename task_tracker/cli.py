@@ -1,17 +1,39 @@
-from typing import List, Iterator, Dict, Optional, Callable
+from typing import Any, Iterable, List, Iterator, Dict, NamedTuple, Optional, Callable, Tuple, Union
 from task_tracker.core import (
-    add_task,
+    add_tasks,
     delete_task,
-    update_task,
-    list_tasks,
+    delete_tasks,
+    edit_task,
+    get_task,
+    bulk_update,
+    iter_task_rows,
+    get_subtree,
+    subtree_rollup,
+    search_tasks,
+    get_stats,
+    rebuild_stats,
+    verify_stats,
+    get_events,
     get_db,  # generator function to get db session
+    add_listener,
+    remove_listener,
+    notify_rollback,
+    SORT_COLUMNS,
+    TaskRow,
 )
-from task_tracker.models import Task
+from task_tracker.cache import TaskCache
+from task_tracker.graph import DependencyGraph
+from task_tracker.locking import lock_stats
+from task_tracker.models import Task, engine, init_db
 from contextlib import (
     contextmanager,
 )  # manages resources like a database session using a with statement, that allows commits, rollbacks, and closed sessions without manual management
+import argparse
 import datetime as dt
+import sys
+import time
 import shlex  # lexical analysis for parsing command line inputs by tokenising inputs (splits based on space, unless its a quote)
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
 from functools import wraps  # wraps decorator for preserving function metadata
 
@@ -27,28 +49,202 @@ def help():
     print(
         '  update <task_id> [--title <title>] [--description <description>] [--status <status>] [--due-date <YYYY-MM-DD>] [--tags <tags>] [--delete-tags <tags>] - Update a task'
     )
-    print('  delete <task_id> - Delete a task')
-    print('  mark-in-progress <task_id> - Mark a task as in progress')
-    print('  mark-done <task_id> - Mark a task as done')
-    print('  mark-todo <task_id> - Mark a task as to-do')
-    print('  list [status] - List all tasks or tasks with the given status')
+    print(
+        '  update [<ids, e.g. 1-50,73>] [--where status=<status>] [--tags|--tags-all|--tags-none <tags>] --set <field>=<value> ... - Update many tasks at once (title, description, status, due-date)'
+    )
+    print('  delete <task_id> [--subtree] - Delete a task, with --subtree also its subtasks (otherwise they become top-level)')
+    print(
+        '  delete [<ids, e.g. 1-50,73>] [--where status=<status>] [--tags|--tags-all|--tags-none <tags>] [--subtree] - Delete many tasks at once'
+    )
+    print('  mark-in-progress <task_id|ids> - Mark a task, or a list like 1-50,73, as in progress')
+    print('  mark-done <task_id|ids> - Mark a task, or a list like 1-50,73, as done')
+    print('  mark-todo <task_id|ids> - Mark a task, or a list like 1-50,73, as to-do')
+    print(
+        '  list [--status <status>] [--tags-any|--tags <tags>] [--tags-all <tags>] [--tags-none <tags>] [--sort due|created|updated|title] [--desc] [--limit <n>] [--after <task_id>] - List all tasks or tasks with the given status / tags, e.g. the next 20 due with --sort due --limit 20'
+    )
+    print('  tree <task_id> [--status <status>] [--depth <n>] - Show a task with all its subtasks and progress')
+    print('  search <words> [--limit <n>] - Search task titles and descriptions')
+    print('  history <task_id> - Show the changes made to a task')
+    print(
+        '  stats [rebuild|verify|locks|cache] - Show task counts per status, tag and due date, rebuild / check them, or show lock waits / list cache hits'
+    )
+    print('  ready - List tasks that can be started now (every linked task is done)')
+    print('  export <path> [--format jsonl|csv] - Write every task, with its tags, links and parent, to a file')
+    print('  import <path> [--format jsonl|csv] - Add the tasks from an exported file, giving them new ids')
+    print('  profile on|off [--json <path>] - Show the SQL run by each command, optionally logged as JSON lines')
     print('  exit - Exit the task tracker\n')
 
 
+# ERRORS
+class CommandError(Exception):
+    """
+    Raised by a command handler when the command fails, with the message to show
+    The command's changes are rolled back, and in batch mode its line is counted as failed
+    """
+
+
+# PERSISTENT SESSION
+class PersistentSession:
+    """
+    One connection and one session kept open across commands, so the identity map stays warm between them
+    Each command runs in a SAVEPOINT inside a transaction on that connection - the commits in core only release
+    savepoints, and the transaction itself is committed every batch_size commands.
+    When another process has written to the database (PRAGMA data_version changed), cached objects are expired.
+    Pages of the list command are kept in a TaskCache, invalidated the same way, and the ready command reads an
+    attached DependencyGraph. Both follow core's change notifications, sent as soon as core's commit releases its
+    savepoint; if the command or the batch is rolled back after that, they are reset (see core.notify_rollback).
+    A transaction started by a read-only command begins deferred, so it doesn't hold the write lock while it reads;
+    it's committed before the next writing command, which starts one that takes the lock up front.
+    """
+
+    def __init__(self, bind: Engine = engine, batch_size: int = 1):
+        """
+        :param bind:
+            SQLAlchemy engine to connect with
+        :param batch_size:
+            Number of commands per transaction (1 = commit after every command)
+        """
+        self.connection = bind.connect()
+        self.session = Session(
+            bind=self.connection,
+            autoflush=False,
+            expire_on_commit=False,  # keep loaded objects between commands
+            join_transaction_mode='create_savepoint',  # session commits/rollbacks only touch its savepoint
+        )
+        self.batch_size = batch_size
+        self.pending = 0  # commands run since the last commit
+        self.data_version = None
+        self.begin_mode = self.connection.get_execution_options().get('begin_mode')  # of writing transactions
+        self.read_only = False  # the open transaction began deferred, for read-only commands
+        self.cache = TaskCache().attach()  # list pages, see handle_list_command
+        self.graph = DependencyGraph().attach()  # loaded on first use, see handle_ready_command
+        self.changes = 0  # core change notifications seen, to tell whether a rolled back command had sent any
+        add_listener(self._count_change)
+
+    def _count_change(self, event: str, task_id: Optional[int], details: Dict[str, Any]) -> None:
+        self.changes += 1
+
+    def _begin(self, read_only: bool = False) -> None:
+        """
+        Start the transaction for the next batch, expiring cached objects if another connection has committed
+
+        :param read_only:
+            Begin deferred, without the write lock
+        """
+        self.connection.execution_options(begin_mode='DEFERRED' if read_only else self.begin_mode)
+        self.connection.begin()
+        self.read_only = read_only
+        data_version = self.connection.exec_driver_sql('PRAGMA data_version').scalar()
+        if self.data_version is not None and data_version != self.data_version:
+            self.session.expire_all()  # another process wrote, reload objects on next access
+        self.data_version = data_version
+
+    @contextmanager
+    def command_scope(self, read_only: bool = False) -> Iterator[Session]:
+        """
+        Transactional scope for one command, inside a SAVEPOINT so a failed command only undoes itself
+
+        :param read_only:
+            The command only reads, a transaction it starts begins deferred
+
+        :yield db:
+            The persistent SQLAlchemy session
+        """
+        if self.read_only and not read_only and self.connection.in_transaction():
+            self.commit()  # only reads so far, start over with the write lock
+        if not self.connection.in_transaction():
+            self._begin(read_only)
+        savepoint = self.connection.begin_nested()
+        changes = self.changes
+        try:
+            yield self.session
+            self.session.commit()  # flush, and release the session's own savepoint
+            savepoint.commit()
+        except Exception:
+            self.session.rollback()
+            if savepoint.is_active:
+                savepoint.rollback()
+            if self.changes != changes:
+                notify_rollback()  # the command's changes were notified when core committed
+            raise
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.commit()
+
+    def commit(self) -> None:
+        """
+        Commit the current batch of commands
+        """
+        if self.connection.in_transaction():
+            try:
+                self.connection.commit()
+            except Exception:
+                notify_rollback()  # the cache and graph may hold rows / changes of the writes that were rolled back
+                raise
+        self.pending = 0
+
+    def close(self) -> None:
+        """
+        Commit anything pending, and release the session and connection
+        """
+        try:
+            self.commit()
+        finally:
+            remove_listener(self._count_change)
+            self.cache.detach()
+            self.graph.detach()
+            self.session.close()
+            self.connection.close()
+
+
+_persistent_session: Optional[PersistentSession] = None  # set while a REPL / batch run is active
+
+
+@contextmanager
+def persistent_session(bind: Engine = engine, batch_size: int = 1) -> Iterator[PersistentSession]:
+    """
+    Route every command handler through one PersistentSession until the with block ends
+
+    :param bind:
+        SQLAlchemy engine to connect with
+    :param batch_size:
+        Number of commands per transaction
+    """
+    global _persistent_session
+    previous = _persistent_session
+    _persistent_session = PersistentSession(bind=bind, batch_size=batch_size)
+    try:
+        yield _persistent_session
+    finally:
+        try:
+            _persistent_session.close()
+        finally:
+            _persistent_session = previous
+
+
 # CONTEXT MANAGER FOR DATABASE SESSIONS
 @contextmanager  # generator -> context manager
-def session_scope() -> Iterator[Session]:
+def session_scope(read_only: bool = False) -> Iterator[Session]:
     """
     Transactional scope around db operations (ACID transactions)
     Ensures session is closed and transactions are comitted or rolled back, which is why we want a generator function
+    Inside a persistent_session block the shared session is used instead, with one savepoint per command
+
+    :param read_only:
+        Only reads are made, so the transaction begins deferred and writers aren't locked out while it runs
 
     :yield db:
         Iterator[Session]: An iterator that should havbe the SQLAlchemy database session
     """
+    if _persistent_session is not None:
+        with _persistent_session.command_scope(read_only=read_only) as db:
+            yield db
+        return
+
     db = None
     try:
         # get first database session, yield to caller, and commit once session is ended
-        db = next(get_db())
+        db = next(get_db(read_only=read_only))
         yield db
         db.commit()
     except Exception:
@@ -59,15 +255,18 @@ def session_scope() -> Iterator[Session]:
 
 
 # DECORATORS
-def with_db_session(func: Callable) -> Callable:
+def with_db_session(func: Optional[Callable] = None, read_only: bool = False) -> Callable:
     """
     Decorator to wrap a command handler in session scope, passing db session
+    Handlers that only read use @with_db_session(read_only=True), so they don't take the write lock
     """
+    if func is None:
+        return lambda func: with_db_session(func, read_only=read_only)
 
     @wraps(func)
     def wrapper(*args, **kwargs):
         with (
-            session_scope() as db
+            session_scope(read_only=read_only) as db
         ):  # use session_scope context manager to get db session
             return func(
                 *args, db=db, **kwargs
@@ -84,26 +283,28 @@ def with_task_id(func: Callable) -> Callable:
     @wraps(func)
     def wrapper(args: List[str], *f_args, **kwargs):
         if not args:  # check if arguments are provided.
-            print('Error: Requires a task ID')
-            return
+            raise CommandError('Error: Requires a task ID')
         try:
             task_id = int(args[0])  # convert first arg to a integer
-            return func(
-                task_id, args[1:], *f_args, **kwargs
-            )  # call decorated function w/ database session and args
         except ValueError:
-            print('Invalid task ID. Enter a number')
+            raise CommandError('Invalid task ID. Enter a number')
+        return func(
+            task_id, args[1:], *f_args, **kwargs
+        )  # call decorated function w/ database session and args
 
     return wrapper
 
 
 # HELPER FUNCTIONS
-def display_task(task: Task) -> None:
+DISPLAY_FIELDS = ('tags', 'links', 'parent')  # relationships read by display_task, to eager load Task objects
+
+
+def display_task(task: Union[Task, TaskRow]) -> None:
     """
     Display details of a single task formatted
 
     :param task:
-        Task object to be displayed
+        Task object, or TaskRow projection, to be displayed
     """
     print(f'ID: {task.id}')
     print(f'Title: {task.title}')
@@ -112,20 +313,49 @@ def display_task(task: Task) -> None:
     if task.dueDate:
         print(f'Due Date: {task.dueDate}')
     print(f'Status: {task.status}')
-    if task.tags:
-        print(f'Tags: {", ".join(tag.name for tag in task.tags)}')
-    if task.links:
-        print(f'Linked Tasks: {", ".join(str(link.title) for link in task.links)}')
-    if task.parent:
-        print(f'Parent Task: {task.parent.title}')
+    if task.tag_names:
+        print(f'Tags: {", ".join(task.tag_names)}')
+    if task.link_titles:
+        print(f'Linked Tasks: {", ".join(task.link_titles)}')
+    if task.parent_title:
+        print(f'Parent Task: {task.parent_title}')
     print(f'Created At: {task.createdAt}')
     print(f'Updated At: {task.updatedAt}')
 
 
+def parse_task_ids(text: str) -> List[int]:
+    """
+    Parse a list of task ids and ranges, e.g. '1-50,73,90'
+
+    :param text:
+        Comma separated ids and first-last ranges
+
+    :raises ValueError:
+        If a part isn't an id or a range, or there are no ids
+    """
+    task_ids = []
+    for part in text.replace(' ', '').split(','):
+        if not part:
+            continue
+        first, separator, last = part.partition('-')
+        if separator:
+            if int(first) > int(last):
+                raise ValueError(f'Invalid range {part}')
+            task_ids.extend(range(int(first), int(last) + 1))
+        else:
+            task_ids.append(int(part))
+    if not task_ids:
+        raise ValueError('No task IDs')
+    return task_ids
+
+
 def parse_flags(args: List[str], allowed_flags: set) -> Dict[str, Optional[any]]:
     """
     Parse flags (--title, --description, ...) from args, returing a dictionary of values
 
+    :raises CommandError:
+        If a flag is not allowed or its value is invalid
+
     :param args:
         List of arguments to parse
     :param allowed_flags:
@@ -137,9 +367,17 @@ def parse_flags(args: List[str], allowed_flags: set) -> Dict[str, Optional[any]]
         'due-date': None,
         'status': None,
         'tags': None,
+        'tags-any': None,
+        'tags-all': None,
+        'tags-none': None,
         'delete-tags': None,
         'parent': None,
-        'links': None
+        'links': None,
+        'limit': None,
+        'after': None,
+        'depth': None,
+        'format': None,
+        'sort': None,
     }
     i = 0
     title_parts = []
@@ -157,11 +395,9 @@ def parse_flags(args: List[str], allowed_flags: set) -> Dict[str, Optional[any]]
             args[i][2:] if args[i].startswith('--') else args[i]
         )  # extract flag name and remove the '--'
         if flag not in allowed_flags:  # if flag is invalid
-            print('Invalid flag')
-            return {}
+            raise CommandError('Invalid flag')
         if i + 1 >= len(args):
-            print('Error: Flag requires a value')  # if flag has no value, print error
-            return {}
+            raise CommandError('Error: Flag requires a value')  # if flag has no value
 
         if flag in ('title','description'):  # if flag is description or title, get the parts
             parts = []
@@ -170,7 +406,7 @@ def parse_flags(args: List[str], allowed_flags: set) -> Dict[str, Optional[any]]
                 parts.append(args[i])
                 i += 1
             result[flag] = ' '.join(parts)
-        elif flag in ('tags', 'delete-tags'):  # if flag is --tags or --delete-tags
+        elif flag in ('tags', 'tags-any', 'tags-all', 'tags-none', 'delete-tags'):  # if flag is --tags or --delete-tags
             parts = []
             i += 1
             while i < len(args) and not args[i].startswith('--'):
@@ -180,14 +416,19 @@ def parse_flags(args: List[str], allowed_flags: set) -> Dict[str, Optional[any]]
             tags = tag_input.split(',')
             tags = [tag for tag in tags if tag]
             if not tags:
-                print('Error: Tag requires a value')
+                raise CommandError('Error: Tag requires a value')
             result[flag] = tags
         elif flag == 'parent':
             try:
                 result[flag] = int(args[i + 1])  # convert to integer
             except ValueError:
-                print('Error: Parent ID must be a number')
-                return {}
+                raise CommandError('Error: Parent ID must be a number')
+            i += 2
+        elif flag in ('limit', 'after', 'depth'):
+            try:
+                result[flag] = int(args[i + 1])  # convert to integer
+            except ValueError:
+                raise CommandError(f'Error: --{flag} must be a number')
             i += 2
         elif flag == 'links':
             parts = []
@@ -198,20 +439,17 @@ def parse_flags(args: List[str], allowed_flags: set) -> Dict[str, Optional[any]]
 
             link_input_str = ' '.join(parts).replace(' ', '')  # remove whitespace
             if not link_input_str:
-                print('Error: Links require a value')
-                return {}
+                raise CommandError('Error: Links require a value')
             
             ids_str_list = [s.strip() for s in link_input_str.split(',') if s.strip()]
             parsed_ids = []
             if not ids_str_list:
-                print('Error: Links require a value')
-                return {}
+                raise CommandError('Error: Links require a value')
             for id_str in ids_str_list:
                 try:
                     parsed_ids.append(int(id_str))  # convert to integer
                 except ValueError:
-                    print(f'Error: Invalid link ID {id_str}, must be a number')
-                    return {}
+                    raise CommandError(f'Error: Invalid link ID {id_str}, must be a number')
                 parsed_ids.append(int(id_str))
             
             result[flag] = parsed_ids  # store the list of IDs
@@ -223,11 +461,22 @@ def parse_flags(args: List[str], allowed_flags: set) -> Dict[str, Optional[any]]
                 )  # parse the string into a datetime object, if in right format
                 i += 2
             except ValueError:
-                print('Error: Due date must be in YYYY-MM-DD format')
-                return {}
+                raise CommandError('Error: Due date must be in YYYY-MM-DD format')
         elif flag == 'status':
             result[flag] = args[i + 1]
             i += 2
+        elif flag == 'format':
+            from task_tracker.transfer import FORMATS  # optional modules are imported when first used
+
+            if args[i + 1].lower() not in FORMATS:
+                raise CommandError(f'Error: --format must be one of {", ".join(FORMATS)}')
+            result[flag] = args[i + 1].lower()
+            i += 2
+        elif flag == 'sort':
+            if args[i + 1] not in SORT_COLUMNS:
+                raise CommandError(f'Error: --sort must be one of {", ".join(SORT_COLUMNS)}')
+            result[flag] = args[i + 1]
+            i += 2
 
     return result
 
@@ -246,32 +495,51 @@ def handle_add_command(args: List[str], db: Session) -> None:
     result = parse_flags(
         args, {'title', 'description', 'due-date', 'tags', 'parent', 'links'}   
     )  # call parse function w/ args and allowed function
-    if not result:  # if no flags return
-        return
 
     title = result.get('title')  # make sure a title is present
     if not title:
-        print('Error: add requires a title')
-        return
+        raise CommandError('Error: add requires a title')
 
-    print(
-        add_task(
-            title=title,
-            description=result.get('description'),
-            dueDate=result.get('due-date'),
-            tags=result.get('tags'),
-            parent=result.get('parent'),
-            links=result.get('links'),
-            db=db,
-        )
+    # one row through add_tasks, whose result says why a task wasn't added (e.g. its parent doesn't exist)
+    added = add_tasks(
+        [
+            {
+                'title': title,
+                'description': result.get('description'),
+                'dueDate': result.get('due-date'),
+                'tags': result.get('tags'),
+                'parent': result.get('parent'),
+                'links': result.get('links'),
+            }
+        ],
+        db=db,
     )
+    if added.failed:
+        raise CommandError(added.failed[0][1])
+    print(f'Task {added.added[0]} added')
 
 
 @with_db_session
+def handle_update_command(args: List[str], db: Session) -> None:
+    """
+    Function to handle update commands: one task by id, or many at once with --set
+    (e.g. update 1-50,73 --set status=done, or update --where status=to-do --tags q3 --set status=done)
+
+    :param args:
+        The command list input by user
+    :param db:
+        SQLAlchemy database session
+    """
+    if '--set' in args:
+        handle_bulk_update(args, db=db)
+    else:
+        handle_single_update(args, db=db)
+
+
 @with_task_id
-def handle_update_command(task_id: int, args: List[str], db: Session) -> None:
+def handle_single_update(task_id: int, args: List[str], db: Session) -> None:
     """
-    Function to handle remove commands
+    Function to handle updating one task
 
     :param task_id:
         Task ID to update
@@ -283,85 +551,514 @@ def handle_update_command(task_id: int, args: List[str], db: Session) -> None:
     result = parse_flags(
         args, {'title', 'description', 'status', 'due-date', 'tags', 'delete-tags'}
     )  # call parse function w/ args and allowed flags
-    if not result:  # if no flags return
-        return
     if not any(result.values()):
-        print('Error: At least one field required for an update')
+        raise CommandError('Error: At least one field required for an update')
 
-    print(
-        update_task(
-            task_id=task_id,
-            title=result.get('title'),
-            description=result.get('description'),
-            status=result.get('status'),
-            tags=result.get('tags'),
-            delete_tags=result.get('delete-tags'),
-            dueDate=result.get('due-date'),
-            db=db,
-        )
+    updated = edit_task(
+        task_id=task_id,
+        title=result.get('title'),
+        description=result.get('description'),
+        status=result.get('status'),
+        tags=result.get('tags'),
+        delete_tags=result.get('delete-tags'),
+        dueDate=result.get('due-date'),
+        db=db,
     )
+    if not updated.ok:
+        raise CommandError(updated.error)
+    print(updated.message)
+
+
+BULK_SET_FIELDS = {'title': 'title', 'description': 'description', 'status': 'status', 'due-date': 'dueDate'}
+
+
+def parse_selection(args: List[str]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """
+    Parse the tasks a bulk command works on - [ids, e.g. 1-50,73] [--where status=<status>] [tag filters] - and
+    any --set field=value pairs
+
+    :param args:
+        The command list input by user, after the command name
+
+    :return:
+        (selection, assignments): selection holds the task_ids / status / tags / tags_all / tags_none arguments of
+        core.bulk_update and core.delete_tasks, assignments the --set fields
+
+    :raises CommandError:
+        If the arguments are invalid
+    """
+    task_ids = None
+    if args and not args[0].startswith('--'):
+        try:
+            task_ids = parse_task_ids(args[0])
+        except ValueError:
+            raise CommandError('Invalid task IDs. Enter numbers and ranges, e.g. 1-50,73')
+        args = args[1:]
+
+    # split field=value pairs after --where / --set from the other flags
+    assignments: Dict[str, Dict[str, str]] = {'where': {}, 'set': {}}
+    rest = []
+    section = None
+    for arg in args:
+        if arg in ('--where', '--set'):
+            section = arg[2:]
+        elif arg.startswith('--') or section is None:
+            section = None
+            rest.append(arg)
+        else:
+            field, separator, value = arg.partition('=')
+            if not separator:
+                raise CommandError(f'Error: Expected field=value after --{section}, got {arg}')
+            assignments[section][field] = value
+    filters = parse_flags(rest, {'tags', 'tags-any', 'tags-all', 'tags-none'}) if rest else {}
+
+    where = assignments['where']
+    if set(where) - {'status'}:
+        raise CommandError('Error: --where supports status=<status>, use --tags / --tags-all / --tags-none for tags')
+    selection = {
+        'task_ids': task_ids,
+        'status': where.get('status'),
+        'tags': (filters.get('tags') or []) + (filters.get('tags-any') or []) or None,
+        'tags_all': filters.get('tags-all'),
+        'tags_none': filters.get('tags-none'),
+    }
+    if not any(value is not None for value in selection.values()):
+        raise CommandError('Error: Requires task IDs, --where or a tag filter')
+    return selection, assignments['set']
+
+
+def handle_bulk_update(args: List[str], db: Session) -> None:
+    """
+    Function to handle updating many tasks with one statement: [ids] [--where status=<status>] [tag filters]
+    --set field=value ...
+
+    :param args:
+        The command list input by user
+    :param db:
+        SQLAlchemy database session
+    """
+    selection, assignments = parse_selection(args)
+
+    values = {}
+    for field, value in assignments.items():
+        if field not in BULK_SET_FIELDS:
+            raise CommandError(f'Error: --set supports {", ".join(BULK_SET_FIELDS)}, not {field}')
+        if field == 'due-date':
+            try:
+                value = dt.datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                raise CommandError('Error: Due date must be in YYYY-MM-DD format')
+        values[BULK_SET_FIELDS[field]] = value
+    if not values:
+        raise CommandError('Error: --set requires at least one field=value')
+
+    updated = bulk_update(values, db, **selection)
+    print(f'{len(updated)} tasks updated')
 
 
 @with_db_session
-@with_task_id
-def handle_delete_command(task_id: int, args: List[str], db: Session) -> None:
+def handle_delete_command(args: List[str], db: Session) -> None:
     """
-    Function to handle delete command to remove a task
+    Function to handle delete command to remove a task, or with a list of ids and / or filters many tasks at once
+    (e.g. delete 1-50,73, or delete --where status=done --tags q3). Tags and links go with the tasks; their subtasks
+    become top-level tasks, unless --subtree deletes them too.
 
-    :param task_id:
-        Task ID to delete
     :param args:
         List of command input by user
     :param db:
         SQLAlchemy database session
     """
-    if args:
-        print('Error: delete commands requires only a task ID')
+    subtree = '--subtree' in args
+    args = [arg for arg in args if arg != '--subtree']
+    if len(args) == 1 and args[0].isdigit():
+        task_id = int(args[0])
+        if get_task(task_id, db) is None:
+            raise CommandError(f'Task {task_id} not found in the database')
+        print(delete_task(task_id, db=db, subtree=subtree))
         return
-    print(delete_task(task_id, db=db))
+
+    selection, assignments = parse_selection(args)
+    if assignments:
+        raise CommandError('Error: delete does not take --set')
+    deleted = delete_tasks(db, subtree=subtree, **selection)
+    print(f'{len(deleted)} tasks deleted')
 
 
 @with_db_session
-@with_task_id
-def handle_mark_status_command(task_id: int, args: List[str], status: str, db: Session):
+def handle_mark_status_command(args: List[str], status: str, db: Session):
     """
-    Function to handle updating a status
+    Function to handle updating a status, of one task or of a list of ids and ranges (e.g. 1-50,73,90)
+    A list is updated with a single statement, see core.bulk_update
 
-    :param task_id:
-        Task ID to update
     :param args:
         List of command input by user
+    :param status:
+        The new status
     :param db:
         SQLAlchemy database session
     """
-    if args:
-        print(f'Error: mark-{status} requires only a task ID')
+    if not args:
+        raise CommandError('Error: Requires a task ID')
+    try:
+        task_ids = parse_task_ids(','.join(args))
+    except ValueError:
+        raise CommandError('Invalid task ID. Enter a number, or a list like 1-50,73')
+    if len(args) == 1 and args[0].isdigit():
+        updated = edit_task(task_ids[0], status=status, db=db)
+        if not updated.ok:
+            raise CommandError(updated.error)
+        print(updated.message)
         return
-    print(update_task(task_id, status=status, db=db))
+    updated = bulk_update({'status': status}, db, task_ids=task_ids)
+    print(f'{len(updated)} of {len(task_ids)} tasks marked {status}')
 
 
-@with_db_session
+@with_db_session(read_only=True)
 def handle_list_command(args: List[str], db: Session) -> None:
     """
     Function to handle list command w/ optional status filter
+    Tasks are streamed and printed page by page, so output starts straight away and memory stays flat.
+    They are read as TaskRow projections, one query per page with the tags, links and parent included.
+    In the REPL / batch mode, pages of --limit tasks are served from the session's cache until something changes.
+    --sort and --desc order the tasks in SQL, so with --limit only the first rows of an index are read.
+
     param args:
         List of command input by user
     :param db:
         SQLAlchemy database session
     """
-    flags = parse_flags(args, {'status', 'tags'})
-    tasks = list_tasks(db=db, status=flags.get('status'), tags=flags.get('tags'))
-    if tasks:
-        for task in tasks:
-            display_task(task)
-            print('-------')
+    desc = '--desc' in args
+    args = [arg for arg in args if arg != '--desc']
+    flags = parse_flags(args, {'status', 'tags', 'tags-any', 'tags-all', 'tags-none', 'sort', 'limit', 'after'})
+    limit = flags.get('limit')
+    if limit is not None and limit < 1:
+        raise CommandError('Error: --limit must be at least 1')
+    filters = {
+        'status': flags.get('status'),
+        'tags': (flags.get('tags') or []) + (flags.get('tags-any') or []),  # --tags is --tags-any
+        'tags_all': flags.get('tags-all'),
+        'tags_none': flags.get('tags-none'),
+        'sort': flags.get('sort') or 'id',
+        'desc': desc,
+        'after': flags.get('after'),
+    }
+    # with --limit one extra task is read, to tell whether there is another page
+    if limit and _persistent_session is not None:
+        tasks = _persistent_session.cache.list_task_rows(db, limit=limit + 1, **filters)
+    elif limit:
+        tasks = iter_task_rows(db=db, chunk_size=limit + 1, **filters)  # one LIMIT limit + 1 query
     else:
+        tasks = iter_task_rows(db=db, **filters)
+    shown = 0
+    last_id = None
+    for task in tasks:
+        if limit and shown >= limit:
+            print(f'Showing {shown} tasks, use --after {last_id} for the next page')
+            break
+        display_task(task)
+        print('-------')
+        shown += 1
+        last_id = task.id
+    if not shown:
+        print('No tasks found')
+
+
+@with_db_session(read_only=True)
+@with_task_id
+def handle_tree_command(task_id: int, args: List[str], db: Session) -> None:
+    """
+    Function to handle tree command, showing a task's subtasks indented by depth, and the share of them done
+
+    :param task_id:
+        Task ID of the root
+    :param args:
+        List of command input by user
+    :param db:
+        SQLAlchemy database session
+    """
+    flags = parse_flags(args, {'status', 'depth'})
+    tree = get_subtree(task_id, db, max_depth=flags.get('depth'), status=flags.get('status'))
+    if not tree:
+        raise CommandError(f'Task {task_id} not found in the database')
+    for task, depth in tree:
+        print(f'{"  " * depth}[{task.status}] {task.id}: {task.title}')
+    rollup = subtree_rollup(task_id, db)
+    if rollup['total']:
+        print(f'{rollup["percent_done"]}% of {rollup["total"]} subtasks done')
+
+
+@with_db_session(read_only=True)
+def handle_search_command(args: List[str], db: Session) -> None:
+    """
+    Function to handle search command, printing the best matches with the matching words in [brackets]
+
+    :param args:
+        List of command input by user
+    :param db:
+        SQLAlchemy database session
+    """
+    flags = parse_flags(args, {'limit'})
+    query = flags.get('title')  # the words before any flag
+    if not query:
+        raise CommandError('Error: search requires some words to look for')
+    hits = search_tasks(query, db, limit=flags.get('limit') or 20)
+    if not hits:
         print('No tasks found')
+    for hit in hits:
+        print(f'{hit.id}: {hit.title} ({hit.status})')
+        if hit.snippet:
+            print(f'    {hit.snippet}')
+
+
+@with_db_session(read_only=True)
+@with_task_id
+def handle_history_command(task_id: int, args: List[str], db: Session) -> None:
+    """
+    Function to handle history command, listing a task's recorded changes oldest first
+
+    :param task_id:
+        Task ID to show the history of
+    :param args:
+        List of command input by user
+    :param db:
+        SQLAlchemy database session
+    """
+    if args:
+        raise CommandError('Error: history requires only a task ID')
+    events = get_events(db, task_id=task_id)
+    if not events:
+        print(f'No changes recorded for task {task_id}')
+    for event in events:
+        if event.old_value is None:
+            change = f'added {event.new_value}' if event.field in ('tags', 'links') else f'set to {event.new_value}'
+        elif event.new_value is None:
+            change = f'removed {event.old_value}' if event.field in ('tags', 'links') else f'cleared (was {event.old_value})'
+        else:
+            change = f'{event.old_value} -> {event.new_value}'
+        print(f'{event.createdAt:%Y-%m-%d %H:%M:%S}  {event.field}: {change}')
+
+
+def handle_stats_command(args: List[str]) -> None:
+    """
+    Function to handle stats command, showing the task counts, or rebuilding / verifying them, or how long this
+    process has waited for the database lock, or how often the list cache was hit
+    Only rebuild writes, the rest runs in a read-only session
+
+    :param args:
+        List of command input by user
+    """
+    if args == ['rebuild']:
+        handle_rebuild_stats()
+    else:
+        handle_show_stats(args)
+
+
+@with_db_session
+def handle_rebuild_stats(db: Session) -> None:
+    """
+    Function to handle stats rebuild, recounting the stored task counts
+
+    :param db:
+        SQLAlchemy database session
+    """
+    print(rebuild_stats(db))
+
+
+@with_db_session(read_only=True)
+def handle_show_stats(args: List[str], db: Session) -> None:
+    """
+    Function to handle the read-only forms of the stats command: counts, verify, locks and cache
+
+    :param args:
+        List of command input by user
+    :param db:
+        SQLAlchemy database session
+    """
+    if args == ['verify']:
+        mismatches = verify_stats(db)
+        if not mismatches:
+            print('Stats are correct')
+        for (kind, key), (stored, actual) in sorted(mismatches.items()):
+            print(f'Mismatch: {kind} {key!r} is {stored}, should be {actual}')
+        return
+    if args == ['locks']:
+        locks = lock_stats(db.get_bind()).snapshot()
+        print(
+            f'Transactions: {locks.transactions}, waited for the lock: {locks.contended} '
+            f'({locks.retries} retries, {locks.failures} gave up)'
+        )
+        print(f'Lock wait: {locks.wait_seconds * 1000:.1f} ms in total, {locks.max_wait_seconds * 1000:.1f} ms at most')
+        return
+    if args == ['cache']:
+        if _persistent_session is None:
+            print('The list cache is only used in the REPL and batch mode')
+            return
+        cache = _persistent_session.cache.stats()
+        print(
+            f'Cache hits: {cache.hits}, misses: {cache.misses}, evictions: {cache.evictions}, '
+            f'invalidations: {cache.invalidations}, clears: {cache.clears}'
+        )
+        print(f'Cached: {cache.lists} list pages, {cache.tasks} tasks')
+        return
+    if args:
+        raise CommandError('Error: stats takes no arguments, or rebuild / verify / locks / cache')
+
+    stats = get_stats(db)
+    print(f'Total: {stats["total"]}')
+    for status, count in sorted(stats['status'].items()):
+        print(f'  {status}: {count}')
+    print(
+        f'Overdue: {stats["due"]["overdue"]}, due today: {stats["due"]["today"]}, upcoming: {stats["due"]["upcoming"]}'
+    )
+    if stats['tags']:
+        print(f'Tags: {", ".join(f"{tag} ({count})" for tag, count in sorted(stats["tags"].items()))}')
+
+
+@with_db_session(read_only=True)
+def handle_ready_command(args: List[str], db: Session) -> None:
+    """
+    Function to handle ready command, listing tasks whose linked tasks are all done, and any link cycles
+    In the REPL / batch mode the session's graph is kept current between commands instead of reloaded
+
+    :param args:
+        List of command input by user
+    :param db:
+        SQLAlchemy database session
+    """
+    if args:
+        raise CommandError('Error: ready takes no arguments')
+    if _persistent_session is not None:
+        graph = _persistent_session.graph.sync(db)
+    else:
+        graph = DependencyGraph.load(db)
+    ready = graph.ready()
+    if ready:
+        titles = dict(db.query(Task.id, Task.title).filter(Task.id.in_(ready)).all())
+        for task_id in ready:
+            print(f'{task_id}: {titles[task_id]}')
+    else:
+        print('No tasks ready to start')
+    for cycle in graph.cycles():
+        print(f'Warning: tasks {", ".join(map(str, cycle))} link to each other in a cycle')
+
+
+def _transfer_args(args: List[str], command: str) -> Tuple[str, str]:
+    """
+    Read the path and format of an export / import command, the format defaults to the path's extension
+    Any commands still pending in a persistent session are committed first, as the transfer uses its own connection
+
+    :return:
+        (path, format)
+
+    :raises CommandError:
+        If the arguments are invalid
+    """
+    from task_tracker.transfer import guess_format
+
+    flags = parse_flags(args, {'format'})
+    if not flags.get('title'):
+        raise CommandError(f'Error: {command} requires a file path')
+    if _persistent_session is not None:
+        _persistent_session.commit()
+    path = flags['title']
+    return path, flags.get('format') or guess_format(path)
+
+
+def _current_bind() -> Engine:
+    """
+    Engine of the persistent session if there is one, else the default engine
+    """
+    return _persistent_session.connection.engine if _persistent_session is not None else engine
+
+
+def handle_export_command(args: List[str]) -> None:
+    """
+    Function to handle export command, streaming every task to a JSONL or CSV file
+
+    :param args:
+        List of command input by user
+    """
+    from task_tracker.transfer import export_tasks
+
+    path, fmt = _transfer_args(args, 'export')
+    with open(path, 'w', encoding='utf-8', newline='') as out:
+        count = export_tasks(out, fmt=fmt, bind=_current_bind())
+    print(f'Exported {count} tasks to {path}')
+
+
+def handle_import_command(args: List[str]) -> None:
+    """
+    Function to handle import command, adding the tasks in a JSONL or CSV file in batched transactions
+
+    :param args:
+        List of command input by user
+    """
+    from task_tracker.transfer import import_tasks
+
+    path, fmt = _transfer_args(args, 'import')
+    with open(path, encoding='utf-8', newline='') as source:
+        result = import_tasks(source, fmt=fmt, bind=_current_bind())
+    for line_number, reason in result.failed:
+        print(f'Skipped line {line_number}: {reason}')
+    print(f'Imported {result.imported} tasks from {path}, {len(result.failed)} skipped')
+    if result.unresolved:
+        print(f'Warning: {result.unresolved} parent / link ids were not in the file and were dropped')
+
+
+# PROFILING
+_profiler = None  # QueryProfiler, set while profiling is on
+
+
+def enable_profiling(bind: Optional[Engine] = None, json_path: Optional[str] = None):
+    """
+    Profile every command dispatched from now on, replacing any profiler already running
+
+    :param bind:
+        SQLAlchemy engine to profile, defaults to the one commands run against
+    :param json_path:
+        File to append one JSON line per command to
+    """
+    from task_tracker.profiling import QueryProfiler
+
+    global _profiler
+    disable_profiling()
+    _profiler = QueryProfiler(bind=bind or _current_bind(), json_path=json_path).start()
+    return _profiler
+
+
+def disable_profiling() -> None:
+    """
+    Stop profiling commands
+    """
+    global _profiler
+    if _profiler is not None:
+        _profiler.stop()
+        _profiler = None
+
+
+def handle_profile_command(args: List[str]) -> None:
+    """
+    Function to handle profile command, turning per-command SQL profiling on or off
+
+    :param args:
+        List of command input by user
+    """
+    if args[:1] == ['on'] and (len(args) == 1 or (len(args) == 3 and args[1] == '--json')):
+        json_path = args[2] if len(args) == 3 else None
+        enable_profiling(json_path=json_path)
+        print(f'Profiling on{f", writing JSON lines to {json_path}" if json_path else ""}')
+    elif args == ['off']:
+        disable_profiling()
+        print('Profiling off')
+    elif not args:
+        print(f'Profiling is {"on" if _profiler is not None else "off"}')
+    else:
+        raise CommandError('Error: usage is profile on [--json <path>] or profile off')
 
 
 # COMMAND REGISTER
 COMMANDS = {
-    'help': help,
+    'help': lambda args: help(),
     'add': handle_add_command,
     'update': handle_update_command,
     'delete': handle_delete_command,
@@ -371,41 +1068,212 @@ COMMANDS = {
     'mark-done': lambda args: handle_mark_status_command(args, status='done'),
     'mark-todo': lambda args: handle_mark_status_command(args, status='to-do'),
     'list': handle_list_command,
+    'tree': handle_tree_command,
+    'search': handle_search_command,
+    'history': handle_history_command,
+    'stats': handle_stats_command,
+    'ready': handle_ready_command,
+    'export': handle_export_command,
+    'import': handle_import_command,
+    'profile': handle_profile_command,
     'exit': lambda args: print('Exiting Task Tracker. Goodbye!') or False,
 }
 
 
-def main() -> None:
+DEFAULT_BATCH_SIZE = 500  # commands per transaction in batch mode
+
+
+def parse_command(raw_command: str) -> Optional[Tuple[str, Callable, List[str]]]:
+    """
+    Split a command line and look up its handler, printing an error if it's invalid
+
+    :param raw_command:
+        Command line input by the user, e.g. 'add "Buy milk" --tags shopping'
+
+    :return:
+        (command name, handler, arguments), or None if the line is invalid
+    """
+    try:
+        # parse command with shlex to preserve quotes and flags
+        args = shlex.split(raw_command)
+    except ValueError:
+        print('Error: Invalid command syntax (e.g., unmatched quotes).')
+        return None
+
+    # get the command verb, like add or update
+    handler = COMMANDS.get(args[0]) if args else None
+    if not handler:
+        print('Invalid command. Type help to view commands')
+        return None
+    return args[0], handler, args[1:]
+
+
+def dispatch(name: str, handler: Callable, args: List[str]) -> Any:
+    """
+    Run a command's handler, printing its SQL profile afterwards while profiling is on
+
+    :param name:
+        Command name, e.g. 'list'
+    :param handler:
+        Handler from COMMANDS
+    :param args:
+        Command arguments
+
+    :return:
+        The handler's result (False to exit)
+    """
+    profiler = _profiler
+    if profiler is None or name == 'profile':
+        return handler(args)
+    from task_tracker.profiling import format_profile
+
+    try:
+        with profiler.command(name, args):
+            return handler(args)
+    finally:
+        print(format_profile(profiler.last))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
     """
     Main function for CLI user interaction
+    Runs the interactive REPL, or batch mode for a file of commands (--batch) or piped stdin
+
+    :param argv:
+        Command line arguments, defaults to sys.argv[1:]
     :return: None
     """
+    parser = argparse.ArgumentParser(description='Task Tracker CLI')
+    parser.add_argument(
+        '--batch', metavar='FILE', help="run the commands in FILE, one per line ('-' for stdin)"
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f'commands per transaction in batch mode (default {DEFAULT_BATCH_SIZE})',
+    )
+    parser.add_argument(
+        '--profile', action='store_true', help='print the SQL run by each command (queries, time, slowest)'
+    )
+    parser.add_argument('--profile-json', metavar='FILE', help='also append each profile to FILE as a JSON line')
+    options = parser.parse_args(argv)
+
+    init_db()  # no DDL unless the schema version is behind
+    if options.profile or options.profile_json:
+        enable_profiling(bind=engine, json_path=options.profile_json)
+    try:
+        run_cli(options)
+    finally:
+        disable_profiling()
+
+
+def run_cli(options: argparse.Namespace) -> None:
+    """
+    Run batch mode or the REPL, as chosen by main's options
+    """
+    if options.batch is None and not sys.stdin.isatty():
+        options.batch = '-'  # commands piped in
+    if options.batch == '-':
+        run_batch(sys.stdin, batch_size=options.batch_size)
+        return
+    if options.batch:
+        with open(options.batch, encoding='utf-8') as batch_file:
+            run_batch(batch_file, batch_size=options.batch_size)
+        return
+
     # help message on startup
     help()
 
+    # keep one connection and session for the whole REPL
+    with persistent_session():
+        repl()
+
+
+def repl() -> None:
+    """
+    Read and run commands until exit
+    """
     while True:
         # get user input and remove whitespace
         raw_command = input('Enter command: ').strip()
         if not raw_command:
             continue
 
-        try:
-            # parse command with shlex to preserve quotes and flags
-            args = shlex.split(raw_command)
-        except ValueError:
-            print('Error: Invalid command syntax (e.g., unmatched quotes).')
-            continue
-
-        if not args:
+        command = parse_command(raw_command)
+        if not command:
             continue
 
-        # get the command verb, like add or update
-        command_verb = args[0]
-        handler = COMMANDS.get(command_verb)
-        if not handler:
-            print('Invalid command. Type help to view commands')
+        try:
+            result = dispatch(*command)
+        except CommandError as error:
+            print(error)
             continue
-
-        result = handler(args[1:])
         if result is False:
             break
+
+
+class BatchSummary(NamedTuple):
+    """
+    Outcome of a batch run
+    """
+
+    commands: int
+    failed: List[Tuple[int, str]]  # (line number, error)
+    seconds: float
+
+
+def run_batch(
+    lines: Iterable[str], batch_size: int = DEFAULT_BATCH_SIZE, bind: Engine = engine
+) -> BatchSummary:
+    """
+    Run commands non-interactively, one per line, committing every batch_size commands instead of every command
+    A failing line is rolled back on its own and reported, the rest of the batch carries on.
+    Blank lines and lines starting with # are skipped.
+
+    :param lines:
+        Command lines, e.g. an open file or sys.stdin
+    :param batch_size:
+        Number of commands per transaction
+    :param bind:
+        SQLAlchemy engine to run against
+
+    :return:
+        BatchSummary with the number of commands run, the failed lines and the elapsed time
+    """
+    commands = 0
+    failed = []
+    start = time.perf_counter()
+
+    with persistent_session(bind=bind, batch_size=batch_size):
+        for line_number, line in enumerate(lines, start=1):
+            raw_command = line.strip()
+            if not raw_command or raw_command.startswith('#'):
+                continue
+            commands += 1
+
+            command = parse_command(raw_command)
+            if not command:
+                failed.append((line_number, 'invalid command'))
+                continue
+
+            try:
+                result = dispatch(*command)
+            except CommandError as error:  # the handler already rolled back, carry on with the next line
+                print(f'Line {line_number}: {error}')
+                failed.append((line_number, str(error)))
+                continue
+            except Exception as error:  # report and carry on with the next line
+                print(f'Error on line {line_number}: {error}')
+                failed.append((line_number, str(error)))
+                continue
+            if result is False:
+                break
+
+    summary = BatchSummary(commands=commands, failed=failed, seconds=time.perf_counter() - start)
+    rate = summary.commands / summary.seconds if summary.seconds else 0.0
+    print(
+        f'Batch finished: {summary.commands} commands in {summary.seconds:.2f}s '
+        f'({rate:.0f} commands/s), {len(summary.failed)} failed'
+    )
+    return summary
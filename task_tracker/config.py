@@ -0,0 +1,95 @@
+"""
+Database settings: where the SQLite file lives, and which engine profile (connection pragmas) to use
+
+Each setting is read from an environment variable, then the JSON config file, then the default:
+    TASK_TRACKER_DB       path of the database file, e.g. on fast local storage (default ./tasks.db)
+    TASK_TRACKER_PROFILE  name of the engine profile (default 'default')
+    TASK_TRACKER_CONFIG   path of the JSON config file (default ./task_tracker.json)
+
+The config file can set "db_path" and "profile", and add its own profiles under "profiles", e.g.
+    {"db_path": "/fast/tasks.db", "profile": "performance", "profiles": {"small": {"cache_size": -2000}}}
+"""
+import json
+import os
+from typing import Any, Dict, NamedTuple, Optional
+
+
+DEFAULT_DB_PATH = './tasks.db'
+DEFAULT_PROFILE = 'default'
+DEFAULT_CONFIG_PATH = './task_tracker.json'
+
+# Pragmas a profile may set, applied in this order on every new connection
+# journal_mode goes first, as it can't be changed once other pragmas have opened a transaction
+ALLOWED_PRAGMAS = (
+    'journal_mode',
+    'synchronous',
+    'mmap_size',
+    'cache_size',
+    'temp_store',
+    'busy_timeout',
+)
+
+# Engine profiles: name -> {pragma: value}
+PROFILES: Dict[str, Dict[str, Any]] = {
+    # SQLite's defaults, but wait for a lock instead of failing with 'database is locked' straight away
+    'default': {'busy_timeout': 5000},
+    # WAL lets readers and a writer work at the same time, NORMAL sync is safe in WAL mode and skips most fsyncs
+    'performance': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 268435456,  # 256 MB of the file memory mapped
+        'cache_size': -65536,  # 64 MB page cache (negative = KiB)
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+}
+
+
+class Settings(NamedTuple):
+    """
+    Resolved database settings
+    """
+
+    db_path: str
+    profile: str
+    pragmas: Dict[str, Any]
+
+
+def _read_config_file(path: str) -> Dict[str, Any]:
+    """
+    Read the JSON config file, returning an empty config if it doesn't exist
+
+    :param path:
+        Path of the config file
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as config_file:
+        return json.load(config_file)
+
+
+def load_settings(environ: Optional[Dict[str, str]] = None) -> Settings:
+    """
+    Resolve the database path and engine profile from the environment and the config file
+
+    :param environ:
+        Environment variables to read, defaults to os.environ
+
+    :return:
+        Settings with the database path, profile name and its pragmas
+    """
+    environ = os.environ if environ is None else environ
+    config = _read_config_file(environ.get('TASK_TRACKER_CONFIG', DEFAULT_CONFIG_PATH))
+
+    profiles = {**PROFILES, **config.get('profiles', {})}
+    profile = environ.get('TASK_TRACKER_PROFILE') or config.get('profile') or DEFAULT_PROFILE
+    if profile not in profiles:
+        raise ValueError(f'Unknown engine profile {profile!r}, expected one of {sorted(profiles)}')
+
+    pragmas = profiles[profile]
+    unknown = set(pragmas) - set(ALLOWED_PRAGMAS)
+    if unknown:
+        raise ValueError(f'Unsupported pragmas in profile {profile!r}: {sorted(unknown)}')
+
+    db_path = environ.get('TASK_TRACKER_DB') or config.get('db_path') or DEFAULT_DB_PATH
+    return Settings(db_path=db_path, profile=profile, pragmas=pragmas)
@@ -1,19 +1,169 @@
 # MODULES
-from typing import List, Optional
-from task_tracker.models import sessionLocal, Task, Tag, task_tags
-from sqlalchemy.orm import Session
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+from task_tracker.models import sessionLocal, Task, TaskEvent, Tag, task_counts, task_tags, task_links
+from task_tracker.locking import deferred
+from task_tracker.migrations import COUNTS_QUERY, rebuild_counts
+from sqlalchemy import and_, delete, func, insert, inspect, literal, or_, select, text, update
+from sqlalchemy.orm import Session, aliased, joinedload, selectinload
+from sqlalchemy.sql import Select
+from itertools import islice
+import calendar
 import datetime as dt
+import json
+import operator
+
+
+BULK_CHUNK_SIZE = 500  # max values per IN (...) lookup, keeps us well under SQLite's bound parameter limit
+STREAM_CHUNK_SIZE = 500  # rows fetched per page by iter_tasks
+BULK_UPDATE_FIELDS = ('title', 'description', 'status', 'dueDate')  # columns bulk_update can set
+GROUP_SEPARATOR = '\x1f'  # group_concat separator for aggregated names, can't appear in a tag typed at the CLI
+
+
+# Sort keys for list_tasks / iter_tasks, every key is paired with Task.id so the (key, id) keyset is unique
+# each has an index (with status first for due and updated), so a page costs the same whatever the table size
+SORT_COLUMNS = {
+    'id': Task.id,
+    'due': Task.dueDate,  # tasks without a due date come last, in either direction
+    'created': Task.createdAt,
+    'updated': Task.updatedAt,
+    'title': Task.title,
+}
+
+
+# Loading plan for list_tasks: relationship name -> eager loader option
+# collections are selectin loaded (one extra query each, whatever the row count), the parent is joined into the main query
+LOAD_OPTIONS = {
+    'tags': selectinload(Task.tags),
+    'links': selectinload(Task.links),
+    'parent': joinedload(Task.parent),
+}
+
+
+class SearchHit(NamedTuple):
+    """
+    A search result: the title with matches in [brackets], and a snippet of the description around the matches
+    """
+
+    id: int
+    title: str
+    snippet: Optional[str]
+    status: Optional[str]
+    rank: float
+
+
+class TaskRow(NamedTuple):
+    """
+    Read-only projection of a task for listing, built from one Core select() with the tag names, linked task titles
+    and parent title aggregated in SQL - no identity map, change tracking or lazy loads.
+    Has the same tag_names / link_titles / parent_title attributes as Task, so display code takes either.
+    """
+
+    id: int
+    title: str
+    description: Optional[str]
+    status: Optional[str]
+    dueDate: Optional[dt.datetime]
+    createdAt: dt.datetime
+    updatedAt: dt.datetime
+    parent_id: Optional[int]
+    parent_title: Optional[str]
+    tag_names: List[str]
+    link_titles: List[str]
+    link_ids: List[int]
+
+
+class BulkResult(NamedTuple):
+    """
+    Outcome of a bulk operation: ids of the rows written, and (row index, reason) for each row that was skipped
+    """
+
+    added: List[int]
+    failed: List[Tuple[int, str]]
+
+
+class UpdateResult(NamedTuple):
+    """
+    Outcome of edit_task: the changes made, or why the task was not updated
+    """
+
+    task_id: int
+    found: bool  # False if there is no task with that id
+    changes: Dict[str, Any]  # field -> new value, with added_tags / deleted_tags / added_links / deleted_links lists
+    error: Optional[str]  # why the update was refused (not found, invalid parent), None if it went through
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def message(self) -> str:
+        """
+        Output message, as returned by update_task
+        """
+        if not self.ok:
+            return self.error
+        return f'Task {self.task_id} updated\n\
+            {self.changes}'
+
+
+# CHANGE LISTENERS
+# called after core commits a change, as listener(event, task_id, details), where event is 'added', 'updated'
+# or 'deleted' and details has the new 'status' and any 'added_links' / 'deleted_links'.
+# When the commit only released a SAVEPOINT (e.g. in the CLI's persistent session) and the enclosing transaction is
+# rolled back later, listeners get a 'reset' event (task_id None): changes they were told about may not have happened.
+_listeners: List[Callable[[str, int, Dict[str, Any]], None]] = []
+
+
+def add_listener(listener: Callable[[str, int, Dict[str, Any]], None]) -> None:
+    """
+    Register a callable to be told about committed task changes (e.g. to keep an in-memory view current)
+    """
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def remove_listener(listener: Callable[[str, int, Dict[str, Any]], None]) -> None:
+    """
+    Unregister a change listener
+    """
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def has_listeners() -> bool:
+    """
+    Whether any change listener is registered, so callers can skip gathering details nobody reads
+    """
+    return bool(_listeners)
+
+
+def notify(event: str, task_id: int, **details: Any) -> None:
+    """
+    Tell every registered listener about a committed change
+    """
+    for listener in list(_listeners):
+        listener(event, task_id, details)
+
+
+def notify_rollback() -> None:
+    """
+    Tell every registered listener that changes it was notified of were rolled back, so it drops what it derived
+    """
+    notify('reset', None)
 
 
 # UTILITY
-def get_db() -> Session:
+def get_db(read_only: bool = False) -> Session:
     """
     Generator function to create a new database session
 
+    :param read_only:
+        The session only reads, so its transactions begin deferred and don't take the write lock
+
     :yields db:
         SQLAlchemy database session, a Session object
     """
-    db = sessionLocal()
+    db = sessionLocal(bind=deferred(sessionLocal.kw['bind'])) if read_only else sessionLocal()
     try:
         yield db  # pass the database session to the caller
     finally:
@@ -21,6 +171,114 @@ def get_db() -> Session:
 
 
 # HELPERS
+def _chunked(items: Iterable[Any], size: int = BULK_CHUNK_SIZE) -> Iterator[List[Any]]:
+    """
+    Split an iterable into lists of at most `size` items
+
+    :param items:
+        Items to split
+    :param size:
+        Maximum length of each chunk
+    """
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def normalise_tags(tags: Optional[Iterable[str]]) -> List[str]:
+    """
+    Normalise tag names (strip, lowercase, drop empties and duplicates), keeping their order
+
+    :raises ValueError:
+        If a tag name is not a string
+    """
+    normalised = []
+    for tag_name in tags or []:
+        if not isinstance(tag_name, str):
+            raise ValueError(f'Tag names must be strings, not {tag_name!r}')
+        tag_name = tag_name.strip().lower()
+        if tag_name and tag_name not in normalised:
+            normalised.append(tag_name)
+    return normalised
+
+
+def _existing_task_ids(task_ids: Iterable[int], db: Session) -> set:
+    """
+    Return the subset of task_ids that exist, using one IN query per chunk
+    """
+    existing = set()
+    for chunk in _chunked(set(task_ids)):
+        existing.update(db.scalars(select(Task.id).where(Task.id.in_(chunk))))
+    return existing
+
+
+def resolve_tag_ids(tag_names: Iterable[str], db: Session) -> Dict[str, int]:
+    """
+    Map tag names to tag ids, creating any missing tags in one batched insert
+
+    :param tag_names:
+        Normalised tag names
+    :param db:
+        SQLAlchemy database session
+
+    :return:
+        Dictionary of tag name -> tag id
+    """
+    names = set(tag_names)
+    tag_ids = {}
+    for chunk in _chunked(names):
+        tag_ids.update(db.execute(select(Tag.name, Tag.id).where(Tag.name.in_(chunk))).all())
+
+    missing = [name for name in names if name not in tag_ids]
+    if missing:
+        db.execute(insert(Tag), [{'name': name} for name in missing])  # executemany
+        for chunk in _chunked(missing):
+            tag_ids.update(db.execute(select(Tag.name, Tag.id).where(Tag.name.in_(chunk))).all())
+    return tag_ids
+
+
+def _event_value(value: Any) -> Optional[str]:
+    """
+    Store journal values as text, None stays NULL
+    """
+    return None if value is None else str(value)
+
+
+def _record_events(
+    task_id: int, events: List[Tuple[str, Any, Any]], timestamp: dt.datetime, db: Session
+) -> None:
+    """
+    Append changes to the task_events journal with one executemany insert, skipping fields that didn't change
+
+    :param task_id:
+        ID of the changed task
+    :param events:
+        (field, old value, new value) tuples
+    :param timestamp:
+        Time of the change
+    :param db:
+        SQLAlchemy database session
+    """
+    rows = [
+        {
+            'task_id': task_id,
+            'field': field,
+            'old_value': _event_value(old),
+            'new_value': _event_value(new),
+            'createdAt': timestamp,
+        }
+        for field, old, new in events
+        if _event_value(old) != _event_value(new)
+    ]
+    if rows:
+        db.execute(insert(TaskEvent), rows)
+
+
 def get_task(task_id: int, db: Session) -> Optional[Task]:
     """
     Retrieve a task by its ID
@@ -116,13 +374,131 @@ def add_task(
                     db_task.links.append(task_to_link)
 
     # STEP 4: Final Commit
+    added_links = [link.id for link in db_task.links]
     db.commit()
     db.refresh(db_task)  # refresh the instance to get the updated id and other fields
+    notify('added', db_task.id, status=db_task.status, added_links=added_links)
 
     return f'Task {db_task.id} added'
 
 
-def update_task(
+def _check_task_row(row: Dict[str, Any]) -> List[str]:
+    """
+    Check the fields of one add_tasks row that don't need the database
+
+    :return:
+        The row's normalised tags
+
+    :raises ValueError:
+        If the row has no title, or its tags / links / parent are not tag names / task ids
+    """
+    if not row.get('title'):
+        raise ValueError('Task requires a title')
+    links = row.get('links') or []
+    if not isinstance(links, (list, tuple)) or not all(_is_id(link_id) for link_id in links):
+        raise ValueError(f'Links must be a list of task ids, not {links!r}')
+    if row.get('parent') and not _is_id(row['parent']):
+        raise ValueError(f'Parent must be a task id, not {row["parent"]!r}')
+    tags = row.get('tags') or []
+    if not isinstance(tags, (list, tuple)):
+        raise ValueError(f'Tags must be a list of names, not {tags!r}')
+    return normalise_tags(tags)
+
+
+def _is_id(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def add_tasks(tasks: List[Dict[str, Any]], db: Session = None) -> BulkResult:
+    """
+    Adds many tasks in one transaction. Tags and links are resolved with set-based queries and the
+    association rows are written with executemany, instead of a query per tag / link like add_task.
+
+    Invalid rows (no title, tags / links that aren't lists of names / ids, missing parent) are reported in the result
+    and skipped before anything is written, the rest of the batch is still added.
+    Link IDs that don't exist are ignored, as in add_task.
+
+    :param tasks:
+        List of dictionaries with the add_task arguments (title, description, dueDate, tags, parent, links)
+    :param db:
+        SQLAlchemy database session
+
+    :return:
+        BulkResult with the new task ids and the (row index, reason) of failed rows
+    """
+    failed = []
+
+    # STEP 1: Validate rows, then resolve every parent and link id with one IN query
+    checked = []  # (row index, row, normalised tags)
+    for index, row in enumerate(tasks):
+        try:
+            checked.append((index, row, _check_task_row(row)))
+        except ValueError as error:
+            failed.append((index, str(error)))
+
+    parent_ids = {row['parent'] for _, row, _ in checked if row.get('parent')}
+    link_ids = {link_id for _, row, _ in checked for link_id in (row.get('links') or [])}
+    existing_ids = _existing_task_ids(parent_ids | link_ids, db)
+
+    valid = []  # (row index, row)
+    row_tags = []  # normalised tags of the valid rows
+    for index, row, tags in checked:
+        if row.get('parent') and row['parent'] not in existing_ids:
+            failed.append((index, f'Parent task {row["parent"]} not found'))
+        else:
+            valid.append((index, row))
+            row_tags.append(tags)
+    failed.sort()
+
+    if not valid:
+        return BulkResult(added=[], failed=failed)
+
+    # STEP 2: Insert the tasks, getting the new ids back in the same order
+    task_ids = db.scalars(
+        insert(Task).returning(Task.id, sort_by_parameter_order=True),
+        [
+            {
+                'title': row['title'],
+                'description': row.get('description'),
+                'dueDate': row.get('dueDate'),
+                'parent_id': row.get('parent') or None,
+            }
+            for _, row in valid
+        ],
+    ).all()
+
+    # STEP 3: Resolve tags and write the association rows
+    tag_ids = resolve_tag_ids({tag for tags in row_tags for tag in tags}, db)
+    tag_rows = [
+        {'task_id': task_id, 'tag_id': tag_ids[tag]}
+        for task_id, tags in zip(task_ids, row_tags)
+        for tag in tags
+    ]
+    if tag_rows:
+        db.execute(task_tags.insert(), tag_rows)
+
+    link_rows = [
+        {'task_id': task_id, 'linked_task_id': link_id}
+        for task_id, (_, row) in zip(task_ids, valid)
+        for link_id in dict.fromkeys(row.get('links') or [])  # de-duplicate, keep order
+        if link_id in existing_ids
+    ]
+    if link_rows:
+        db.execute(task_links.insert(), link_rows)
+
+    # STEP 4: Final Commit
+    db.commit()
+
+    added_links = {}
+    for link_row in link_rows:
+        added_links.setdefault(link_row['task_id'], []).append(link_row['linked_task_id'])
+    for task_id in task_ids:
+        notify('added', task_id, status='to-do', added_links=added_links.get(task_id, []))
+
+    return BulkResult(added=list(task_ids), failed=failed)
+
+
+def edit_task(
     task_id: int,
     title: Optional[str] = None,
     description: Optional[str] = None,
@@ -134,9 +510,10 @@ def update_task(
     links: Optional[List[int]] = None,
     delete_links: Optional[List[int]] = None,
     db: Session = None,
-) -> str:
+) -> UpdateResult:
     """
     Updates a task, and records the changes
+    The parent is checked before anything is changed, so a refused update leaves the task as it was
 
     :param task_id:
         The id of the task to be updated
@@ -160,139 +537,1144 @@ def update_task(
         SQLAlchemy database session
 
     :return:
-        Output message
+        UpdateResult with the changes made, or the error
     """
     db_task = get_task(task_id, db)
-    changes = {}
-
-    if db_task:
-        if title is not None:
-            changes[db_task.title] = title
-            db_task.title = title
-        if description is not None:
-            changes[db_task.description] = description
-            db_task.description = description
-        if status is not None:
-            changes[db_task.status] = status
-            db_task.status = status
-        if dueDate is not None:
-            changes[db_task.dueDate] = dueDate
-            db_task.dueDate = dueDate
-        if tags is not None:
-            added = []
-            for tag_name in tags:
-                # normalise tags
-                tag_name = tag_name.strip().lower()
-                if not tag_name:
-                    continue  # skip empty tag names
-                tag = db.query(Tag).filter(Tag.name == tag_name).first()
-                if not tag:  # if no tag entry in Tag table
-                    tag = Tag(name=tag_name)
-                    db.add(tag)
-                if tag not in db_task.tags:  # if tag not already in db_task.tags
-                    db_task.tags.append(tag)
-                    added.append(tag_name)
-            if added:
-                changes['added_tags'] = added
-        if delete_tags is not None:
-            deleted = []
-            for tag_name in delete_tags:
-                tag_name = tag_name.strip().lower()  # normalise tags
-                if not tag_name:
-                    continue  # skip empty tag names
-                tag = db.query(Tag).filter(Tag.name == tag_name).first()
-                if tag and tag in db_task.tags:
-                    db_task.tags.remove(tag)
-                    deleted.append(tag_name)
-            if deleted:
-                changes['deleted_tags'] = deleted
-        if links is not None:
-            added = []
-            for link_id in links:
-                task_to_link = get_task(int(link_id), db)
-                if task_to_link and task_to_link not in db_task.links:
-                    db_task.links.append(task_to_link)
-                    added.append(link_id)
-            if added:
-                changes['added_links'] = added
-        if delete_links is not None:
-            deleted = []
-            for link_id in delete_links:
-                task_to_unlink = get_task(int(link_id), db)
-                if task_to_unlink and task_to_unlink in db_task.links:
-                    db_task.links.remove(task_to_unlink)
-                    deleted.append(link_id)
-            if deleted:
-                changes['deleted_links'] = deleted
-
-        if parent is not None:
-            if parent == 0:  # if parent is set to 0, remove the parent link
-                if db_task.parent_id is not None:
-                    changes['parent'] = f'Removed parent {db_task.parent_id}'
-            else:  # is parent is set to task id
-                # A parent canntot be its own
-                if parent == db_task.id:
-                    return 'A task cannot be its own parent'
-
-                new_parent_task = get_task(parent, db)
-                if not new_parent_task:
-                    return f'Parent task {parent} not found'
-
-                if db_task.parent_id != parent:  # if the parent is different
-                    changes['parent'] = parent
-                    db_task.parent_id = parent
-
-        db.commit()
-        return f'Task {task_id} updated\n\
-            {changes}'
-    else:
-        return f'Task {task_id} not found in the database'
+    changes = {}  # field -> new value, for the output message
+    events = []  # (field, old value, new value) rows for the task_events journal
+
+    if not db_task:
+        return UpdateResult(task_id, False, {}, f'Task {task_id} not found in the database')
+    if parent:
+        # A task cannot be its own parent
+        if parent == db_task.id:
+            return UpdateResult(task_id, True, {}, 'A task cannot be its own parent')
+        if not get_task(parent, db):
+            return UpdateResult(task_id, True, {}, f'Parent task {parent} not found')
+        # nor one of its own subtasks, at any depth
+        if would_create_cycle(db_task.id, parent, db):
+            return UpdateResult(
+                task_id, True, {}, f'Task {parent} is a subtask of task {db_task.id}, it cannot be its parent'
+            )
+
+    if title is not None:
+        changes['title'] = title
+        events.append(('title', db_task.title, title))
+        db_task.title = title
+    if description is not None:
+        changes['description'] = description
+        events.append(('description', db_task.description, description))
+        db_task.description = description
+    if status is not None:
+        changes['status'] = status
+        events.append(('status', db_task.status, status))
+        db_task.status = status
+    if dueDate is not None:
+        changes['dueDate'] = dueDate
+        events.append(('dueDate', db_task.dueDate, dueDate))
+        db_task.dueDate = dueDate
+    if tags is not None:
+        added = []
+        for tag_name in tags:
+            # normalise tags
+            tag_name = tag_name.strip().lower()
+            if not tag_name:
+                continue  # skip empty tag names
+            tag = db.query(Tag).filter(Tag.name == tag_name).first()
+            if not tag:  # if no tag entry in Tag table
+                tag = Tag(name=tag_name)
+                db.add(tag)
+            if tag not in db_task.tags:  # if tag not already in db_task.tags
+                db_task.tags.append(tag)
+                added.append(tag_name)
+                events.append(('tags', None, tag_name))
+        if added:
+            changes['added_tags'] = added
+    if delete_tags is not None:
+        deleted = []
+        for tag_name in delete_tags:
+            tag_name = tag_name.strip().lower()  # normalise tags
+            if not tag_name:
+                continue  # skip empty tag names
+            tag = db.query(Tag).filter(Tag.name == tag_name).first()
+            if tag and tag in db_task.tags:
+                db_task.tags.remove(tag)
+                deleted.append(tag_name)
+                events.append(('tags', tag_name, None))
+        if deleted:
+            changes['deleted_tags'] = deleted
+    if links is not None:
+        added = []
+        for link_id in links:
+            task_to_link = get_task(int(link_id), db)
+            if task_to_link and task_to_link not in db_task.links:
+                db_task.links.append(task_to_link)
+                added.append(link_id)
+                events.append(('links', None, link_id))
+        if added:
+            changes['added_links'] = added
+    if delete_links is not None:
+        deleted = []
+        for link_id in delete_links:
+            task_to_unlink = get_task(int(link_id), db)
+            if task_to_unlink and task_to_unlink in db_task.links:
+                db_task.links.remove(task_to_unlink)
+                deleted.append(link_id)
+                events.append(('links', link_id, None))
+        if deleted:
+            changes['deleted_links'] = deleted
+
+    if parent is not None:
+        if parent == 0:  # if parent is set to 0, remove the parent link
+            if db_task.parent_id is not None:
+                changes['parent'] = f'Removed parent {db_task.parent_id}'
+                events.append(('parent', db_task.parent_id, None))
+                db_task.parent_id = None
+        else:  # is parent is set to task id, checked above
+            if db_task.parent_id != parent:  # if the parent is different
+                changes['parent'] = parent
+                events.append(('parent', db_task.parent_id, parent))
+                db_task.parent_id = parent
+
+    now = dt.datetime.now()
+    if changes:
+        # tag and link changes don't touch the tasks row, so bump updatedAt explicitly
+        db_task.updatedAt = now
+    _record_events(task_id, events, now, db)
+    db.commit()
+    if changes:
+        notify(
+            'updated',
+            task_id,
+            status=db_task.status,
+            added_links=changes.get('added_links', []),
+            deleted_links=changes.get('deleted_links', []),
+        )
+    return UpdateResult(task_id, True, changes, None)
+
+
+def update_task(
+    task_id: int,
+    title: Optional[str] = None,
+    description: Optional[str] = None,
+    status: Optional[str] = None,
+    tags: Optional[List[str]] = None,
+    delete_tags: Optional[List[str]] = None,
+    dueDate: Optional[dt.datetime] = None,
+    parent: Optional[int] = None,
+    links: Optional[List[int]] = None,
+    delete_links: Optional[List[int]] = None,
+    db: Session = None,
+) -> str:
+    """
+    Updates a task like edit_task, describing the outcome as a message
+
+    :return:
+        Output message
+    """
+    return edit_task(
+        task_id, title, description, status, tags, delete_tags, dueDate, parent, links, delete_links, db
+    ).message
+
+
+def _journal_value(column):
+    """
+    SQL expression for a column's value as written to the journal, matching _event_value's str() of the Python value
+    """
+    if column is Task.dueDate:
+        return func.strftime('%Y-%m-%d %H:%M:%S', column)
+    return column
+
+
+def bulk_update(
+    values: Dict[str, Any],
+    db: Session,
+    task_ids: Optional[Iterable[int]] = None,
+    status: Optional[str] = None,
+    tags: Optional[List[str]] = None,
+    tags_all: Optional[List[str]] = None,
+    tags_none: Optional[List[str]] = None,
+) -> List[int]:
+    """
+    Set fields on every task matching an id list and / or the list filters, with one UPDATE statement
+    The old values go to the task_events journal with one INSERT ... SELECT per field, and the status / due date
+    counters are kept by their triggers. Only tasks with a value that actually changes are updated (and get a new
+    updatedAt), like update_task.
+
+    :param values:
+        Field -> new value, fields from BULK_UPDATE_FIELDS
+    :param db:
+        SQLAlchemy database session
+    :param task_ids:
+        Only update these tasks (optional), passed as one JSON parameter so any number of ids is fine
+    :param status:
+        Only update tasks with this status (optional)
+    :param tags:
+        Only update tasks with any of these tags (optional)
+    :param tags_all:
+        Only update tasks with every one of these tags (optional)
+    :param tags_none:
+        Leave out tasks with any of these tags (optional)
 
+    :return:
+        IDs of the updated tasks
 
-def delete_task(task_id: int, db: Session) -> str:
+    :raises ValueError:
+        If there are no values, or a field can't be bulk updated
     """
-    Deletes a task
+    if not values:
+        raise ValueError('Nothing to update')
+    unknown = set(values) - set(BULK_UPDATE_FIELDS)
+    if unknown:
+        raise ValueError(f'Cannot bulk update {", ".join(sorted(unknown))}')
+
+    def matching(statement):
+        return _match_tasks(statement, task_ids, status, tags, tags_all, tags_none)
+
+    now = dt.datetime.now()
+    columns = {field: getattr(Task, field) for field in values}
+
+    # STEP 1: Journal the old values of the rows that will change, before they are overwritten
+    for field, column in columns.items():
+        db.execute(
+            insert(TaskEvent).from_select(
+                ['task_id', 'field', 'old_value', 'new_value', 'createdAt'],
+                matching(
+                    select(
+                        Task.id,
+                        literal(field),
+                        _journal_value(column),
+                        literal(_event_value(values[field])),
+                        literal(now, TaskEvent.createdAt.type),
+                    )
+                ).where(column.is_not(values[field])),
+            )
+        )
+
+    # STEP 2: One UPDATE for every matching task with something to change
+    updated_ids = db.scalars(
+        matching(update(Task))
+        .where(or_(*(column.is_not(values[field]) for field, column in columns.items())))
+        .values(updatedAt=now, **values)
+        .returning(Task.id)
+        .execution_options(synchronize_session=False)  # see _expire_updated
+    ).all()
+    _expire_updated(db, updated_ids, [*values, 'updatedAt'])
+    db.commit()
+
+    details = {'status': values['status']} if 'status' in values else {}
+    for task_id in updated_ids:
+        notify('updated', task_id, **details)
+    return sorted(updated_ids)
+
+
+def delete_task(task_id: int, db: Session, subtree: bool = False) -> str:
+    """
+    Deletes a task, its tags and links go with it (ON DELETE CASCADE)
 
     :param task_id:
         The id of the task to be deleted
     :param db:
         SQLAlchemy database session
+    :param subtree:
+        Also delete its subtasks at any depth, otherwise they become top-level tasks (ON DELETE SET NULL)
 
     :return:
         Output message
     """
-    db_task = get_task(task_id, db)
-    if db_task:
-        db.delete(db_task)
-        db.commit()
-        return f'Task {task_id} deleted'
-    else:
+    deleted_ids = delete_tasks(db, task_ids=[task_id], subtree=subtree)
+    if not deleted_ids:
         return f'Task {task_id} not found in the database'
+    if len(deleted_ids) > 1:
+        return f'Task {task_id} and {len(deleted_ids) - 1} subtasks deleted'
+    return f'Task {task_id} deleted'
+
+
+def delete_tasks(
+    db: Session,
+    task_ids: Optional[Iterable[int]] = None,
+    status: Optional[str] = None,
+    tags: Optional[List[str]] = None,
+    tags_all: Optional[List[str]] = None,
+    tags_none: Optional[List[str]] = None,
+    subtree: bool = False,
+) -> List[int]:
+    """
+    Delete every task matching an id list and / or the list filters, with one DELETE statement
+    The database does the rest with its ON DELETE actions: the task_tags / task_links rows of deleted tasks are
+    removed, and their subtasks become top-level. Nothing is loaded into the session first.
+    The surviving tasks those actions change (subtasks, tasks linking to a deleted one) get a new updatedAt first,
+    as update_task would give them, so tasks_version sees the change.
+
+    :param db:
+        SQLAlchemy database session
+    :param task_ids:
+        Only delete these tasks (optional)
+    :param status:
+        Only delete tasks with this status (optional)
+    :param tags:
+        Only delete tasks with any of these tags (optional)
+    :param tags_all:
+        Only delete tasks with every one of these tags (optional)
+    :param tags_none:
+        Leave out tasks with any of these tags (optional)
+    :param subtree:
+        Also delete the subtasks of every matching task, at any depth, found with one recursive CTE
+
+    :return:
+        IDs of the deleted tasks
+
+    :raises ValueError:
+        If there are no ids or filters, so a bare call can't empty the table
+    """
+    # tag lists that normalise to nothing are no filter (see _filter_tasks), so they don't count as one here
+    if task_ids is None and not any((status, *map(normalise_tags, (tags, tags_all, tags_none)))):
+        raise ValueError('Give task ids or a filter to delete by')
+
+    targets = _match_tasks(select(Task.id), task_ids, status, tags, tags_all, tags_none)
+    if subtree:
+        targets = select(_subtree_cte(targets).c.id)
+
+    # STEP 1: Touch the tasks that lose their parent or a link, before the ON DELETE actions change them
+    linking = select(task_links.c.task_id).where(task_links.c.linked_task_id.in_(targets))
+    db.execute(
+        update(Task)
+        .where(or_(Task.parent_id.in_(targets), Task.id.in_(linking)), Task.id.not_in(targets))
+        .values(updatedAt=dt.datetime.now())
+        .execution_options(synchronize_session=False)  # expired by _forget_deleted
+    )
+
+    # STEP 2: One DELETE, the database cascades to tags and links
+    deleted_ids = db.scalars(
+        delete(Task)
+        .where(Task.id.in_(targets))
+        .returning(Task.id)
+        .execution_options(synchronize_session=False)  # the session is brought in line below
+    ).all()
+    _forget_deleted(db, deleted_ids)
+    db.commit()
+
+    for task_id in deleted_ids:
+        notify('deleted', task_id)
+    return sorted(deleted_ids)
+
+
+def _forget_deleted(db: Session, deleted_ids: List[int]) -> None:
+    """
+    Bring the session in line with a DELETE run in SQL: deleted tasks leave the identity map, and the relationships
+    of the loaded tasks and tags are expired, as the ON DELETE actions may have changed them behind its back
+    """
+    deleted = set(deleted_ids)
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, Task):
+            if inspect(obj).identity[0] in deleted:  # from the identity key, so an expired object isn't refreshed
+                db.expunge(obj)
+            else:
+                db.expire(obj, ['parent_id', 'parent', 'subtasks', 'links', '_links_reverse', 'updatedAt'])
+        elif isinstance(obj, Tag):
+            db.expire(obj, ['tasks'])
+
+
+def _expire_updated(db: Session, updated_ids: List[int], fields: List[str]) -> None:
+    """
+    Bring the session in line with an UPDATE run in SQL: the changed fields of the loaded updated tasks are expired,
+    as a session with expire_on_commit=False (e.g. the CLI's persistent session) would keep the old values
+    """
+    updated = set(updated_ids)
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, Task) and inspect(obj).identity[0] in updated:
+            db.expire(obj, fields)
+
+
+def _tag_ids(tags: List[str]):
+    """
+    Subquery of the ids of the named tags, an index lookup on tags.name
+    """
+    return select(Tag.id).where(Tag.name.in_(normalise_tags(tags)))
+
+
+def _match_tasks(
+    statement,
+    task_ids: Optional[Iterable[int]] = None,
+    status: Optional[str] = None,
+    tags: Optional[List[str]] = None,
+    tags_all: Optional[List[str]] = None,
+    tags_none: Optional[List[str]] = None,
+):
+    """
+    Apply an id list and the list filters to a Task select / update / delete
+    The ids are passed as one JSON parameter read with json_each, so any number of ids is fine
+    """
+    statement = _filter_tasks(statement, status, tags, tags_all, tags_none)
+    if task_ids is not None:
+        ids = func.json_each(json.dumps(sorted(set(task_ids)))).table_valued('value')
+        statement = statement.where(Task.id.in_(select(ids.c.value)))
+    return statement
+
+
+def _filter_tasks(
+    query,
+    status: Optional[str] = None,
+    tags: Optional[List[str]] = None,
+    tags_all: Optional[List[str]] = None,
+    tags_none: Optional[List[str]] = None,
+):
+    """
+    Apply the list filters to a Task query
+    The tag filters start from the named tags and walk the task_tags (tag_id, task_id) index, so their cost
+    follows the number of tagged tasks, not the size of the tasks table
+
+    :param query:
+        Query targeting the Task model
+    :param status:
+        Only keep tasks with this status (optional)
+    :param tags:
+        Only keep tasks with any of these tags (optional)
+    :param tags_all:
+        Only keep tasks with every one of these tags (optional)
+    :param tags_none:
+        Leave out tasks with any of these tags (optional)
+    """
+    # a tag filter that normalises to no tags (e.g. --tags-all " ") is no filter, not an empty IN ()
+    tags, tags_all, tags_none = normalise_tags(tags), normalise_tags(tags_all), normalise_tags(tags_none)
+    if status:
+        query = query.filter(Task.status == status)  # filter by status
+    if tags:
+        tagged_ids = select(task_tags.c.task_id).where(
+            task_tags.c.tag_id.in_(_tag_ids(tags))
+        )  # a subquery rather than a join, so no DISTINCT is needed
+        query = query.filter(Task.id.in_(tagged_ids))
+    if tags_all:
+        # tasks with a task_tags row for each of the tags; (task_id, tag_id) is unique, so the count is exact
+        with_all_ids = (
+            select(task_tags.c.task_id)
+            .where(task_tags.c.tag_id.in_(_tag_ids(tags_all)))
+            .group_by(task_tags.c.task_id)
+            .having(func.count() == len(tags_all))
+        )
+        query = query.filter(Task.id.in_(with_all_ids))
+    if tags_none:
+        # anti-join: no task_tags row links the task to any of the tags
+        query = query.filter(
+            ~select(task_tags.c.task_id)
+            .where(task_tags.c.task_id == Task.id, task_tags.c.tag_id.in_(_tag_ids(tags_none)))
+            .exists()
+        )
+    return query
 
 
 def list_tasks(
-    db: Session, status: Optional[str] = None, tags: Optional[List[str]] = None
+    db: Session,
+    status: Optional[str] = None,
+    tags: Optional[List[str]] = None,
+    tags_all: Optional[List[str]] = None,
+    tags_none: Optional[List[str]] = None,
+    load: Optional[Iterable[str]] = None,
+    sort: str = 'id',
+    desc: bool = False,
+    limit: Optional[int] = None,
 ) -> List[Task]:
     """
     Lists all the tasks, filtered by status
 
     :param status:
         The status of the tasks to be listed
+    :param tags:
+        Only list tasks with any of these tags (optional)
+    :param tags_all:
+        Only list tasks with every one of these tags (optional)
+    :param tags_none:
+        Leave out tasks with any of these tags (optional)
+    :param load:
+        Names of relationships the caller will read (keys of LOAD_OPTIONS), eager loaded so that
+        reading them doesn't cost a query per task (optional)
+    :param sort:
+        Sort key, one of SORT_COLUMNS
+    :param desc:
+        Sort from the highest value down
+    :param limit:
+        Only the first limit tasks, e.g. the next 20 due (optional)
     :param db:
         SQLAlchemy database session
 
     :return:
         The tasks in the database
     """
+    if limit is not None or SORT_COLUMNS[sort].nullable:
+        # ORDER BY ... LIMIT through the keyset pages, which also keep tasks without a due date last
+        tasks = iter_tasks(
+            db, status, tags, tags_all, tags_none, load, sort, desc, chunk_size=limit or STREAM_CHUNK_SIZE
+        )
+        return list(islice(tasks, limit))
     query = db.query(Task)  # query targeting Task model
+    if load:
+        query = query.options(*(LOAD_OPTIONS[field] for field in load))
+    query = _filter_tasks(query, status, tags, tags_all, tags_none)
+    return query.order_by(*_sort_order(sort, desc)).all()  # return the query
+
+
+def _split_group(value: Optional[str]) -> List[str]:
+    """
+    Split a group_concat value back into its items, NULL (no rows) is an empty list
+    """
+    return value.split(GROUP_SEPARATOR) if value else []
+
+
+def _task_row_select():
+    """
+    Core select of the TaskRow columns, with tag names (in tag id order) and linked task titles and ids (in id order)
+    aggregated by correlated subqueries, and the parent title from an outer join
+    """
+    parent = aliased(Task)
+    linked = aliased(Task)
+    tag_names = (
+        select(Tag.name.label('name'))
+        .join(task_tags, task_tags.c.tag_id == Tag.id)
+        .where(task_tags.c.task_id == Task.id)
+        .order_by(Tag.id)
+        .correlate(Task)
+        .subquery()
+    )
+    link_titles = (
+        select(linked.title.label('title'), linked.id.label('id'))
+        .join(task_links, task_links.c.linked_task_id == linked.id)
+        .where(task_links.c.task_id == Task.id)
+        .order_by(linked.id)
+        .correlate(Task)
+        .subquery()
+    )
+    return select(
+        Task.id,
+        Task.title,
+        Task.description,
+        Task.status,
+        Task.dueDate,
+        Task.createdAt,
+        Task.updatedAt,
+        Task.parent_id,
+        parent.title.label('parent_title'),
+        select(func.group_concat(tag_names.c.name, GROUP_SEPARATOR)).scalar_subquery().label('tag_names'),
+        select(func.group_concat(link_titles.c.title, GROUP_SEPARATOR)).scalar_subquery().label('link_titles'),
+        select(func.group_concat(link_titles.c.id, GROUP_SEPARATOR)).scalar_subquery().label('link_ids'),
+    ).outerjoin(parent, parent.id == Task.parent_id)
+
+
+def _task_rows(db: Session, statement) -> List[TaskRow]:
+    """
+    Run a _task_row_select statement, splitting the aggregated columns into lists
+    """
+    return [
+        TaskRow(
+            *row[:9],
+            _split_group(row.tag_names),
+            _split_group(row.link_titles),
+            [int(link_id) for link_id in _split_group(row.link_ids)],
+        )
+        for row in db.execute(statement)
+    ]
+
+
+def list_task_rows(
+    db: Session,
+    status: Optional[str] = None,
+    tags: Optional[List[str]] = None,
+    tags_all: Optional[List[str]] = None,
+    tags_none: Optional[List[str]] = None,
+    sort: str = 'id',
+    desc: bool = False,
+    limit: Optional[int] = None,
+) -> List[TaskRow]:
+    """
+    Lists tasks like list_tasks, as read-only TaskRow tuples from a single query (tags, links and parent included)
+
+    :param status:
+        The status of the tasks to be listed (optional)
+    :param tags:
+        Only list tasks with any of these tags (optional)
+    :param tags_all:
+        Only list tasks with every one of these tags (optional)
+    :param tags_none:
+        Leave out tasks with any of these tags (optional)
+    :param sort:
+        Sort key, one of SORT_COLUMNS
+    :param desc:
+        Sort from the highest value down
+    :param limit:
+        Only the first limit tasks (optional)
+    :param db:
+        SQLAlchemy database session
+    """
+    if limit is not None or SORT_COLUMNS[sort].nullable:
+        rows = iter_task_rows(
+            db, status, tags, tags_all, tags_none, sort, desc, chunk_size=limit or STREAM_CHUNK_SIZE
+        )
+        return list(islice(rows, limit))
+    statement = _filter_tasks(_task_row_select(), status, tags, tags_all, tags_none)
+    return _task_rows(db, statement.order_by(*_sort_order(sort, desc)))
+
+
+def get_task_row(task_id: int, db: Session) -> Optional[TaskRow]:
+    """
+    Retrieve a task by its ID as a read-only TaskRow, in one query (tags, links and parent included)
+
+    :param task_id:
+        ID of task to get
+    :param db:
+        SQLAlchemy database session
+    """
+    rows = _task_rows(db, _task_row_select().where(Task.id == task_id))
+    return rows[0] if rows else None
+
+
+def tasks_version(
+    db: Session,
+    status: Optional[str] = None,
+    tags: Optional[List[str]] = None,
+    tags_all: Optional[List[str]] = None,
+    tags_none: Optional[List[str]] = None,
+) -> Tuple[int, Optional[dt.datetime], Optional[int]]:
+    """
+    Cheap fingerprint of the tasks matching the list filters, for conditional requests (ETag / Last-Modified)
+    Any add, update or delete of a matching task changes at least one of the values
+
+    :param status:
+        The status of the tasks to be listed (optional)
+    :param tags:
+        Only count tasks with any of these tags (optional)
+    :param tags_all:
+        Only count tasks with every one of these tags (optional)
+    :param tags_none:
+        Leave out tasks with any of these tags (optional)
+    :param db:
+        SQLAlchemy database session
+
+    :return:
+        (number of tasks, latest updatedAt, highest id)
+    """
+    query = _filter_tasks(
+        db.query(func.count(Task.id), func.max(Task.updatedAt), func.max(Task.id)),
+        status,
+        tags,
+        tags_all,
+        tags_none,
+    )
+    count, last_updated, max_id = query.one()
+    return count, last_updated, max_id
+
+
+def iter_tasks(
+    db: Session,
+    status: Optional[str] = None,
+    tags: Optional[List[str]] = None,
+    tags_all: Optional[List[str]] = None,
+    tags_none: Optional[List[str]] = None,
+    load: Optional[Iterable[str]] = None,
+    sort: str = 'id',
+    desc: bool = False,
+    after: Optional[int] = None,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+) -> Iterator[Task]:
+    """
+    Streams tasks in pages of chunk_size, using keyset pagination on (sort key, id) so that
+    only one page is in memory at a time and each page is an indexed seek, not an OFFSET scan
+
+    :param status:
+        The status of the tasks to be listed (optional)
+    :param tags:
+        Only list tasks with any of these tags (optional)
+    :param tags_all:
+        Only list tasks with every one of these tags (optional)
+    :param tags_none:
+        Leave out tasks with any of these tags (optional)
+    :param load:
+        Names of relationships to eager load, see list_tasks (optional)
+    :param sort:
+        Sort key, one of SORT_COLUMNS
+    :param desc:
+        Sort from the highest value down
+    :param after:
+        ID of the last task already seen, streaming resumes after it (optional)
+    :param chunk_size:
+        Number of tasks fetched per query
+    :param db:
+        SQLAlchemy database session
+
+    :return:
+        Iterator of Task objects in (sort key, id) order, tasks without a value of the sort key last
+
+    :raises ValueError:
+        If chunk_size is less than 1
+    """
+    _check_chunk_size(chunk_size)
+    query = db.query(Task)
+    if load:
+        query = query.options(*(LOAD_OPTIONS[field] for field in load))
+    query = _filter_tasks(query, status, tags, tags_all, tags_none)
+    return _keyset_pages(db, query, lambda page: page.all(), sort, desc, after, chunk_size)
+
+
+def iter_task_rows(
+    db: Session,
+    status: Optional[str] = None,
+    tags: Optional[List[str]] = None,
+    tags_all: Optional[List[str]] = None,
+    tags_none: Optional[List[str]] = None,
+    sort: str = 'id',
+    desc: bool = False,
+    after: Optional[int] = None,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+) -> Iterator[TaskRow]:
+    """
+    Streams tasks like iter_tasks, as read-only TaskRow tuples (one query per page, tags, links and parent included)
+
+    :param status:
+        The status of the tasks to be listed (optional)
+    :param tags:
+        Only list tasks with any of these tags (optional)
+    :param tags_all:
+        Only list tasks with every one of these tags (optional)
+    :param tags_none:
+        Leave out tasks with any of these tags (optional)
+    :param sort:
+        Sort key, one of SORT_COLUMNS
+    :param desc:
+        Sort from the highest value down
+    :param after:
+        ID of the last task already seen, streaming resumes after it (optional)
+    :param chunk_size:
+        Number of tasks fetched per query
+    :param db:
+        SQLAlchemy database session
+
+    :return:
+        Iterator of TaskRow tuples in (sort key, id) order, tasks without a value of the sort key last
+
+    :raises ValueError:
+        If chunk_size is less than 1
+    """
+    _check_chunk_size(chunk_size)
+    statement = _filter_tasks(_task_row_select(), status, tags, tags_all, tags_none)
+    return _keyset_pages(db, statement, lambda page: _task_rows(db, page), sort, desc, after, chunk_size)
+
+
+def _check_chunk_size(chunk_size: int) -> None:
+    """
+    Raise ValueError unless chunk_size is a usable page size (0 would stop after an empty page, a negative one is
+    no LIMIT at all in SQLite)
+    """
+    if chunk_size < 1:
+        raise ValueError(f'chunk_size must be at least 1, not {chunk_size}')
+
+
+def _sort_order(sort: str, desc: bool) -> Tuple[Any, Any]:
+    """
+    ORDER BY clauses of a sort key, with the id breaking ties in the same direction (so an index serves both)
+    """
+    sort_column = SORT_COLUMNS[sort]
+    return (sort_column.desc(), Task.id.desc()) if desc else (sort_column, Task.id)
+
+
+def _keyset_pages(
+    db: Session,
+    query,
+    fetch: Callable[[Any], List[Any]],
+    sort: str,
+    desc: bool,
+    after: Optional[int],
+    chunk_size: int,
+) -> Iterator[Any]:
+    """
+    Keyset pagination on (sort key, id) shared by iter_tasks and iter_task_rows
+    A nullable sort key is paged in two runs, the tasks with a value and then those without (by id), so both are
+    read in index order and tasks without a value come last whichever the direction
+
+    :param query:
+        Filtered Task query or select()
+    :param fetch:
+        Runs one page of the query, returning objects with the sort key's attribute and an id
+    """
+    sort_column = SORT_COLUMNS[sort]
+    later = operator.lt if desc else operator.gt  # whether a value comes after another one in this order
+    query = query.order_by(*_sort_order(sort, desc))
+    if sort_column.nullable:
+        runs = [(False, query.filter(sort_column.isnot(None))), (True, query.filter(sort_column.is_(None)))]
+    else:
+        runs = [(False, query)]
+
+    cursor = None  # (sort value, id) of the last task yielded
+    if after is not None:
+        resume = db.execute(select(sort_column).where(Task.id == after)).first()
+        if resume is None:
+            return  # nothing to resume from
+        cursor = (resume[0], after)
+
+    for nulls, run in runs:
+        if cursor is not None and (cursor[0] is None) != nulls:
+            if nulls:
+                cursor = None  # every task with a value has been seen, the tasks without one start from the top
+            else:
+                continue  # resuming among the tasks without a value
+        while True:
+            page = run
+            if cursor:
+                value, last_id = cursor
+                if value is None:
+                    page = page.filter(later(Task.id, last_id))
+                else:
+                    page = page.filter(
+                        or_(later(sort_column, value), and_(sort_column == value, later(Task.id, last_id)))
+                    )
+            chunk = fetch(page.limit(chunk_size))
+            yield from chunk
+            if len(chunk) < chunk_size:
+                break
+            cursor = (getattr(chunk[-1], sort_column.key), chunk[-1].id)
+
+
+# HIERARCHY (parent / subtasks)
+def _path_segment(task_id):
+    """
+    Fixed width path segment for a task id, so paths sort depth-first and a segment can't match inside another one
+    """
+    return func.printf('%010d', task_id)
+
+
+def _subtree_cte(task_id: Union[int, Select], max_depth: Optional[int] = None):
+    """
+    Recursive CTE of (id, depth, path) for a task and its subtasks
+    Each row carries its path from the root, so a branch that loops back (a parent cycle) is cut off
+    task_id can also be a select of task ids, giving the subtrees of all of them
+    """
+    tree = (
+        select(Task.id.label('id'), literal(0).label('depth'), _path_segment(Task.id).label('path'))
+        .where(Task.id.in_(task_id) if isinstance(task_id, Select) else Task.id == task_id)
+        .cte('subtree', recursive=True)
+    )
+    child = aliased(Task)
+    step = select(
+        child.id, tree.c.depth + 1, tree.c.path + '/' + _path_segment(child.id)
+    ).where(
+        child.parent_id == tree.c.id,
+        func.instr(tree.c.path, _path_segment(child.id)) == 0,  # not already on this branch
+    )
+    if max_depth is not None:
+        step = step.where(tree.c.depth < max_depth)
+    return tree.union_all(step)
+
+
+def get_subtree(
+    task_id: int,
+    db: Session,
+    max_depth: Optional[int] = None,
+    status: Optional[str] = None,
+) -> List[Tuple[Task, int]]:
+    """
+    Get a task and all of its subtasks, at any depth, with one recursive CTE query
+
+    :param task_id:
+        ID of the root task
+    :param max_depth:
+        Only go this many levels below the root (optional)
+    :param status:
+        Only return tasks with this status, the rest of the tree is still walked (optional)
+    :param db:
+        SQLAlchemy database session
+
+    :return:
+        (task, depth) pairs in depth-first order, the root has depth 0. Empty if the task doesn't exist
+    """
+    tree = _subtree_cte(task_id, max_depth)
+    query = select(Task, tree.c.depth).join(tree, Task.id == tree.c.id).order_by(tree.c.path)
     if status:
-        query = query.filter(Task.status == status)  # filter by status
-    if tags:
-        normalised_tags = [tag.strip().lower() for tag in tags if tag.strip()]
-        query = (
-            query.join(task_tags)
-            .join(Tag)
-            .filter(Tag.name.in_(normalised_tags))
-            .distinct()
+        query = query.where(Task.status == status)
+    return [(task, depth) for task, depth in db.execute(query)]
+
+
+def get_ancestors(task_id: int, db: Session) -> List[Tuple[Task, int]]:
+    """
+    Get the chain of parents of a task up to its top-level task, with one recursive CTE query
+
+    :param task_id:
+        ID of the task
+    :param db:
+        SQLAlchemy database session
+
+    :return:
+        (task, depth) pairs, nearest first - the parent has depth 1, its parent depth 2, ...
+    """
+    chain = (
+        select(
+            Task.parent_id.label('id'),
+            literal(1).label('depth'),
+            (_path_segment(Task.id) + '/' + _path_segment(Task.parent_id)).label('path'),
+        )
+        .where(Task.id == task_id, Task.parent_id.isnot(None))
+        .cte('ancestors', recursive=True)
+    )
+    parent = aliased(Task)
+    chain = chain.union_all(
+        select(
+            parent.parent_id, chain.c.depth + 1, chain.c.path + '/' + _path_segment(parent.parent_id)
+        ).where(
+            parent.id == chain.c.id,
+            parent.parent_id.isnot(None),
+            func.instr(chain.c.path, _path_segment(parent.parent_id)) == 0,  # stop at a cycle
         )
-    return query.all()  # return the query
+    )
+    query = select(Task, chain.c.depth).join(chain, Task.id == chain.c.id).order_by(chain.c.depth)
+    return [(task, depth) for task, depth in db.execute(query)]
+
+
+def would_create_cycle(task_id: int, parent: int, db: Session) -> bool:
+    """
+    Check whether making `parent` the parent of `task_id` would create a loop in the hierarchy
+
+    :param task_id:
+        ID of the task being moved
+    :param parent:
+        ID of the proposed parent
+    :param db:
+        SQLAlchemy database session
+    """
+    if parent == task_id:
+        return True
+    return any(task.id == task_id for task, _ in get_ancestors(parent, db))
+
+
+def subtree_rollup(task_id: int, db: Session) -> Dict[str, Any]:
+    """
+    Roll up the progress of all of a task's subtasks (at any depth)
+
+    :param task_id:
+        ID of the root task
+    :param db:
+        SQLAlchemy database session
+
+    :return:
+        Dictionary with the number of subtasks in total, per status, and the percentage done
+    """
+    tree = _subtree_cte(task_id)
+    query = (
+        select(Task.status, func.count())
+        .join(tree, Task.id == tree.c.id)
+        .where(tree.c.depth > 0)
+        .group_by(Task.status)
+    )
+    by_status = {status: count for status, count in db.execute(query)}
+    total = sum(by_status.values())
+    done = by_status.get('done', 0)
+    return {
+        'total': total,
+        'by_status': by_status,
+        'percent_done': round(100 * done / total, 1) if total else 0.0,
+    }
+
+
+# SEARCH
+def _fts_query(query: str, prefix: bool = True) -> str:
+    """
+    Turn free text into an FTS5 query: every word must match, quoted so punctuation can't be read as syntax
+
+    :param query:
+        Words to search for
+    :param prefix:
+        Match words starting with each term (e.g. 'rep' finds 'report')
+    """
+    terms = [term.replace('"', '') for term in query.split()]
+    return ' '.join(f'"{term}"' + ('*' if prefix else '') for term in terms if term)
+
+
+def search_tasks(query: str, db: Session, limit: int = 20, prefix: bool = True) -> List[SearchHit]:
+    """
+    Full text search over task titles and descriptions, best matches first (bm25, title matches weigh more)
+
+    :param query:
+        Words to search for, all must match
+    :param limit:
+        Maximum number of results
+    :param prefix:
+        Treat each word as a prefix
+    :param db:
+        SQLAlchemy database session
+
+    :return:
+        List of SearchHit
+    """
+    match = _fts_query(query, prefix)
+    if not match:
+        return []
+    rows = db.execute(
+        text(
+            "SELECT tasks_fts.rowid, highlight(tasks_fts, 0, '[', ']'), "
+            "snippet(tasks_fts, 1, '[', ']', '...', 12), tasks.status, bm25(tasks_fts, 10.0, 1.0) AS rank "
+            'FROM tasks_fts JOIN tasks ON tasks.id = tasks_fts.rowid '
+            'WHERE tasks_fts MATCH :match ORDER BY rank LIMIT :limit'
+        ),
+        {'match': match, 'limit': limit},
+    )
+    return [
+        SearchHit(id=task_id, title=title, snippet=snippet or None, status=status, rank=rank)
+        for task_id, title, snippet, status, rank in rows
+    ]
+
+
+# CALENDAR
+def month_window(year: int, month: int) -> Tuple[dt.date, dt.date]:
+    """
+    First day of a month, and first day of the next month (end is exclusive)
+    """
+    days = calendar.monthrange(year, month)[1]
+    start = dt.date(year, month, 1)
+    return start, start + dt.timedelta(days=days)
+
+
+def week_window(day: dt.date) -> Tuple[dt.date, dt.date]:
+    """
+    Monday of the week containing day, and the following Monday (end is exclusive)
+    """
+    start = day - dt.timedelta(days=day.weekday())
+    return start, start + dt.timedelta(days=7)
+
+
+def calendar_days(start: dt.date, end: dt.date, db: Session) -> List[Dict[str, Any]]:
+    """
+    Tasks due in a date window, grouped by day - one range query on the dueDate index, grouped in SQL,
+    with each day's task summaries aggregated into a JSON array
+
+    :param start:
+        First day of the window
+    :param end:
+        Day after the last day of the window
+    :param db:
+        SQLAlchemy database session
+
+    :return:
+        One dictionary per day with tasks due: {'date': 'YYYY-MM-DD', 'count': n, 'tasks': [{'id', 'title', 'status'}]}
+    """
+    day = func.date(Task.dueDate)
+    query = (
+        select(
+            day.label('day'),
+            func.count(),
+            func.json_group_array(
+                func.json_object('id', Task.id, 'title', Task.title, 'status', Task.status)
+            ),
+        )
+        .where(
+            Task.dueDate >= dt.datetime.combine(start, dt.time()),
+            Task.dueDate < dt.datetime.combine(end, dt.time()),
+        )
+        .group_by(day)
+        .order_by(day)
+    )
+    return [
+        {'date': date, 'count': count, 'tasks': json.loads(tasks)}
+        for date, count, tasks in db.execute(query)
+    ]
+
+
+# STATS
+def get_stats(db: Session, today: Optional[dt.date] = None) -> Dict[str, Any]:
+    """
+    Task counts per status, per tag, and open tasks per due bucket, read from the trigger maintained
+    task_counts table - its size depends on the number of statuses / tags / due days, not the number of tasks
+
+    :param today:
+        Date the due buckets are relative to, defaults to today
+    :param db:
+        SQLAlchemy database session
+
+    :return:
+        Dictionary with 'total', 'status' and 'tags' counts, and 'due' counts of open tasks that are
+        'overdue', due 'today' or 'upcoming'
+    """
+    today = (today or dt.date.today()).isoformat()
+    stats = {'total': 0, 'status': {}, 'tags': {}, 'due': {'overdue': 0, 'today': 0, 'upcoming': 0}}
+    for kind, key, count in db.execute(select(task_counts)):
+        if kind == 'status':
+            stats['status'][key] = count
+            stats['total'] += count
+        elif kind == 'tag':
+            stats['tags'][key] = count
+        elif kind == 'due':
+            bucket = 'overdue' if key < today else 'today' if key == today else 'upcoming'
+            stats['due'][bucket] += count
+    return stats
+
+
+def verify_stats(db: Session) -> Dict[Tuple[str, str], Tuple[int, int]]:
+    """
+    Compare the maintained counts with counts computed from scratch
+
+    :param db:
+        SQLAlchemy database session
+
+    :return:
+        {(kind, key): (stored count, actual count)} for every count that is wrong, empty if all are right
+    """
+    stored = {(kind, key): count for kind, key, count in db.execute(select(task_counts))}
+    actual = {(kind, key): count for kind, key, count in db.execute(text(COUNTS_QUERY))}
+    return {
+        key: (stored.get(key, 0), actual.get(key, 0))
+        for key in stored.keys() | actual.keys()
+        if stored.get(key, 0) != actual.get(key, 0)
+    }
+
+
+def rebuild_stats(db: Session) -> str:
+    """
+    Recompute the maintained counts from scratch, e.g. after the tables were edited with the triggers off
+
+    :param db:
+        SQLAlchemy database session
+
+    :return:
+        Output message
+    """
+    rebuild_counts(db.connection())
+    db.commit()
+    return 'Stats rebuilt'
+
+
+# HISTORY
+def get_events(
+    db: Session,
+    task_id: Optional[int] = None,
+    field: Optional[str] = None,
+    since: Optional[dt.datetime] = None,
+    until: Optional[dt.datetime] = None,
+    limit: Optional[int] = None,
+) -> List[TaskEvent]:
+    """
+    Query the change journal, oldest first. Filtering by task or by field (e.g. every status change, for
+    cycle times) and a time range uses the (task_id, createdAt) and (field, createdAt) indexes
+
+    :param task_id:
+        Only changes to this task (optional)
+    :param field:
+        Only changes to this field: title, description, status, dueDate, tags, links or parent (optional)
+    :param since:
+        Only changes at or after this time (optional)
+    :param until:
+        Only changes before this time (optional)
+    :param limit:
+        Maximum number of events (optional)
+    :param db:
+        SQLAlchemy database session
+
+    :return:
+        TaskEvent objects
+    """
+    query = select(TaskEvent)
+    if task_id is not None:
+        query = query.where(TaskEvent.task_id == task_id)
+    if field:
+        query = query.where(TaskEvent.field == field)
+    if since:
+        query = query.where(TaskEvent.createdAt >= since)
+    if until:
+        query = query.where(TaskEvent.createdAt < until)
+    query = query.order_by(TaskEvent.createdAt, TaskEvent.id)
+    if limit:
+        query = query.limit(limit)
+    return list(db.scalars(query))
@@ -0,0 +1,306 @@
+"""
+Dependency graph over task links
+
+A link task -> linked task means the task depends on the linked task: it can start once every task it links to is done.
+The edges and statuses are loaded once (two queries) into adjacency sets, then kept current through the core change
+listeners, so queries never rescan the tables.
+
+A long-lived process keeps one attached graph (the CLI's persistent session, the API module) and calls sync() before
+reading it. That reloads the graph only when it can't have been told about a change: on first use, after a rolled
+back change ('reset' event), or when another connection wrote to the database (PRAGMA data_version, as in
+task_tracker.cache).
+"""
+from collections import defaultdict, deque
+from typing import Any, Dict, List, Optional, Set
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from task_tracker.core import add_listener, remove_listener
+from task_tracker.models import Task, task_links
+import threading
+import weakref
+
+
+DONE = 'done'
+VERSIONS_KEY = 'dependency_graph_data_version'  # connection info entry, graph -> data_version it last saw there
+
+
+class DependencyGraph:
+    """
+    In-memory directed graph of task links, with the status of every task
+
+    A count of not-done dependencies is kept per task, so the ready queue is maintained incrementally
+    Thread safe, as the API serves requests from threads
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._pool = None  # weak reference to the pool (database) the graph was loaded from, None until loaded
+        self._stale = False  # set by a 'reset' event, reload on the next sync
+        self.status: Dict[int, Optional[str]] = {}  # task id -> status
+        self.depends_on: Dict[int, Set[int]] = defaultdict(set)  # task id -> ids it links to
+        self.dependents: Dict[int, Set[int]] = defaultdict(set)  # task id -> ids linking to it
+        self.blocking: Dict[int, int] = defaultdict(int)  # task id -> number of its dependencies not done
+        self._ready: Set[int] = set()  # tasks not done, with no dependencies left to do
+
+    @classmethod
+    def load(cls, db: Session) -> 'DependencyGraph':
+        """
+        Build the graph from the database
+
+        :param db:
+            SQLAlchemy database session
+        """
+        graph = cls()
+        graph._load(db)
+        return graph
+
+    def _load(self, db: Session) -> None:
+        """
+        Replace the graph with the tasks and links in the database
+        """
+        status = {}
+        depends_on = defaultdict(set)
+        dependents = defaultdict(set)
+        blocking = defaultdict(int)
+        for task_id, task_status in db.execute(select(Task.id, Task.status)):
+            status[task_id] = task_status
+        for task_id, linked_task_id in db.execute(select(task_links.c.task_id, task_links.c.linked_task_id)):
+            depends_on[task_id].add(linked_task_id)
+            dependents[linked_task_id].add(task_id)
+            if status.get(linked_task_id) != DONE:
+                blocking[task_id] += 1
+        with self._lock:
+            self.status, self.depends_on, self.dependents, self.blocking = status, depends_on, dependents, blocking
+            self._ready = {task_id for task_id in status if self._is_ready(task_id)}
+            self._stale = False
+
+    def sync(self, db: Session) -> 'DependencyGraph':
+        """
+        Bring an attached graph up to date before reading it, reloading it if it may have missed a change: it was
+        never loaded, a change it was told about was rolled back, or another connection wrote to the database
+        since this one last read it
+
+        :param db:
+            SQLAlchemy database session
+
+        :return:
+            The graph itself
+        """
+        conn = db.connection()
+        version = conn.exec_driver_sql('PRAGMA data_version').scalar()
+        versions = conn.info.setdefault(VERSIONS_KEY, weakref.WeakKeyDictionary())  # lives as long as the connection
+        pool = conn.engine.pool
+        with self._lock:
+            if self._stale or self._pool is None or self._pool() is not pool or versions.get(self) != version:
+                self._load(db)  # changes notified meanwhile wait for the lock, applying them again is harmless
+                self._pool = weakref.ref(pool)
+            versions[self] = version
+        return self
+
+    # INCREMENTAL UPDATES
+    def attach(self) -> 'DependencyGraph':
+        """
+        Keep the graph current with changes committed through core (add_task, update_task, delete_task, ...)
+        """
+        add_listener(self.on_change)
+        return self
+
+    def detach(self) -> None:
+        """
+        Stop following core changes
+        """
+        remove_listener(self.on_change)
+
+    def on_change(self, event: str, task_id: int, details: Dict[str, Any]) -> None:
+        """
+        Core change listener, see core.add_listener
+        """
+        with self._lock:
+            if event == 'reset':
+                self._stale = True
+                return
+            if event == 'deleted':
+                self.remove_task(task_id)
+                return
+            if event == 'added':
+                self.add_task(task_id, details.get('status'))
+            elif 'status' in details:
+                self.set_status(task_id, details['status'])
+            for linked_task_id in details.get('added_links', []):
+                self.add_edge(task_id, linked_task_id)
+            for linked_task_id in details.get('deleted_links', []):
+                self.remove_edge(task_id, linked_task_id)
+
+    def _is_ready(self, task_id: int) -> bool:
+        return task_id in self.status and self.status[task_id] != DONE and self.blocking[task_id] == 0
+
+    def _refresh(self, task_id: int) -> None:
+        """
+        Re-check whether a task belongs in the ready queue
+        """
+        if self._is_ready(task_id):
+            self._ready.add(task_id)
+        else:
+            self._ready.discard(task_id)
+
+    def add_task(self, task_id: int, status: Optional[str] = None) -> None:
+        self.status[task_id] = status
+        self._refresh(task_id)
+
+    def set_status(self, task_id: int, status: Optional[str]) -> None:
+        was_done = self.status.get(task_id) == DONE
+        self.status[task_id] = status
+        if was_done != (status == DONE):
+            # tasks depending on this one have one blocker less (or more)
+            for dependent in self.dependents[task_id]:
+                self.blocking[dependent] += -1 if status == DONE else 1
+                self._refresh(dependent)
+        self._refresh(task_id)
+
+    def add_edge(self, task_id: int, linked_task_id: int) -> None:
+        if linked_task_id in self.depends_on[task_id]:
+            return
+        self.depends_on[task_id].add(linked_task_id)
+        self.dependents[linked_task_id].add(task_id)
+        if self.status.get(linked_task_id) != DONE:
+            self.blocking[task_id] += 1
+            self._refresh(task_id)
+
+    def remove_edge(self, task_id: int, linked_task_id: int) -> None:
+        if linked_task_id not in self.depends_on[task_id]:
+            return
+        self.depends_on[task_id].discard(linked_task_id)
+        self.dependents[linked_task_id].discard(task_id)
+        if self.status.get(linked_task_id) != DONE:
+            self.blocking[task_id] -= 1
+            self._refresh(task_id)
+
+    def remove_task(self, task_id: int) -> None:
+        for linked_task_id in list(self.depends_on.get(task_id, ())):
+            self.remove_edge(task_id, linked_task_id)
+        for dependent in list(self.dependents.get(task_id, ())):
+            self.remove_edge(dependent, task_id)
+        self.status.pop(task_id, None)
+        self.depends_on.pop(task_id, None)
+        self.dependents.pop(task_id, None)
+        self.blocking.pop(task_id, None)
+        self._ready.discard(task_id)
+
+    # QUERIES
+    def dependencies(self, task_id: int) -> Set[int]:
+        """
+        All tasks a task depends on, directly or through other tasks
+
+        :param task_id:
+            ID of the task
+        """
+        with self._lock:
+            return self._reachable(task_id, self.depends_on)
+
+    def all_dependents(self, task_id: int) -> Set[int]:
+        """
+        All tasks that depend on a task, directly or through other tasks
+
+        :param task_id:
+            ID of the task
+        """
+        with self._lock:
+            return self._reachable(task_id, self.dependents)
+
+    @staticmethod
+    def _reachable(task_id: int, edges: Dict[int, Set[int]]) -> Set[int]:
+        seen = set()
+        stack = list(edges.get(task_id, ()))
+        while stack:
+            node = stack.pop()
+            if node not in seen:
+                seen.add(node)
+                stack.extend(edges.get(node, ()))
+        return seen
+
+    def ready(self) -> List[int]:
+        """
+        Tasks that can be started now: not done, and every task they link to is done
+
+        :return:
+            Task ids in ascending order
+        """
+        with self._lock:
+            return sorted(self._ready)
+
+    def cycles(self) -> List[List[int]]:
+        """
+        Groups of tasks that depend on each other in a loop (strongly connected components, Tarjan's algorithm)
+        Tasks in a cycle can never become ready.
+
+        :return:
+            List of cycles, each a sorted list of task ids
+        """
+        with self._lock:
+            index: Dict[int, int] = {}
+            lowlink: Dict[int, int] = {}
+            on_stack: Set[int] = set()
+            stack: List[int] = []
+            found = []
+            counter = 0
+
+            for root in list(self.depends_on):
+                if root in index:
+                    continue
+                # iterative DFS: (node, iterator over its dependencies)
+                work = [(root, iter(self.depends_on.get(root, ())))]
+                index[root] = lowlink[root] = counter
+                counter += 1
+                stack.append(root)
+                on_stack.add(root)
+                while work:
+                    node, children = work[-1]
+                    for child in children:
+                        if child not in index:
+                            index[child] = lowlink[child] = counter
+                            counter += 1
+                            stack.append(child)
+                            on_stack.add(child)
+                            work.append((child, iter(self.depends_on.get(child, ()))))
+                            break
+                        if child in on_stack:
+                            lowlink[node] = min(lowlink[node], index[child])
+                    else:
+                        work.pop()
+                        if work:
+                            parent = work[-1][0]
+                            lowlink[parent] = min(lowlink[parent], lowlink[node])
+                        if lowlink[node] == index[node]:
+                            component = []
+                            while True:
+                                member = stack.pop()
+                                on_stack.discard(member)
+                                component.append(member)
+                                if member == node:
+                                    break
+                            if len(component) > 1 or node in self.depends_on.get(node, ()):
+                                found.append(sorted(component))
+            return sorted(found)
+
+    def topological_order(self) -> List[int]:
+        """
+        Order the tasks that aren't done so every task comes after the tasks it depends on (Kahn's algorithm)
+        Tasks in or behind a cycle are left out, see cycles().
+
+        :return:
+            Task ids, dependencies first
+        """
+        with self._lock:
+            pending = {task_id for task_id, status in self.status.items() if status != DONE}
+            remaining = {task_id: self.blocking[task_id] for task_id in pending}
+            queue = deque(sorted(task_id for task_id, count in remaining.items() if count == 0))
+            order = []
+            while queue:
+                task_id = queue.popleft()
+                order.append(task_id)
+                for dependent in sorted(self.dependents.get(task_id, ())):
+                    if dependent in remaining:
+                        remaining[dependent] -= 1
+                        if remaining[dependent] == 0:
+                            queue.append(dependent)
+            return order
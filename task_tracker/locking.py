@@ -0,0 +1,163 @@
+"""
+Write coordination between processes sharing one SQLite file, e.g. the API and a CLI REPL
+
+Transactions start with BEGIN IMMEDIATE, taking the write lock up front. A deferred transaction that has read and
+then tries to write fails straight away with SQLITE_BUSY while another process holds the write lock (SQLite can't
+wait there without risking a deadlock), whereas BEGIN IMMEDIATE waits for the lock in the busy handler (the
+busy_timeout pragma). If the lock is still taken after that, BEGIN is retried a bounded number of times with jittered
+exponential backoff - nothing has run in the transaction yet, so retrying it is always safe.
+
+Read-only work that doesn't need the write lock (exports, API GET requests) can start with a plain deferred BEGIN,
+see deferred(). The time spent waiting for locks is counted per engine, see lock_stats().
+"""
+from typing import NamedTuple, Optional, Union
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+import random
+import sqlite3
+import threading
+import time
+import weakref
+
+
+BEGIN_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+DEFAULT_BEGIN_MODE = 'IMMEDIATE'
+BUSY_RETRIES = 5  # extra BEGIN attempts after the busy handler gives up
+BACKOFF_BASE = 0.05  # seconds, the backoff ceiling doubles with each retry
+BACKOFF_MAX = 1.0  # seconds, the most one backoff can sleep
+
+
+class LockWaitStats(NamedTuple):
+    """
+    Lock waits of one engine's transactions since it was created (or reset)
+    """
+
+    transactions: int  # transactions begun
+    contended: int  # transactions that were retried at least once
+    retries: int  # BEGIN attempts repeated after SQLITE_BUSY
+    failures: int  # transactions that gave up, still busy after every retry
+    wait_seconds: float  # time spent in BEGIN, including the busy handler and the backoff sleeps
+    max_wait_seconds: float
+
+
+class LockStats:
+    """
+    Lock wait counters, updated as transactions begin - thread safe, as the API serves requests from threads
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats = LockWaitStats(0, 0, 0, 0, 0.0, 0.0)
+
+    def record(self, waited: float, retries: int, failed: bool) -> None:
+        """
+        Count one BEGIN
+
+        :param waited:
+            Seconds from the first BEGIN attempt until the lock was taken (or the last attempt failed)
+        :param retries:
+            Attempts repeated after SQLITE_BUSY
+        :param failed:
+            True if the lock was never taken
+        """
+        with self._lock:
+            stats = self._stats
+            self._stats = LockWaitStats(
+                transactions=stats.transactions + 1,
+                contended=stats.contended + (retries > 0),
+                retries=stats.retries + retries,
+                failures=stats.failures + failed,
+                wait_seconds=stats.wait_seconds + waited,
+                max_wait_seconds=max(stats.max_wait_seconds, waited),
+            )
+
+    def snapshot(self) -> LockWaitStats:
+        return self._stats
+
+
+_stats = weakref.WeakKeyDictionary()  # engine pool -> LockStats, shared by the engine and its execution_options copies
+
+
+def lock_stats(bind: Union[Engine, Connection]) -> LockStats:
+    """
+    Lock wait counters of an engine
+
+    :param bind:
+        SQLAlchemy engine (or a copy made with execution_options), or a connection of it
+    """
+    return _stats.setdefault(bind.engine.pool, LockStats())
+
+
+def deferred(bind: Engine) -> Engine:
+    """
+    Copy of an engine whose transactions start with a deferred BEGIN, for work that only reads
+    """
+    return bind.execution_options(begin_mode='DEFERRED')
+
+
+def is_busy(error: BaseException) -> bool:
+    """
+    Whether an error is SQLite's SQLITE_BUSY / SQLITE_LOCKED ('database is locked'), from sqlite3 or SQLAlchemy
+    """
+    error = getattr(error, 'orig', None) or error  # the sqlite3 error wrapped by SQLAlchemy
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, 'sqlite_errorcode', None)  # Python 3.11+
+    if code is not None:
+        return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)  # primary code, without extended bits
+    return 'locked' in str(error)
+
+
+def backoff_delay(retry: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_MAX) -> float:
+    """
+    Seconds to sleep before a retry: 'full jitter', uniform between 0 and an exponentially growing ceiling, so
+    processes that collided don't retry in step
+
+    :param retry:
+        Retry number, from 0
+    """
+    return random.uniform(0, min(cap, base * 2**retry))
+
+
+def begin(
+    conn: Connection,
+    mode: str = DEFAULT_BEGIN_MODE,
+    retries: int = BUSY_RETRIES,
+    stats: Optional[LockStats] = None,
+) -> None:
+    """
+    Start a transaction, retrying BEGIN with backoff while the database is busy
+
+    :param conn:
+        SQLAlchemy connection whose transaction is starting (from the engine's 'begin' event)
+    :param mode:
+        One of BEGIN_MODES
+    :param retries:
+        Attempts to repeat after SQLITE_BUSY before giving up
+    :param stats:
+        Counters to record the wait in
+
+    :raises sqlalchemy.exc.OperationalError:
+        If the database is still locked after the last retry
+    """
+    if mode not in BEGIN_MODES:
+        raise ValueError(f'Unknown begin mode {mode!r}, expected one of {BEGIN_MODES}')
+    start = time.perf_counter()
+    retry = 0
+    while True:
+        try:
+            conn.exec_driver_sql(f'BEGIN {mode}')
+            break
+        except OperationalError as error:
+            if not is_busy(error) or retry >= retries:
+                if stats is not None:
+                    stats.record(time.perf_counter() - start, retry, failed=True)
+                raise
+            time.sleep(backoff_delay(retry))
+            retry += 1
+    if stats is not None:
+        stats.record(time.perf_counter() - start, retry, failed=False)
@@ -0,0 +1,272 @@
+"""
+Versioned schema migrations
+
+create_all only creates missing tables, so changes to existing tables (new indexes etc.) are applied here.
+The schema version is stored in the SQLite header with PRAGMA user_version, every migration is idempotent
+so it is safe on databases that create_all has just built with the latest schema.
+Migrations run with foreign keys off, so tables can be rebuilt, and the foreign keys are checked before each one commits.
+"""
+from typing import Callable, List, Tuple
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateTable
+from task_tracker.models import Task, TaskEvent, task_counts, task_links, task_tags
+
+
+# STEPS
+def _add_filter_indexes(conn: Connection) -> None:
+    """
+    Version 1: indexes for list --status, due date ranges, subtask lookups and reverse link loads
+    """
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_tasks_status ON tasks (status)')
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS "ix_tasks_dueDate" ON tasks ("dueDate")')
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_tasks_parent_id ON tasks (parent_id)')
+    conn.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_task_links_linked_task_id ON task_links (linked_task_id)'
+    )
+
+
+# full text index over task titles and descriptions, an external content table kept in sync with tasks by triggers
+FTS_TABLE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5("
+    "title, description, content='tasks', content_rowid='id', prefix='2 3')"
+)
+FTS_TRIGGERS_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts (rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+        INSERT INTO tasks_fts (tasks_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF title, description ON tasks BEGIN
+        INSERT INTO tasks_fts (tasks_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO tasks_fts (rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+]
+
+
+def _add_full_text_search(conn: Connection) -> None:
+    """
+    Version 2: FTS5 index for search, built from the existing tasks
+    """
+    conn.exec_driver_sql(FTS_TABLE_DDL)
+    for statement in FTS_TRIGGERS_DDL:
+        conn.exec_driver_sql(statement)
+    conn.exec_driver_sql("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')")
+
+
+# summary counts per status, per tag, and per due date of open tasks - kept current by triggers on every write path
+def _increment(kind: str, key: str, condition: str = '1') -> str:
+    return (
+        f"INSERT INTO task_counts (kind, key, count) SELECT '{kind}', {key}, 1 WHERE {condition} "
+        'ON CONFLICT (kind, key) DO UPDATE SET count = count + 1;'
+    )
+
+
+def _decrement(kind: str, key: str, condition: str = '1') -> str:
+    return (
+        f"UPDATE task_counts SET count = count - 1 WHERE kind = '{kind}' AND key = {key} AND {condition};"
+        f" DELETE FROM task_counts WHERE kind = '{kind}' AND key = {key} AND count <= 0;"
+    )
+
+
+def _open_due(row: str) -> str:
+    return f'{row}."dueDate" IS NOT NULL AND {row}.status IS NOT \'done\''
+
+
+COUNT_TRIGGERS_DDL = [
+    f"""CREATE TRIGGER IF NOT EXISTS task_counts_insert AFTER INSERT ON tasks BEGIN
+        {_increment('status', "coalesce(new.status, '')")}
+        {_increment('due', 'date(new."dueDate")', _open_due('new'))}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS task_counts_delete AFTER DELETE ON tasks BEGIN
+        {_decrement('status', "coalesce(old.status, '')")}
+        {_decrement('due', 'date(old."dueDate")', _open_due('old'))}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS task_counts_update AFTER UPDATE OF status, "dueDate" ON tasks BEGIN
+        {_decrement('status', "coalesce(old.status, '')")}
+        {_increment('status', "coalesce(new.status, '')")}
+        {_decrement('due', 'date(old."dueDate")', _open_due('old'))}
+        {_increment('due', 'date(new."dueDate")', _open_due('new'))}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS task_counts_tag_insert AFTER INSERT ON task_tags BEGIN
+        {_increment('tag', '(SELECT name FROM tags WHERE id = new.tag_id)')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS task_counts_tag_delete AFTER DELETE ON task_tags BEGIN
+        {_decrement('tag', '(SELECT name FROM tags WHERE id = old.tag_id)')}
+    END""",
+]
+
+# the counts computed from scratch, used to rebuild and verify task_counts
+COUNTS_QUERY = f"""
+    SELECT 'status', coalesce(status, ''), count(*) FROM tasks GROUP BY 2
+    UNION ALL
+    SELECT 'tag', tags.name, count(*) FROM task_tags JOIN tags ON tags.id = task_tags.tag_id GROUP BY 2
+    UNION ALL
+    SELECT 'due', date("dueDate"), count(*) FROM tasks WHERE {_open_due('tasks')} GROUP BY 2
+"""
+
+
+def rebuild_counts(conn: Connection) -> None:
+    """
+    Recompute task_counts from the tasks
+    """
+    conn.exec_driver_sql('DELETE FROM task_counts')
+    conn.exec_driver_sql(f'INSERT INTO task_counts (kind, key, count) {COUNTS_QUERY}')
+
+
+def _add_task_counts(conn: Connection) -> None:
+    """
+    Version 3: summary counts table, its triggers, and the initial counts
+    """
+    task_counts.create(conn, checkfirst=True)
+    for statement in COUNT_TRIGGERS_DDL:
+        conn.exec_driver_sql(statement)
+    rebuild_counts(conn)
+
+
+def _add_task_events(conn: Connection) -> None:
+    """
+    Version 4: change journal table
+    """
+    TaskEvent.__table__.create(conn, checkfirst=True)
+
+
+def _add_tag_lookup_index(conn: Connection) -> None:
+    """
+    Version 5: task_tags (tag_id, task_id) index, so tag filters go from a tag to its tasks without a table scan
+    """
+    conn.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_task_tags_tag_id_task_id ON task_tags (tag_id, task_id)'
+    )
+
+
+# rows kept when rebuilding a table, so data orphaned before the foreign keys were enforced doesn't fail the check
+REBUILD_FILTERS = {
+    'tasks': {'parent_id': 'CASE WHEN parent_id IN (SELECT id FROM tasks) THEN parent_id END'},
+    'task_tags': {'where': 'task_id IN (SELECT id FROM tasks) AND tag_id IN (SELECT id FROM tags)'},
+    'task_links': {'where': 'task_id IN (SELECT id FROM tasks) AND linked_task_id IN (SELECT id FROM tasks)'},
+}
+
+
+def _rebuild_table(conn: Connection, table) -> None:
+    """
+    Recreate a table from its current model (SQLite can't alter constraints): create the new table, copy the rows,
+    drop the old one and rename, then recreate its indexes. Triggers on the table are dropped with it.
+    """
+    name = table.name
+    ddl = str(CreateTable(table).compile(dialect=conn.dialect)).strip()
+    conn.exec_driver_sql(ddl.replace(f'CREATE TABLE {name} ', f'CREATE TABLE _new_{name} ', 1))
+    filters = REBUILD_FILTERS.get(name, {})
+    columns = [f'"{column.name}"' for column in table.columns]
+    values = [filters.get(column.name, f'"{column.name}"') for column in table.columns]
+    conn.exec_driver_sql(
+        f'INSERT INTO _new_{name} ({", ".join(columns)}) '
+        f'SELECT {", ".join(values)} FROM {name} WHERE {filters.get("where", "1")}'
+    )
+    conn.exec_driver_sql(f'DROP TABLE {name}')
+    conn.exec_driver_sql(f'ALTER TABLE _new_{name} RENAME TO {name}')
+    for index in table.indexes:
+        index.create(conn)
+
+
+def _add_delete_actions(conn: Connection) -> None:
+    """
+    Version 6: ON DELETE actions on the foreign keys - tag and link rows are deleted with their tasks, subtasks of a
+    deleted task become top-level. The tables are rebuilt, dropping orphaned rows, and the search index and count
+    triggers are recreated.
+    """
+    for table in (Task.__table__, task_tags, task_links):
+        _rebuild_table(conn, table)
+    for statement in FTS_TRIGGERS_DDL + COUNT_TRIGGERS_DDL:
+        conn.exec_driver_sql(statement)
+    conn.exec_driver_sql("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')")
+    rebuild_counts(conn)
+
+
+def _add_sort_indexes(conn: Connection) -> None:
+    """
+    Version 7: indexes for list --sort, so ORDER BY ... LIMIT reads the first rows of an index instead of sorting
+    the whole table - (status, sort key) for the due-soon and recently-updated views, the sort keys on their own
+    for lists without a status
+    """
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS "ix_tasks_status_dueDate" ON tasks (status, "dueDate")')
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS "ix_tasks_status_updatedAt" ON tasks (status, "updatedAt")')
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS "ix_tasks_updatedAt" ON tasks ("updatedAt")')
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS "ix_tasks_createdAt" ON tasks ("createdAt")')
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_tasks_title ON tasks (title)')
+
+
+def _drop_status_index(conn: Connection) -> None:
+    """
+    Version 8: drop ix_tasks_status - it is a prefix of the (status, sort key) indexes, which serve list --status on
+    their own, so it only slowed down writes
+    """
+    conn.exec_driver_sql('DROP INDEX IF EXISTS ix_tasks_status')
+
+
+# REGISTER - (version, description, step), in order
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, 'indexes on hot filter columns', _add_filter_indexes),
+    (2, 'full text search', _add_full_text_search),
+    (3, 'summary counts', _add_task_counts),
+    (4, 'task change journal', _add_task_events),
+    (5, 'tag lookup index', _add_tag_lookup_index),
+    (6, 'ON DELETE actions on foreign keys', _add_delete_actions),
+    (7, 'indexes for sorted lists', _add_sort_indexes),
+    (8, 'drop redundant status index', _drop_status_index),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn: Connection) -> int:
+    """
+    Read the schema version stamped in the database file
+
+    :param conn:
+        SQLAlchemy connection
+
+    :return:
+        The user_version of the database, 0 for a new or unversioned database
+    """
+    return conn.exec_driver_sql('PRAGMA user_version').scalar()
+
+
+def migrate(engine: Engine) -> List[int]:
+    """
+    Apply every migration newer than the database's schema version, each in its own transaction
+
+    :param engine:
+        SQLAlchemy engine of the database to migrate
+
+    :return:
+        The versions that were applied
+
+    :raises RuntimeError:
+        If a migration leaves more rows breaking a foreign key than there were before it (it is rolled back)
+    """
+    applied = []
+    with engine.connect() as conn:
+        current = get_schema_version(conn)
+    for version, _, step in MIGRATIONS:
+        if version <= current:
+            continue
+        with engine.connect() as conn:
+            # the pragma is ignored inside a transaction, so set it on the driver connection before BEGIN
+            driver_connection = conn.connection.driver_connection
+            foreign_keys = driver_connection.execute('PRAGMA foreign_keys').fetchone()[0]
+            driver_connection.execute('PRAGMA foreign_keys = OFF')
+            try:
+                with conn.begin():
+                    before = len(conn.exec_driver_sql('PRAGMA foreign_key_check').all())  # older data may have some
+                    step(conn)
+                    violations = conn.exec_driver_sql('PRAGMA foreign_key_check').all()
+                    if len(violations) > before:
+                        raise RuntimeError(f'Migration {version} breaks foreign keys: {violations[:5]}')
+                    conn.exec_driver_sql(f'PRAGMA user_version = {version}')
+            finally:
+                driver_connection.execute(f'PRAGMA foreign_keys = {foreign_keys}')
+        applied.append(version)
+    return applied
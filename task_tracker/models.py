@@ -1,10 +1,14 @@
 from sqlalchemy import (
     create_engine,
+    event,
     Column,
     Integer,
+    String,
     Table,
     ForeignKey,
+    Index,
 )  # modules for db operations
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import (
     declarative_base,
     sessionmaker,
@@ -13,14 +17,61 @@ from sqlalchemy.orm import (
     mapped_column,
 )  # object-relational mapper (ORM) - bridge between OOP amd relational dbs
 import datetime as dt
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
+from task_tracker.config import ALLOWED_PRAGMAS, load_settings
+from task_tracker.locking import DEFAULT_BEGIN_MODE, begin, deferred, lock_stats
 
 
 Base = declarative_base()  # any class that inheirts from Base is considered a SQLAlchemy ORM model - parent class
 
-engine = create_engine(
-    'sqlite:///./tasks.db'  # , echo=True
-)  # connect to the database, and enable logging of all the statements
+
+def make_engine(
+    db_path: str, pragmas: Optional[Dict[str, Any]] = None, begin_mode: str = DEFAULT_BEGIN_MODE
+) -> Engine:
+    """
+    Create an engine for a SQLite file, applying the profile's pragmas to every new connection
+    Transactions begin in begin_mode (IMMEDIATE takes the write lock up front), retried while the database is busy,
+    see task_tracker.locking. A connection can override it with the 'begin_mode' execution option (None for the
+    engine's own).
+
+    :param db_path:
+        Path of the database file (or :memory:)
+    :param pragmas:
+        Pragma name -> value, from an engine profile in config.PROFILES
+    :param begin_mode:
+        DEFERRED, IMMEDIATE or EXCLUSIVE
+
+    :return:
+        SQLAlchemy engine
+    """
+    new_engine = create_engine(
+        f'sqlite:///{db_path}'  # , echo=True
+    )  # connect to the database, and enable logging of all the statements
+    pragmas = pragmas or {}
+
+    @event.listens_for(new_engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        # stop pysqlite from emitting its own BEGIN, so SAVEPOINTs nest inside our transactions (see 'begin' below)
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys = ON')  # enforce the ON DELETE actions, in every profile
+        for name in ALLOWED_PRAGMAS:
+            if name in pragmas:
+                cursor.execute(f'PRAGMA {name} = {pragmas[name]}')
+        cursor.close()
+
+    stats = lock_stats(new_engine)
+
+    @event.listens_for(new_engine, 'begin')
+    def begin_transaction(conn):
+        # start the transaction when SQLAlchemy does, not at the first write
+        begin(conn, conn.get_execution_options().get('begin_mode') or begin_mode, stats=stats)
+
+    return new_engine
+
+
+settings = load_settings()  # database path and engine profile, from env vars / config file
+engine = make_engine(settings.db_path, settings.pragmas)
 
 sessionLocal = sessionmaker(
     autocommit=False, autoflush=False, bind=engine
@@ -32,8 +83,9 @@ sessionLocal = sessionmaker(
 task_tags = Table(
     'task_tags',
     Base.metadata,
-    Column('task_id', Integer, ForeignKey('tasks.id'), primary_key=True),
-    Column('tag_id', Integer, ForeignKey('tags.id'), primary_key=True),
+    Column('task_id', Integer, ForeignKey('tasks.id', ondelete='CASCADE'), primary_key=True),
+    Column('tag_id', Integer, ForeignKey('tags.id', ondelete='CASCADE'), primary_key=True),
+    Index('ix_task_tags_tag_id_task_id', 'tag_id', 'task_id'),  # tag -> tasks, for the tag filters
 )
 
 
@@ -41,9 +93,23 @@ task_tags = Table(
 task_links = Table(
     'task_links',
     Base.metadata,
-    Column('task_id', Integer, ForeignKey('tasks.id'), primary_key=True),
-    Column('linked_task_id', Integer, ForeignKey('tasks.id'), primary_key=True)
+    Column('task_id', Integer, ForeignKey('tasks.id', ondelete='CASCADE'), primary_key=True),
+    Column('linked_task_id', Integer, ForeignKey('tasks.id', ondelete='CASCADE'), primary_key=True, index=True),
 ) # stores pairs (task_1_id, task_2_id) so these two are linked
+# rows of the association tables are removed by the database when either side is deleted (ON DELETE CASCADE)
+# linked_task_id is indexed for reverse lookups (_links_reverse), task_id is covered by the primary key
+
+
+
+# Summary counts, kept current by triggers (see migrations) so stats don't need to scan the tasks
+task_counts = Table(
+    'task_counts',
+    Base.metadata,
+    Column('kind', String, primary_key=True),  # 'status', 'tag', or 'due' (open tasks per due date)
+    Column('key', String, primary_key=True),  # the status, tag name or YYYY-MM-DD due date
+    Column('count', Integer, nullable=False, default=0),
+    sqlite_with_rowid=False,
+)
 
 
 
@@ -54,34 +120,40 @@ class Task(Base):
     """
 
     __tablename__ = 'tasks' 
+    __table_args__ = (
+        Index('ix_tasks_status_dueDate', 'status', 'dueDate'),  # list --status <s> --sort due, the next tasks due
+        Index('ix_tasks_status_updatedAt', 'status', 'updatedAt'),  # list --status <s> --sort updated --desc
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
 
-    title: Mapped[str] = mapped_column(nullable=False) 
-    # field, title, which is a string and required
+    title: Mapped[str] = mapped_column(nullable=False, index=True)
+    # field, title, which is a string and required - indexed for list --sort title
     description: Mapped[Optional[str]] = mapped_column(nullable=True) 
     # field, description, which is a string
     status: Mapped[Optional[str]] = mapped_column(default='to-do') 
-    # field, status, which is a string and default as 'to-do'
-    dueDate: Mapped[Optional[dt.datetime]] = mapped_column(nullable=True)
-    # field, dueDate, which is a datetime object
-    createdAt: Mapped[dt.datetime] = mapped_column(default=dt.datetime.now) 
-    # field, createdAt, which is a DateTime object and default as current time
-    updatedAt: Mapped[dt.datetime] = mapped_column(default=dt.datetime.now, onupdate=dt.datetime.now) 
-    # field, updatedAt, which is a DateTime object and defaults and updates as current time
+    # field, status, which is a string and default as 'to-do' - list --status uses the (status, ...) indexes above
+    dueDate: Mapped[Optional[dt.datetime]] = mapped_column(nullable=True, index=True)
+    # field, dueDate, which is a datetime object - indexed for due date ranges
+    createdAt: Mapped[dt.datetime] = mapped_column(default=dt.datetime.now, index=True)
+    # field, createdAt, which is a DateTime object and default as current time - indexed for list --sort created
+    updatedAt: Mapped[dt.datetime] = mapped_column(default=dt.datetime.now, onupdate=dt.datetime.now, index=True)
+    # field, updatedAt, which is a DateTime object and defaults and updates as current time - indexed for list --sort updated
     
     # Parent-child relationship logic 
-    parent_id: Mapped[Optional[int]] = mapped_column(ForeignKey('tasks.id'), nullable=True)  
-    # field, parent_id, which is an integer and a foreign key to the 'tasks' table itself (adjaency list)
+    parent_id: Mapped[Optional[int]] = mapped_column(ForeignKey('tasks.id', ondelete='SET NULL'), nullable=True, index=True)  
+    # field, parent_id, which is an integer and a foreign key to the 'tasks' table itself (adjaency list) - indexed for subtask lookups
+    # when the parent is deleted the database sets it to NULL, so the subtasks become top-level tasks
     # creates a column that will point to another row in the same table, if null it is a top-level task.
     parent: Mapped[Optional['Task']] = relationship('Task', remote_side=[id], back_populates='subtasks') 
     # task.parent -> get the parent task of a subtask
     # remote_id -> look at the ID field to find the parent.
-    subtasks: Mapped[List['Task']] = relationship('Task', back_populates='parent')  # task.subtasks -> get list of subtasks for a parent task
+    subtasks: Mapped[List['Task']] = relationship('Task', back_populates='parent', passive_deletes=True)  # task.subtasks -> get list of subtasks for a parent task
+    # passive_deletes -> the ON DELETE actions do the work, so deleting a task doesn't load its subtasks, tags or links first
 
 
     # Tag relationship logic - many-to-many relationship
-    tags: Mapped[List['Tag']] = relationship('Tag', secondary='task_tags', back_populates='tasks') 
+    tags: Mapped[List['Tag']] = relationship('Tag', secondary='task_tags', back_populates='tasks', passive_deletes=True) 
     # task.tags -> get list of tags associated with a task
     # 'secondary'=task_tags: specifies the association table and tells SQLAlchemy where to look for these connections
 
@@ -91,18 +163,37 @@ class Task(Base):
         secondary='task_links', # use that association table
         primaryjoin=id == task_links.c.task_id, # Task.id links to task_links.task_id
         secondaryjoin=id == task_links.c.linked_task_id, # Task.id links to task_links.linked_task_id
-        back_populates='_links_reverse'
+        back_populates='_links_reverse',
+        passive_deletes=True,
     )  # task.links -> get list of tasks linked to this task
     _links_reverse: Mapped[List['Task']] = relationship(
         'Task',
         secondary='task_links',  # use that association table
         primaryjoin=id == task_links.c.linked_task_id, # Task.id links to task_links.linked_task_id
         secondaryjoin=id == task_links.c.task_id, # Task.id links to task_links.task_id
-        back_populates='links'
+        back_populates='links',
+        passive_deletes=True,
     )  # task._links_reverse -> get list of tasks that link to this task
     
 
 
+    # Display helpers, also fields of core.TaskRow, so display code works with either
+    @property
+    def tag_names(self) -> List[str]:
+        return [tag.name for tag in self.tags]
+
+    @property
+    def link_titles(self) -> List[str]:
+        return [link.title for link in self.links]
+
+    @property
+    def link_ids(self) -> List[int]:
+        return [link.id for link in self.links]
+
+    @property
+    def parent_title(self) -> Optional[str]:
+        return self.parent.title if self.parent else None
+
     def __repr__(self):
         """
         Defines how an instance of the Task class should be represented as a string, for logging
@@ -123,7 +214,7 @@ class Tag(Base):
     name: Mapped[str] = mapped_column(unique=True, nullable=False)
 
     tasks: Mapped[List['Task']] = relationship(
-        'Task', secondary='task_tags', back_populates='tags'
+        'Task', secondary='task_tags', back_populates='tags', passive_deletes=True
     )  # defines a relationship with 'Task', for the SQLAlchemy model -> many-to-many relationship
     # 'secondary' task_tags, specifies the association table
     # 'back_populates' tags, tells to create a 'tasks' attribute on the 'Task' model that will contain  a list of tasks associated with the task
@@ -135,10 +226,58 @@ class Tag(Base):
         return f'<Tag(id={self.id}, name={self.name})>'
     
 
-def init_db():
+class TaskEvent(Base):
+    """
+    Define the TaskEvent table as a child of the Base class - It is an ORM Model
+    Append-only journal of task changes, one row per changed field, written by update_task
+    """
+
+    __tablename__ = 'task_events'
+    __table_args__ = (
+        Index('ix_task_events_task_id_createdAt', 'task_id', 'createdAt'),  # history of a task
+        Index('ix_task_events_field_createdAt', 'field', 'createdAt'),  # e.g. all status changes in a period
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+
+    task_id: Mapped[int] = mapped_column(nullable=False)
+    # field, task_id, not a foreign key so the history outlives deleted tasks
+    field: Mapped[str] = mapped_column(nullable=False)
+    # field, field, name of the changed field (title, status, tags, ...)
+    old_value: Mapped[Optional[str]] = mapped_column(nullable=True)
+    new_value: Mapped[Optional[str]] = mapped_column(nullable=True)
+    # fields, old_value / new_value, stored as text - for tags and links one of them is NULL (added / removed)
+    createdAt: Mapped[dt.datetime] = mapped_column(default=dt.datetime.now)
+
+    def __repr__(self):
+        """
+        Defines how an instance of the TaskEvent class should be represented as a string, for logging
+        """
+        return f'<TaskEvent(id={self.id}, task_id={self.task_id}, field={self.field}, old_value={self.old_value}, new_value={self.new_value}, createdAt={self.createdAt})>'
+
+
+def init_db(bind=engine) -> bool:
     """
     Uses metadata of the Base class to create all the defined tables in the database connection, engine.
+    Then applies any pending migrations, so databases created by older versions gain new indexes etc.
+    A database already stamped with the current schema version (PRAGMA user_version) is left alone, so a normal
+    start costs one pragma read instead of create_all inspecting every table.
+
+    :param bind:
+        SQLAlchemy engine to initialise, defaults to the app engine
+
+    :return:
+        True if the schema was created or migrated, False if it was already current
     """
+    # imported here, migrations import the models
+    from task_tracker.migrations import SCHEMA_VERSION, get_schema_version, migrate
+
+    with deferred(bind).connect() as conn:  # a read, so a start doesn't wait for another process's write lock
+        if get_schema_version(conn) >= SCHEMA_VERSION:
+            return False
+
     Base.metadata.create_all(
-        bind=engine
+        bind=bind
     )  # creates all tables defined by classes inherited from Base, which includes Task table.
+    migrate(bind)
+    return True
@@ -0,0 +1,178 @@
+"""
+Per-command SQL profiling, built on SQLAlchemy engine events
+
+While a QueryProfiler is started, every statement run on its engine is timed (before / after_cursor_execute), the
+rows fetched from its results are counted (a pass-through sqlite3 row_factory on the cursor, so Core projections like
+TaskRow count too), ORM objects loaded are counted (the mapper 'load' event), and so is the time spent waiting for
+the write lock (task_tracker.locking). Statements are grouped by the command that ran them,
+see QueryProfiler.command, giving a CommandProfile per command that can be printed or appended to a JSON lines file.
+"""
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from task_tracker.locking import lock_stats
+from task_tracker.models import Base, engine
+import heapq
+import json
+import time
+
+
+SLOWEST_STATEMENTS = 5  # statements kept per command
+STATEMENT_PREVIEW = 200  # characters of SQL kept per statement
+
+
+class CommandProfile(NamedTuple):
+    """
+    What one command did on the database
+    """
+
+    command: str
+    args: List[str]
+    seconds: float  # wall time of the whole command
+    queries: int
+    sql_seconds: float  # time spent executing statements
+    rows: int  # rows written (inserted, updated, deleted)
+    rows_returned: int  # rows fetched from query results (SELECT, RETURNING)
+    objects_loaded: int  # ORM objects loaded from query results
+    lock_wait_seconds: float  # time spent waiting to begin transactions, while another connection held the lock
+    slowest: List[Tuple[float, str]]  # (seconds, statement), slowest first
+
+
+class QueryProfiler:
+    """
+    Collects statement counts and timings per command from an engine's events
+    """
+
+    def __init__(
+        self, bind: Engine = engine, slowest: int = SLOWEST_STATEMENTS, json_path: Optional[str] = None
+    ):
+        """
+        :param bind:
+            SQLAlchemy engine to profile
+        :param slowest:
+            Number of slowest statements kept per command
+        :param json_path:
+            File to append one JSON line per command to, for offline analysis
+        """
+        self.bind = bind
+        self.slowest = slowest
+        self.json_path = json_path
+        self.last: Optional[CommandProfile] = None  # profile of the most recent command
+        self._active = False  # only statements run inside command() are recorded
+        self._reset()
+
+    def _reset(self) -> None:
+        self._queries = 0
+        self._sql_seconds = 0.0
+        self._rows = 0
+        self._rows_returned = 0
+        self._objects_loaded = 0
+        self._slowest: List[Tuple[float, int, str]] = []  # min-heap of (seconds, order, statement)
+
+    # EVENTS
+    def start(self) -> 'QueryProfiler':
+        """
+        Start listening to the engine's events
+        """
+        event.listen(self.bind, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(self.bind, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(Base, 'load', self._on_load, propagate=True)
+        return self
+
+    def stop(self) -> None:
+        """
+        Stop listening
+        """
+        event.remove(self.bind, 'before_cursor_execute', self._before_cursor_execute)
+        event.remove(self.bind, 'after_cursor_execute', self._after_cursor_execute)
+        event.remove(Base, 'load', self._on_load)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault('profile_start', []).append(time.perf_counter())
+        if self._active and getattr(cursor, 'row_factory', False) is None:  # a sqlite3 cursor returning plain tuples
+            cursor.row_factory = self._count_row
+
+    def _count_row(self, cursor, row: tuple) -> tuple:
+        """
+        sqlite3 row factory, called for every row fetched; returns the row unchanged
+        """
+        self._rows_returned += 1
+        return row
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        elapsed = time.perf_counter() - conn.info['profile_start'].pop()
+        if not self._active:
+            return
+        self._queries += 1
+        self._sql_seconds += elapsed
+        if cursor.rowcount > 0:  # -1 for SELECTs with sqlite3
+            self._rows += cursor.rowcount
+        entry = (elapsed, self._queries, ' '.join(statement.split())[:STATEMENT_PREVIEW])
+        if len(self._slowest) < self.slowest:
+            heapq.heappush(self._slowest, entry)
+        else:
+            heapq.heappushpop(self._slowest, entry)
+
+    def _on_load(self, target, context) -> None:
+        if self._active:
+            self._objects_loaded += 1
+
+    # COMMANDS
+    @contextmanager
+    def command(self, name: str, args: Optional[List[str]] = None) -> Iterator['QueryProfiler']:
+        """
+        Record the statements run inside the with block as one command, stored in self.last when it ends
+        (also when it raises), and appended to the JSON lines file if there is one
+
+        :param name:
+            Command name, e.g. 'list'
+        :param args:
+            Command arguments
+        """
+        self._reset()
+        self._active = True
+        start = time.perf_counter()
+        waited = lock_stats(self.bind).snapshot().wait_seconds
+        try:
+            yield self
+        finally:
+            self._active = False
+            self.last = CommandProfile(
+                command=name,
+                args=list(args or []),
+                seconds=time.perf_counter() - start,
+                queries=self._queries,
+                sql_seconds=self._sql_seconds,
+                rows=self._rows,
+                rows_returned=self._rows_returned,
+                objects_loaded=self._objects_loaded,
+                lock_wait_seconds=lock_stats(self.bind).snapshot().wait_seconds - waited,
+                slowest=[(seconds, statement) for seconds, _, statement in sorted(self._slowest, reverse=True)],
+            )
+            if self.json_path:
+                self._write_json(self.last)
+
+    def _write_json(self, profile: CommandProfile) -> None:
+        record: Dict[str, Any] = profile._asdict()
+        record['slowest'] = [{'seconds': seconds, 'statement': statement} for seconds, statement in profile.slowest]
+        with open(self.json_path, 'a', encoding='utf-8') as json_file:
+            json_file.write(json.dumps(record) + '\n')
+
+
+def format_profile(profile: CommandProfile) -> str:
+    """
+    Human readable summary of a command's profile, with its slowest statements
+
+    :param profile:
+        Profile to summarise
+    """
+    lines = [
+        f'[profile] {profile.command}: {profile.queries} queries, '
+        f'{profile.sql_seconds * 1000:.1f} ms in SQL of {profile.seconds * 1000:.1f} ms, '
+        f'{profile.rows_returned} rows returned, {profile.rows} rows written, {profile.objects_loaded} objects loaded, '
+        f'{profile.lock_wait_seconds * 1000:.1f} ms waiting for locks'
+    ]
+    for seconds, statement in profile.slowest:
+        lines.append(f'  {seconds * 1000:8.2f} ms  {statement}')
+    return '\n'.join(lines)
@@ -0,0 +1,386 @@
+"""
+Streaming import / export of tasks as JSONL or CSV
+
+Export reads the tasks with one query, fetched in chunks (yield_per), with the tags and links of each task
+aggregated in SQL, so memory stays flat however many tasks there are.
+Import writes the tasks in batches of batch_size per transaction. Tasks get new ids, the old -> new id map and
+the parent / link edges are kept in TEMP tables rather than in Python, and the edges are resolved in a second,
+set-based pass once every task exists - so a task can reference one later in the file.
+"""
+from itertools import groupby
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+from task_tracker.core import has_listeners, normalise_tags, notify, resolve_tag_ids
+from task_tracker.locking import deferred
+from task_tracker.models import Tag, Task, engine, task_links, task_tags
+import csv
+import datetime as dt
+import json
+
+
+FORMATS = ('jsonl', 'csv')
+FIELDS = ('id', 'title', 'description', 'status', 'dueDate', 'createdAt', 'updatedAt', 'parent_id', 'tags', 'links')
+EXPORT_CHUNK_SIZE = 1000  # rows fetched from the cursor at a time
+IMPORT_BATCH_SIZE = 1000  # tasks per transaction
+SEPARATOR = '\x1f'  # group_concat separator, can't appear in a tag name typed at the CLI
+
+
+class ImportResult(NamedTuple):
+    """
+    Outcome of an import
+    """
+
+    imported: int
+    failed: List[Tuple[int, str]]  # (line number, reason)
+    unresolved: int  # parent / link ids that weren't in the file
+
+
+def guess_format(path: str) -> str:
+    """
+    File format from the extension, JSONL unless it ends in .csv
+    """
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+# EXPORT
+def _export_query():
+    """
+    Select every task with its tag names and linked task ids aggregated, in id order
+    """
+    tag_names = (
+        select(func.group_concat(Tag.name, SEPARATOR))
+        .join(task_tags, task_tags.c.tag_id == Tag.id)
+        .where(task_tags.c.task_id == Task.id)
+        .scalar_subquery()
+    )
+    link_ids = (
+        select(func.group_concat(task_links.c.linked_task_id, SEPARATOR))
+        .where(task_links.c.task_id == Task.id)
+        .scalar_subquery()
+    )
+    return select(
+        Task.id,
+        Task.title,
+        Task.description,
+        Task.status,
+        Task.dueDate,
+        Task.createdAt,
+        Task.updatedAt,
+        Task.parent_id,
+        tag_names.label('tags'),
+        link_ids.label('links'),
+    ).order_by(Task.id)
+
+
+def iter_export_rows(conn: Connection, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Stream every task as a dictionary of FIELDS, dates as ISO strings and tags / links as lists
+
+    :param conn:
+        SQLAlchemy connection
+    :param chunk_size:
+        Rows fetched from the cursor at a time
+    """
+    result = conn.execute(_export_query().execution_options(yield_per=chunk_size))
+    for row in result:
+        yield {
+            'id': row.id,
+            'title': row.title,
+            'description': row.description,
+            'status': row.status,
+            'dueDate': row.dueDate.isoformat() if row.dueDate else None,
+            'createdAt': row.createdAt.isoformat() if row.createdAt else None,
+            'updatedAt': row.updatedAt.isoformat() if row.updatedAt else None,
+            'parent_id': row.parent_id,
+            'tags': sorted(row.tags.split(SEPARATOR)) if row.tags else [],
+            'links': sorted(int(link_id) for link_id in row.links.split(SEPARATOR)) if row.links else [],
+        }
+
+
+def export_tasks(
+    out: TextIO, fmt: str = 'jsonl', bind: Engine = engine, chunk_size: int = EXPORT_CHUNK_SIZE
+) -> int:
+    """
+    Write every task to a file, one JSON object per line or one CSV row (tags and links comma separated)
+
+    :param out:
+        Open text file to write to
+    :param fmt:
+        'jsonl' or 'csv'
+    :param bind:
+        SQLAlchemy engine to read from
+    :param chunk_size:
+        Rows fetched from the cursor at a time
+
+    :return:
+        Number of tasks written
+
+    :raises ValueError:
+        If the format isn't one of FORMATS
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown format {fmt!r}, expected one of {", ".join(FORMATS)}')
+
+    count = 0
+    with deferred(bind).connect() as conn:  # a long read, writers shouldn't wait for it
+        if fmt == 'csv':
+            writer = csv.DictWriter(out, fieldnames=FIELDS)
+            writer.writeheader()
+        for row in iter_export_rows(conn, chunk_size):
+            if fmt == 'csv':
+                row['tags'] = ','.join(row['tags'])
+                row['links'] = ','.join(map(str, row['links']))
+                writer.writerow(row)
+            else:
+                out.write(json.dumps(row) + '\n')
+            count += 1
+    return count
+
+
+# IMPORT
+def _read_rows(source: TextIO, fmt: str) -> Iterator[Tuple[int, Any]]:
+    """
+    Yield (line number, raw row) from a JSONL or CSV file, one line at a time
+    A JSONL line that isn't valid JSON is yielded as None
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(source)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(source, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            yield line_number, None
+
+
+def _parse_ids(value: Any) -> List[int]:
+    """
+    Task ids from a JSON list or a comma separated CSV field
+
+    :raises ValueError:
+        If the value is not a list of ids
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = [part for part in value.split(',') if part.strip()]
+    if not isinstance(value, list) or not all(
+        isinstance(item, (int, str)) and not isinstance(item, bool) for item in value
+    ):
+        raise ValueError(f'Links must be a list of task ids, not {value!r}')
+    return [int(item) for item in value]
+
+
+def _parse_datetime(value: Any) -> Optional[dt.datetime]:
+    return dt.datetime.fromisoformat(value) if value else None
+
+
+def _parse_row(row: Any) -> Dict[str, Any]:
+    """
+    Validate and convert one imported row
+
+    :raises ValueError:
+        If the row has no title, an id / date can't be parsed, or the tags / links are not lists of names / ids
+    """
+    if not isinstance(row, dict):
+        raise ValueError('Not a JSON object')
+    if not row.get('title'):
+        raise ValueError('Task requires a title')
+    tags = row.get('tags') or []
+    if isinstance(tags, str):
+        tags = tags.split(',')
+    if not isinstance(tags, list):
+        raise ValueError(f'Tags must be a list of names, not {tags!r}')
+    now = dt.datetime.now()
+    return {
+        'old_id': int(row['id']) if row.get('id') not in (None, '') else None,
+        'title': row['title'],
+        'description': row.get('description') or None,
+        'status': row.get('status') or 'to-do',
+        'dueDate': _parse_datetime(row.get('dueDate')),
+        'createdAt': _parse_datetime(row.get('createdAt')) or now,
+        'updatedAt': _parse_datetime(row.get('updatedAt')) or now,
+        'parent': int(row['parent_id']) if row.get('parent_id') not in (None, '') else None,
+        'tags': normalise_tags(tags),
+        'links': _parse_ids(row.get('links')),
+    }
+
+
+def _write_batch(batch: List[Dict[str, Any]], db: Session) -> List[int]:
+    """
+    Insert one batch of parsed rows, record their old -> new ids and stage their edges
+
+    :return:
+        The new task ids, in batch order
+    """
+    task_ids = db.scalars(
+        insert(Task).returning(Task.id, sort_by_parameter_order=True),
+        [
+            {key: row[key] for key in ('title', 'description', 'status', 'dueDate', 'createdAt', 'updatedAt')}
+            for row in batch
+        ],
+    ).all()
+
+    tag_ids = resolve_tag_ids({tag for row in batch for tag in row['tags']}, db)
+    tag_rows = [
+        {'task_id': task_id, 'tag_id': tag_ids[tag]}
+        for task_id, row in zip(task_ids, batch)
+        for tag in row['tags']
+    ]
+    if tag_rows:
+        db.execute(task_tags.insert(), tag_rows)
+
+    id_rows = [
+        {'old_id': row['old_id'], 'new_id': task_id}
+        for task_id, row in zip(task_ids, batch)
+        if row['old_id'] is not None
+    ]
+    if id_rows:
+        db.connection().exec_driver_sql(
+            'INSERT OR IGNORE INTO temp.import_ids (old_id, new_id) VALUES (?, ?)',
+            [(id_row['old_id'], id_row['new_id']) for id_row in id_rows],
+        )
+
+    edge_rows = [(task_id, 'parent', row['parent']) for task_id, row in zip(task_ids, batch) if row['parent']]
+    edge_rows += [
+        (task_id, 'link', link_id)
+        for task_id, row in zip(task_ids, batch)
+        for link_id in dict.fromkeys(row['links'])  # de-duplicate, keep order
+    ]
+    if edge_rows:
+        db.connection().exec_driver_sql(
+            'INSERT INTO temp.import_edges (task_id, kind, old_target_id) VALUES (?, ?, ?)', edge_rows
+        )
+    return task_ids
+
+
+def _commit_batch(batch: List[Dict[str, Any]], db: Session) -> int:
+    """
+    Write and commit one batch, then tell the listeners about the new tasks
+    """
+    task_ids = _write_batch(batch, db)
+    db.commit()
+    for task_id, row in zip(task_ids, batch):
+        notify('added', task_id, status=row['status'], added_links=[])
+    return len(task_ids)
+
+
+# second pass: map each staged edge's old target id to its new id
+RESOLVE_PARENTS_SQL = """
+    UPDATE tasks SET parent_id = ids.new_id
+    FROM temp.import_edges AS edges JOIN temp.import_ids AS ids ON ids.old_id = edges.old_target_id
+    WHERE edges.kind = 'parent' AND tasks.id = edges.task_id
+"""
+RESOLVE_LINKS_SQL = """
+    INSERT OR IGNORE INTO task_links (task_id, linked_task_id)
+    SELECT edges.task_id, ids.new_id
+    FROM temp.import_edges AS edges JOIN temp.import_ids AS ids ON ids.old_id = edges.old_target_id
+    WHERE edges.kind = 'link'
+"""
+UNRESOLVED_SQL = """
+    SELECT count(*) FROM temp.import_edges AS edges
+    WHERE NOT EXISTS (SELECT 1 FROM temp.import_ids AS ids WHERE ids.old_id = edges.old_target_id)
+"""
+RESOLVED_LINKS_SQL = """
+    SELECT edges.task_id, ids.new_id
+    FROM temp.import_edges AS edges JOIN temp.import_ids AS ids ON ids.old_id = edges.old_target_id
+    WHERE edges.kind = 'link'
+    ORDER BY edges.task_id
+"""
+
+
+def import_tasks(
+    source: TextIO, fmt: str = 'jsonl', bind: Engine = engine, batch_size: int = IMPORT_BATCH_SIZE
+) -> ImportResult:
+    """
+    Add the tasks in a JSONL or CSV file (as written by export_tasks), giving them new ids
+    Rows are read one at a time and committed every batch_size tasks, see import_rows.
+
+    :param source:
+        Open text file to read from
+    :param fmt:
+        'jsonl' or 'csv'
+    :param bind:
+        SQLAlchemy engine to write to
+    :param batch_size:
+        Number of tasks per transaction
+
+    :return:
+        ImportResult with the number of tasks imported, the failed lines and the number of unresolved references
+
+    :raises ValueError:
+        If the format isn't one of FORMATS
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown format {fmt!r}, expected one of {", ".join(FORMATS)}')
+    return import_rows(_read_rows(source, fmt), bind=bind, batch_size=batch_size)
+
+
+def import_rows(
+    rows: Iterable[Tuple[int, Any]], bind: Engine = engine, batch_size: int = IMPORT_BATCH_SIZE
+) -> ImportResult:
+    """
+    Add tasks from (line number, row dictionary) pairs with the FIELDS of an export, giving them new ids
+    Parent and link ids refer to the ids of the rows, and are resolved once every task is in - ids that aren't
+    in the rows are counted as unresolved and dropped. Invalid rows are reported and skipped.
+
+    :param rows:
+        (line number, row) pairs, consumed one at a time
+    :param bind:
+        SQLAlchemy engine to write to
+    :param batch_size:
+        Number of tasks per transaction
+
+    :return:
+        ImportResult with the number of tasks imported, the failed lines and the number of unresolved references
+    """
+    imported = 0
+    failed = []
+    # one connection throughout, as TEMP tables only exist on the connection that made them
+    with bind.connect() as conn:
+        conn.exec_driver_sql(
+            'CREATE TEMP TABLE IF NOT EXISTS import_ids (old_id INTEGER PRIMARY KEY, new_id INTEGER NOT NULL)'
+        )
+        conn.exec_driver_sql(
+            'CREATE TEMP TABLE IF NOT EXISTS import_edges '
+            '(task_id INTEGER NOT NULL, kind TEXT NOT NULL, old_target_id INTEGER NOT NULL)'
+        )
+        conn.commit()
+        db = Session(bind=conn, autoflush=False)
+        try:
+            # STEP 1: Insert the tasks batch by batch, staging their edges - only one batch is held in memory
+            parsed = []
+            for line_number, row in rows:
+                try:
+                    parsed.append(_parse_row(row))
+                except (TypeError, ValueError) as error:
+                    failed.append((line_number, str(error)))
+                if len(parsed) >= batch_size:
+                    imported += _commit_batch(parsed, db)
+                    parsed = []
+            if parsed:
+                imported += _commit_batch(parsed, db)
+
+            # STEP 2: Resolve parents and links against the id map, in one statement each
+            db.execute(text(RESOLVE_PARENTS_SQL))
+            db.execute(text(RESOLVE_LINKS_SQL))
+            unresolved = db.execute(text(UNRESOLVED_SQL)).scalar()
+            db.commit()
+
+            if has_listeners():
+                for task_id, pairs in groupby(db.execute(text(RESOLVED_LINKS_SQL)), key=lambda pair: pair[0]):
+                    notify('updated', task_id, added_links=[linked_task_id for _, linked_task_id in pairs])
+        finally:
+            db.close()
+            conn.exec_driver_sql('DROP TABLE IF EXISTS temp.import_ids')
+            conn.exec_driver_sql('DROP TABLE IF EXISTS temp.import_edges')
+            conn.commit()
+
+    return ImportResult(imported=imported, failed=failed, unresolved=unresolved)
+
@@ -0,0 +1,231 @@
+# MODULES
+import sys
+import os
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+from task_tracker.models import init_db  # noqa: E402
+from task_tracker.api import app  # noqa: E402
+
+
+# FIXTURES
+@pytest.fixture(scope='function')
+def client():
+    """
+    Fixture for a Flask test client backed by an in memory database
+    """
+    engine = create_engine(
+        'sqlite:///:memory:', connect_args={'check_same_thread': False}, poolclass=StaticPool
+    )
+    event.listen(engine, 'connect', lambda dbapi_connection, _: dbapi_connection.execute('PRAGMA foreign_keys = ON'))  # as make_engine does
+    init_db(engine)
+    app.config['SESSION_FACTORY'] = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    app.config['TESTING'] = True
+    with app.test_client() as test_client:
+        yield test_client
+    app.config.pop('SESSION_FACTORY')
+    engine.dispose()
+
+
+# TESTS
+def test_task_crud(client):
+    """
+    Test case for creating, reading, updating and deleting a task through the API
+    """
+    response = client.post('/api/tasks', json={'title': 'Write report', 'tags': ['Work'], 'dueDate': '2025-06-15'})
+    assert response.status_code == 201
+    task = response.get_json()
+    assert task['id'] == 1
+    assert task['tags'] == ['work']
+    assert task['dueDate'] == '2025-06-15T00:00:00'
+
+    assert client.get('/api/tasks/1').get_json()['title'] == 'Write report'
+
+    response = client.patch('/api/tasks/1', json={'status': 'done', 'delete_tags': ['work']})
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'done'
+    assert response.get_json()['tags'] == []
+
+    assert client.delete('/api/tasks/1').status_code == 204
+    assert client.get('/api/tasks/1').status_code == 404
+
+
+def test_invalid_requests(client):
+    assert client.post('/api/tasks', json={'description': 'no title'}).status_code == 400
+    assert client.post('/api/tasks', json={'title': 'x', 'parent': 99}).status_code == 400
+    assert client.post('/api/tasks', json={'title': 'x', 'dueDate': '15/06/2025'}).status_code == 400
+    assert client.patch('/api/tasks/99', json={'title': 'x'}).status_code == 404
+    assert client.get('/api/tasks?limit=abc').status_code == 400
+
+    # bodies that aren't JSON objects, and tags / links of the wrong type
+    assert client.post('/api/tasks', json='str').status_code == 400
+    assert client.post('/api/tasks', data='{not json', content_type='application/json').status_code == 400
+    client.post('/api/tasks', json={'title': 'Valid'})
+    assert client.patch('/api/tasks/1', json=[1]).status_code == 400
+    assert client.post('/api/tasks', json={'title': 'x', 'tags': [1]}).status_code == 400
+    assert client.patch('/api/tasks/1', json={'links': 'abc'}).status_code == 400
+    assert client.post('/api/tasks/1/links', json={'ids': ['2']}).status_code == 400
+    assert client.patch('/api/tasks/1', json={'parent': 1}).status_code == 400
+    bad_fields = [
+        {'title': ['x']},
+        {'title': 'x', 'parent': '1'},
+        {'title': 'x', 'status': 1},
+        {'title': 'x', 'description': {}},
+    ]
+    for body in bad_fields:
+        response = client.post('/api/tasks', json=body)
+        assert response.status_code == 400
+        assert response.get_json()['error'].endswith(('must be a string', 'must be a task ID'))
+    assert client.patch('/api/tasks/1', json={'title': 7}).status_code == 400
+    assert client.patch('/api/tasks/1', json={'dueDate': 20250601}).status_code == 400
+    assert client.post('/api/tasks/99/links', json={'ids': [1]}).status_code == 404
+    assert client.get('/api/tasks/1').get_json()['title'] == 'Valid'
+
+
+def test_subtasks_and_links(client):
+    client.post('/api/tasks', json={'title': 'Parent'})
+    client.post('/api/tasks', json={'title': 'Child', 'parent': 1})
+    client.post('/api/tasks', json={'title': 'Blocker'})
+
+    assert [task['id'] for task in client.get('/api/tasks/1/subtasks').get_json()['tasks']] == [2]
+
+    client.post('/api/tasks/1/links', json={'ids': [3]})
+    assert [task['id'] for task in client.get('/api/tasks/1/links').get_json()['links']] == [3]
+    assert [task['id'] for task in client.get('/api/tasks/3/links').get_json()['linked_from']] == [1]
+
+    assert client.delete('/api/tasks/1/links/3').status_code == 204
+    assert client.get('/api/tasks/1').get_json()['links'] == []
+
+
+def test_list_pagination_and_filters(client):
+    for i in range(5):
+        client.post('/api/tasks', json={'title': f'Task {i}', 'tags': ['even'] if i % 2 == 0 else []})
+
+    page = client.get('/api/tasks?limit=2').get_json()
+    assert [task['id'] for task in page['tasks']] == [1, 2]
+    assert page['next'] == 2
+    page = client.get(f'/api/tasks?limit=2&after={page["next"]}').get_json()
+    assert [task['id'] for task in page['tasks']] == [3, 4]
+    page = client.get(f'/api/tasks?limit=2&after={page["next"]}').get_json()
+    assert [task['id'] for task in page['tasks']] == [5]
+    assert page['next'] is None
+
+    page = client.get('/api/tasks?tags=even').get_json()
+    assert [task['id'] for task in page['tasks']] == [1, 3, 5]
+    page = client.get('/api/tasks?tags_none=even').get_json()
+    assert [task['id'] for task in page['tasks']] == [2, 4]
+    page = client.get('/api/tasks?tags_all=even,odd').get_json()
+    assert page['tasks'] == []
+    page = client.get('/api/tasks?tags_all=%20,').get_json()  # blank tags are no filter
+    assert [task['id'] for task in page['tasks']] == [1, 2, 3, 4, 5]
+
+
+def test_list_sorted(client):
+    for title, due in (('Later', '2025-07-01'), ('Someday', None), ('Soon', '2025-06-01')):
+        client.post('/api/tasks', json={'title': title, 'dueDate': due})
+
+    page = client.get('/api/tasks?sort=due&limit=2').get_json()
+    assert [task['title'] for task in page['tasks']] == ['Soon', 'Later']
+    page = client.get(f'/api/tasks?sort=due&limit=2&after={page["next"]}').get_json()
+    assert [task['title'] for task in page['tasks']] == ['Someday']
+    page = client.get('/api/tasks?sort=title&desc=1').get_json()
+    assert [task['title'] for task in page['tasks']] == ['Soon', 'Someday', 'Later']
+    assert client.get('/api/tasks?sort=priority').status_code == 400
+
+
+def test_list_conditional_get(client):
+    """
+    Test case for polling the list with If-None-Match, getting 304s until a task changes
+    """
+    client.post('/api/tasks', json={'title': 'Task'})
+
+    first = client.get('/api/tasks')
+    etag = first.headers['ETag']
+    assert first.headers['Last-Modified']
+
+    response = client.get('/api/tasks', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+    client.patch('/api/tasks/1', json={'tags': ['new']})  # tag only change still bumps updatedAt
+    response = client.get('/api/tasks', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_list_conditional_get_after_delete(client):
+    """
+    Test case for deleting a task changing the ETag of lists showing it as a parent or link of a remaining task
+    """
+    client.post('/api/tasks', json={'title': 'Parent'})
+    client.patch('/api/tasks/1', json={'status': 'done'})
+    client.post('/api/tasks', json={'title': 'Child', 'parent': 1, 'links': [1]})
+
+    first = client.get('/api/tasks?status=to-do')
+    assert (first.get_json()['tasks'][0]['parent_id'], first.get_json()['tasks'][0]['links']) == (1, [1])
+
+    assert client.delete('/api/tasks/1').status_code == 204
+    response = client.get('/api/tasks?status=to-do', headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 200
+    assert (response.get_json()['tasks'][0]['parent_id'], response.get_json()['tasks'][0]['links']) == (None, [])
+
+
+def test_reads_are_cached(client):
+    """
+    Test case for GET requests being served from the cache, and writes through the API invalidating it
+    """
+    client.post('/api/tasks', json={'title': 'Parent'})
+    client.post('/api/tasks', json={'title': 'Child', 'parent': 1, 'tags': ['work']})
+    hits = client.get('/api/cache').get_json()['hits']
+
+    assert client.get('/api/tasks/2').get_json()['tags'] == ['work']
+    assert client.get('/api/tasks/2').get_json()['parent_id'] == 1
+    assert client.get('/api/tasks?limit=1').get_json()['next'] == 1
+    assert client.get('/api/tasks?limit=1').get_json()['tasks'][0]['title'] == 'Parent'
+    assert client.get('/api/cache').get_json()['hits'] == hits + 2
+
+    client.patch('/api/tasks/2', json={'delete_tags': ['work']})
+    assert client.get('/api/tasks/2').get_json()['tags'] == []
+    client.delete('/api/tasks/1')
+    assert client.get('/api/tasks/2').get_json()['parent_id'] is None
+    assert [task['id'] for task in client.get('/api/tasks?limit=1').get_json()['tasks']] == [2]
+
+
+def test_calendar(client):
+    client.post('/api/tasks', json={'title': 'Due', 'dueDate': '2025-06-15'})
+    client.post('/api/tasks', json={'title': 'Also due', 'dueDate': '2025-06-15'})
+
+    data = client.get('/api/calendar?year=2025&month=6').get_json()
+    assert data['start'] == '2025-06-01'
+    assert [(day['date'], day['count']) for day in data['days']] == [('2025-06-15', 2)]
+    assert data['previous'] == {'year': 2025, 'month': 5}
+    assert data['next'] == {'year': 2025, 'month': 7}
+
+    data = client.get('/api/calendar?week=2025-06-15').get_json()
+    assert (data['start'], data['end']) == ('2025-06-09', '2025-06-16')
+    assert data['days'][0]['count'] == 2
+
+    assert client.get('/api/calendar?month=13').status_code == 400
+
+
+def test_ready(client):
+    client.post('/api/tasks', json={'title': 'Design'})
+    client.post('/api/tasks', json={'title': 'Build', 'links': [1]})
+    assert client.get('/api/ready').get_json() == {'tasks': [{'id': 1, 'title': 'Design'}], 'cycles': []}
+
+    client.patch('/api/tasks/1', json={'status': 'done', 'links': [2]})
+    ready = client.get('/api/ready').get_json()
+    assert [task['id'] for task in ready['tasks']] == [2]
+    assert ready['cycles'] == [[1, 2]]
+
+
+def test_stats(client):
+    client.post('/api/tasks', json={'title': 'Task', 'tags': ['work']})
+    stats = client.get('/api/stats').get_json()
+    assert stats['total'] == 1
+    assert stats['tags'] == {'work': 1}
@@ -0,0 +1,64 @@
+# MODULES
+import sys
+import os
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+from task_tracker.models import Task, init_db, make_engine  # noqa: E402
+from benchmarks.compare import compare  # noqa: E402
+from benchmarks.dataset import DatasetSpec, generate_rows, load_dataset  # noqa: E402
+from benchmarks.stress import run_stress  # noqa: E402
+
+
+def test_generate_rows_is_deterministic():
+    """
+    Test case for the same spec generating the same tasks, with parents and links to earlier tasks only
+    """
+    spec = DatasetSpec(tasks=500, max_depth=2, seed=7)
+    rows = list(generate_rows(spec))
+    assert rows == list(generate_rows(spec))
+    assert rows != list(generate_rows(spec._replace(seed=8)))
+
+    depth = {}
+    for row in rows:
+        assert all(link_id < row['id'] for link_id in row['links'])
+        depth[row['id']] = depth[row['parent_id']] + 1 if row['parent_id'] else 0
+        assert depth[row['id']] <= 2
+
+
+def test_load_dataset():
+    """
+    Test case for loading a generated dataset through the importer
+    """
+    engine = make_engine(':memory:')
+    init_db(engine)
+    result = load_dataset(DatasetSpec(tasks=300), engine, batch_size=100)
+    assert (result.imported, result.failed, result.unresolved) == (300, [], 0)
+    with Session(engine) as db:
+        assert db.scalar(select(func.count(Task.id))) == 300
+    engine.dispose()
+
+
+def test_compare_flags_regressions():
+    """
+    Test case for comparing results, a drop in ops/s or rise in p99 beyond the threshold is a regression
+    """
+    baseline = {'results': {'add': {'ops_per_sec': 100, 'p99_ms': 10}, 'list': {'ops_per_sec': 50, 'p99_ms': 5}}}
+    current = {'results': {'add': {'ops_per_sec': 95, 'p99_ms': 10.5}, 'list': {'ops_per_sec': 50, 'p99_ms': 8}}}
+    rows = {row['name']: row for row in compare(baseline, current, threshold=10)}
+    assert rows['add']['regression'] is False
+    assert rows['list']['regression'] is True
+    assert rows['list']['p99_change'] == 60.0
+
+
+def test_concurrent_writers_lose_nothing(tmp_path):
+    """
+    Test case for several writer processes, CLI and API style, sharing one file without lost or failed writes
+    """
+    result = run_stress(str(tmp_path / 'stress.db'), writers=4, writes=15, hold_ms=2, engine_profile='performance')
+    assert (result['found'], result['lost'], result['open'], result['failed']) == (60, 0, 0, 0)
+    assert result['count_mismatches'] == 0
+    assert result['locks']['failures'] == 0
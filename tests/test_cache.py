@@ -0,0 +1,140 @@
+# MODULES
+import sys
+import os
+import subprocess
+import pytest
+from sqlalchemy.orm import Session
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+from task_tracker.models import init_db, make_engine  # noqa: E402
+from task_tracker.core import add_task, delete_task, update_task  # noqa: E402
+from task_tracker.cache import TaskCache  # noqa: E402
+
+
+# Run in another process: one write to the database file, through core
+OTHER_PROCESS_WRITE = """
+import sys
+from sqlalchemy.orm import Session
+from task_tracker.core import add_task, update_task
+from task_tracker.models import make_engine
+engine = make_engine(sys.argv[1])
+with Session(engine) as db:
+    if sys.argv[2] == 'add':
+        add_task(sys.argv[3], db=db)
+    else:
+        update_task(int(sys.argv[2]), title=sys.argv[3], db=db)
+engine.dispose()
+"""
+
+
+# FIXTURES
+@pytest.fixture(scope='function')
+def engine(tmp_path):
+    """
+    Fixture for an engine on a database file with: 1 'Plan', 2 'Test', 3 'Docs', 4 'Build' (subtask of 1, links to 2)
+    """
+    engine = make_engine(str(tmp_path / 'tasks.db'))
+    init_db(engine)
+    with Session(engine) as db:
+        add_task('Plan', db=db)
+        add_task('Test', db=db)
+        add_task('Docs', db=db)
+        add_task('Build', parent=1, links=[2], db=db)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(scope='function')
+def cache():
+    """
+    Fixture for an attached cache
+    """
+    task_cache = TaskCache(max_tasks=3, max_lists=2).attach()
+    yield task_cache
+    task_cache.detach()
+
+
+def read(cache, engine, *task_ids):
+    """
+    Read tasks through the cache in a new session, returning their titles
+    """
+    with Session(engine) as db:
+        return [cache.get_task_row(task_id, db).title for task_id in task_ids]
+
+
+def write_from_other_process(engine, *args):
+    subprocess.run(
+        [sys.executable, '-c', OTHER_PROCESS_WRITE, engine.url.database, *args],
+        cwd=project_root,
+        check=True,
+    )
+
+
+# TESTS
+def test_hits_misses_and_eviction(cache, engine):
+    """
+    Test case for repeated reads being served from the cache, and the least recently used task being evicted
+    """
+    with Session(engine) as db:
+        build = cache.get_task_row(4, db)
+        assert (build.parent_title, build.link_titles, build.link_ids) == ('Plan', ['Test'], [2])
+        assert cache.get_task_row(4, db) is build
+        assert cache.get_task_row(99, db) is None
+        cache.get_task_row(1, db)
+        cache.get_task_row(2, db)
+        cache.get_task_row(4, db)  # now the most recently used
+        cache.get_task_row(3, db)  # evicts 1
+        stats = cache.stats()
+        assert (stats.hits, stats.misses, stats.evictions, stats.tasks) == (2, 5, 1, 3)
+
+        assert [row.id for row in cache.list_task_rows(db, limit=2)] == [1, 2]
+        assert [row.id for row in cache.list_task_rows(db, limit=2, after=2)] == [3, 4]
+        assert [row.title for row in cache.list_task_rows(db, limit=2)] == ['Plan', 'Test']
+        assert cache.stats().hits == 3
+
+
+def test_local_writes_invalidate_precisely(cache, engine):
+    """
+    Test case for writes through core dropping the changed task, the rows showing its title and the list pages,
+    and nothing else
+    """
+    read(cache, engine, 4, 3)
+    with Session(engine) as db:
+        cache.list_task_rows(db, limit=10)
+        update_task(1, title='Plan v2', db=db)  # the parent of 4
+        assert cache.stats().tasks == 1  # only 3 is left
+
+    with Session(engine) as db:
+        assert cache.get_task_row(4, db).parent_title == 'Plan v2'
+        assert cache.get_task_row(3, db).title == 'Docs'
+        assert cache.list_task_rows(db, limit=10)[0].title == 'Plan v2'
+        assert cache.stats().hits == 1
+
+        update_task(2, title='Test all', db=db)  # linked from 4
+        assert cache.get_task_row(4, db).link_titles == ['Test all']
+        delete_task(2, db=db)
+        assert cache.get_task_row(4, db).link_ids == []
+        assert [row.id for row in cache.list_task_rows(db, limit=10)] == [1, 3, 4]
+    assert cache.stats().clears == 1  # only the first read, on a connection the cache hadn't seen
+
+
+def test_other_process_writes_clear_cache(cache, engine):
+    """
+    Test case for two processes taking turns to write the same file, each read after a write seeing it
+    """
+    assert read(cache, engine, 1, 2) == ['Plan', 'Test']
+    assert read(cache, engine, 1, 2) == ['Plan', 'Test']
+    assert cache.stats().hits == 2
+
+    write_from_other_process(engine, '1', 'Plan (other process)')
+    assert read(cache, engine, 1, 2) == ['Plan (other process)', 'Test']
+    with Session(engine) as db:
+        update_task(2, title='Test (this process)', db=db)
+    assert read(cache, engine, 1, 2) == ['Plan (other process)', 'Test (this process)']
+
+    write_from_other_process(engine, 'add', 'Release')
+    with Session(engine) as db:
+        assert [row.title for row in cache.list_task_rows(db)][-1] == 'Release'
+    assert cache.stats().clears == 3  # first read, then once per write of the other process
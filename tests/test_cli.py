@@ -0,0 +1,424 @@
+# MODULES
+import sys
+import os
+import datetime as dt
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session, sessionmaker
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+from task_tracker.models import Task, init_db, make_engine  # noqa: E402
+from task_tracker.core import add_task, delete_task, get_task, iter_task_rows, update_task  # noqa: E402
+import task_tracker.core as core  # noqa: E402
+from task_tracker.cli import PersistentSession, handle_list_command, run_batch  # noqa: E402
+import task_tracker.cli as cli  # noqa: E402
+
+
+# FIXTURES
+@pytest.fixture(scope='function')
+def db_path(tmp_path):
+    """
+    Fixture for an initialised database file
+    """
+    path = str(tmp_path / 'tasks.db')
+    engine = make_engine(path)
+    init_db(engine)
+    engine.dispose()
+    return path
+
+
+@pytest.fixture(scope='function')
+def persistent(db_path):
+    """
+    Fixture for a PersistentSession on the database file
+    """
+    engine = make_engine(db_path)
+    session = PersistentSession(bind=engine)
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def count_tasks(db_path: str) -> int:
+    """
+    Count tasks from a separate engine, i.e. what another process would see
+    It only reads, so it begins deferred and doesn't wait for the write lock of an open batch
+    """
+    engine = make_engine(db_path, begin_mode='DEFERRED')
+    with engine.connect() as conn:
+        count = conn.exec_driver_sql('SELECT count(*) FROM tasks').scalar()
+    engine.dispose()
+    return count
+
+
+# TESTS
+def test_identity_map_stays_warm(persistent):
+    """
+    Test case for objects loaded by one command being reused by the next without a query
+    """
+    with persistent.command_scope() as db:
+        add_task('Warm task', db=db)
+        task = get_task(1, db)
+
+    statements = []
+    event.listen(persistent.connection, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    with persistent.command_scope() as db:
+        assert get_task(1, db) is task
+        assert task.title == 'Warm task'
+    assert not [sql for sql in statements if sql.startswith('SELECT')]
+
+
+def test_failed_command_only_rolls_back_itself(persistent, db_path):
+    """
+    Test case for an error in one command undoing that command, not earlier ones
+    """
+    with persistent.command_scope() as db:
+        add_task('Kept', db=db)
+
+    with pytest.raises(RuntimeError):
+        with persistent.command_scope() as db:
+            add_task('Undone', db=db)
+            raise RuntimeError('handler failed')
+
+    with persistent.command_scope() as db:
+        assert [task.title for task in db.query(Task)] == ['Kept']
+    assert count_tasks(db_path) == 1
+
+
+def test_rolled_back_command_resets_graph(persistent, db_path):
+    """
+    Test case for the session's dependency graph not keeping a change that core notified but that was rolled back
+    """
+    with persistent.command_scope() as db:
+        add_task('Design', db=db)
+        add_task('Build', links=[1], db=db)
+    with persistent.command_scope(read_only=True) as db:
+        assert persistent.graph.sync(db).ready() == [1]
+
+    with pytest.raises(RuntimeError):
+        with persistent.command_scope() as db:
+            update_task(1, status='done', db=db)  # notified as soon as core commits its savepoint
+            raise RuntimeError('handler failed')
+
+    with persistent.command_scope(read_only=True) as db:
+        assert persistent.graph.sync(db).ready() == [1]
+
+
+def test_external_write_expires_cached_objects(persistent, db_path):
+    """
+    Test case for a write from another connection being picked up by the next command
+    """
+    with persistent.command_scope() as db:
+        add_task('Original', db=db)
+        task = get_task(1, db)
+
+    other = make_engine(db_path)
+    with other.begin() as conn:
+        conn.exec_driver_sql("UPDATE tasks SET title = 'Changed elsewhere' WHERE id = 1")
+    other.dispose()
+
+    with persistent.command_scope() as db:
+        assert get_task(1, db).title == 'Changed elsewhere'
+    assert task.title == 'Changed elsewhere'
+
+
+def test_commands_are_batched(db_path):
+    """
+    Test case for several commands sharing one transaction
+    """
+    engine = make_engine(db_path)
+    session = PersistentSession(bind=engine, batch_size=3)
+    for title in ('a', 'b'):
+        with session.command_scope() as db:
+            add_task(title, db=db)
+    assert count_tasks(db_path) == 0  # not committed yet
+
+    with session.command_scope() as db:
+        add_task('c', db=db)
+    assert count_tasks(db_path) == 3
+
+    with session.command_scope() as db:
+        add_task('d', db=db)
+    session.close()  # commits the partial batch
+    assert count_tasks(db_path) == 4
+    engine.dispose()
+
+
+def test_read_only_commands_begin_deferred(db_path, monkeypatch):
+    """
+    Test case for read-only commands not holding the write lock, in a plain session while they stream tasks and in
+    an open batch of a persistent session
+    """
+    wal = {'journal_mode': 'WAL'}
+    engine = make_engine(db_path, wal)
+    other = make_engine(db_path, {**wal, 'busy_timeout': 0})  # fails straight away if the lock is held
+    monkeypatch.setattr(core, 'sessionLocal', sessionmaker(bind=engine))
+    with Session(engine) as db:
+        add_task('a', db=db)
+        add_task('b', db=db)
+
+    with cli.session_scope(read_only=True) as db:
+        rows = iter_task_rows(db, chunk_size=1)
+        assert next(rows).title == 'a'
+        with Session(other) as writer:
+            add_task('written while streaming', db=writer)
+        assert [row.title for row in rows] == ['b']  # same snapshot
+
+    session = PersistentSession(bind=engine, batch_size=10)
+    with session.command_scope(read_only=True) as db:
+        assert len(list(iter_task_rows(db))) == 3
+    with Session(other) as writer:
+        add_task('written during the batch', db=writer)
+    with session.command_scope() as db:  # ends the read-only transaction, and takes the lock
+        add_task('c', db=db)
+        assert len(list(iter_task_rows(db))) == 5
+    session.close()
+    other.dispose()
+    engine.dispose()
+    assert count_tasks(db_path) == 5
+
+
+def test_run_batch(db_path, capsys):
+    """
+    Test case for running a script of commands, with failing lines reported and skipped
+    """
+    engine = make_engine(db_path)
+    lines = [
+        'add "First task" --tags work',
+        '# a comment',
+        '',
+        'add "Second task',  # unmatched quote
+        'frobnicate 1',  # unknown command
+        'add Third --parent 1',
+        'mark-done 1',
+        'exit',
+        'add Never run',
+    ]
+    summary = run_batch(lines, batch_size=2, bind=engine)
+    engine.dispose()
+
+    assert summary.commands == 6
+    assert [line for line, _ in summary.failed] == [4, 5]
+    assert count_tasks(db_path) == 2
+    assert 'Batch finished: 6 commands' in capsys.readouterr().out
+
+
+def test_run_batch_counts_failed_commands(db_path, capsys):
+    """
+    Test case for commands that fail in their handler (missing task, invalid flag) being counted as failed
+    """
+    engine = make_engine(db_path)
+    lines = [
+        'add Kept',
+        'delete 99',
+        'update 99 --title x',
+        'mark-done 42',
+        'add --bogus y',
+        'add child --parent 99',
+        'update 1 --title Renamed',
+    ]
+    summary = run_batch(lines, bind=engine)
+    engine.dispose()
+
+    assert [line for line, _ in summary.failed] == [2, 3, 4, 5, 6]
+    assert summary.failed[-1][1] == 'Parent task 99 not found'
+    assert summary.failed[0][1] == 'Task 99 not found in the database'
+    out = capsys.readouterr().out
+    assert 'Line 5: Invalid flag' in out
+    assert '5 failed' in out
+    assert count_tasks(db_path) == 1
+
+
+def test_list_pages_are_cached(db_path, capsys):
+    """
+    Test case for repeated list pages in a batch being served from the cache, and seeing the writes in between
+    """
+    engine = make_engine(db_path)
+    lines = [
+        'add First',
+        'add Second',
+        'list --limit 1',
+        'list --limit 1',
+        'update 1 --title Renamed',
+        'list --limit 1',
+        'stats cache',
+    ]
+    run_batch(lines, bind=engine)
+    engine.dispose()
+
+    out = capsys.readouterr().out
+    assert out.count('Title: First') == 2
+    assert out.count('Title: Renamed') == 1
+    assert 'Cache hits: 1, misses: 2' in out
+
+
+def test_list_next_page_hint(db_path, capsys):
+    """
+    Test case for list --limit only pointing to a next page when there is one
+    """
+    engine = make_engine(db_path)
+    run_batch(['add First', 'add Second', 'list --limit 1', 'list --limit 2', 'list --limit 1 --after 1'], bind=engine)
+    engine.dispose()
+
+    out = capsys.readouterr().out
+    assert out.count('for the next page') == 1
+    assert 'Showing 1 tasks, use --after 1 for the next page' in out
+
+
+def test_list_rejects_limit_below_one(db_path, capsys):
+    """
+    Test case for list --limit 0 or a negative limit failing its batch line instead of listing
+    """
+    engine = make_engine(db_path)
+    summary = run_batch(['add First', 'list --limit 0', 'list --limit -1'], bind=engine)
+    engine.dispose()
+
+    out = capsys.readouterr().out
+    assert [line for line, _ in summary.failed] == [2, 3]
+    assert out.count('--limit must be at least 1') == 2
+    assert 'Title: ' not in out and 'use --after None' not in out
+
+
+def test_list_limit_reads_one_page(db_path, monkeypatch, capsys):
+    """
+    Test case for list --limit outside the REPL reading limit + 1 rows, not a whole stream chunk
+    """
+    engine = make_engine(db_path)
+    with Session(engine) as db:
+        for day in range(1, 6):
+            add_task(f'Task {day}', dueDate=dt.datetime(2025, 6, day), db=db)
+    limits = []
+    event.listen(
+        engine,
+        'before_cursor_execute',
+        lambda conn, cursor, statement, parameters, *args: 'LIMIT' in statement and limits.append(parameters),
+    )
+
+    monkeypatch.setattr(core, 'sessionLocal', sessionmaker(bind=engine))
+    handle_list_command(['--sort', 'due', '--limit', '2'])
+    engine.dispose()
+
+    assert limits and all(3 in parameters and 500 not in parameters for parameters in limits)
+    out = capsys.readouterr().out
+    assert out.count('Title: ') == 2
+    assert 'Showing 2 tasks, use --after 2 for the next page' in out
+
+
+def test_ready_keeps_graph_between_commands(db_path, capsys):
+    """
+    Test case for ready in batch mode loading the dependency graph once, then following the changes
+    """
+    engine = make_engine(db_path)
+    loads = []
+    event.listen(
+        engine,
+        'before_cursor_execute',
+        lambda conn, cursor, statement, *args: 'FROM task_links' in statement and loads.append(statement),
+    )
+    run_batch(['add Design', 'add Build --links 1', 'ready', 'mark-done 1', 'ready'], bind=engine)
+    engine.dispose()
+
+    out = capsys.readouterr().out
+    assert '1: Design' in out
+    assert '2: Build' in out
+    assert len(loads) == 1
+
+
+def test_list_sorted(db_path, capsys):
+    """
+    Test case for list --sort / --desc / --limit, tasks without a due date last
+    """
+    engine = make_engine(db_path)
+    lines = [
+        'add Later --due-date 2025-07-01',
+        'add Someday',
+        'add Soon --due-date 2025-06-01',
+        'list --sort due --limit 2',
+        'list --sort title --desc',
+        'list --sort priority',
+    ]
+    run_batch(lines, bind=engine)
+    engine.dispose()
+
+    out = capsys.readouterr().out
+    titles = [line[len('Title: '):] for line in out.splitlines() if line.startswith('Title: ')]
+    assert titles == ['Soon', 'Later', 'Soon', 'Someday', 'Later']
+    assert 'Error: --sort must be one of' in out
+
+
+def test_export_import_commands(db_path, tmp_path, capsys):
+    """
+    Test case for the export and import commands, run in batch mode
+    """
+    engine = make_engine(db_path)
+    export_path = tmp_path / 'tasks.csv'
+    lines = [
+        'add Parent --tags work',
+        'add Child --parent 1',
+        f'export {export_path}',
+        f'import {export_path} --format csv',
+    ]
+    summary = run_batch(lines, bind=engine)
+    engine.dispose()
+
+    assert summary.failed == []
+    assert count_tasks(db_path) == 4
+    output = capsys.readouterr().out
+    assert 'Exported 2 tasks' in output
+    assert 'Imported 2 tasks' in output
+
+
+def test_bulk_update_commands(db_path, capsys):
+    """
+    Test case for marking id ranges and updating by filter with --where / --set, run in batch mode
+    """
+    engine = make_engine(db_path)
+    lines = [f'add Task{i} --tags {"q3" if i % 2 else "q4"}' for i in range(1, 7)] + [
+        'mark-done 1-3,5',
+        'update --where status=to-do --tags q4 --set status=in-progress title=Moved',
+        'update 2 --set title=Renamed',
+    ]
+    summary = run_batch(lines, bind=engine)
+
+    assert summary.failed == []
+    output = capsys.readouterr().out
+    assert '4 of 4 tasks marked done' in output
+    assert '2 tasks updated' in output
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql('SELECT id, title, status FROM tasks ORDER BY id').all()
+    engine.dispose()
+    assert [tuple(row) for row in rows] == [
+        (1, 'Task1', 'done'),
+        (2, 'Renamed', 'done'),
+        (3, 'Task3', 'done'),
+        (4, 'Moved', 'in-progress'),
+        (5, 'Task5', 'done'),
+        (6, 'Moved', 'in-progress'),
+    ]
+
+
+def test_delete_commands(persistent, db_path, capsys):
+    """
+    Test case for deleting a subtree and by filter through the persistent session, with loaded tasks kept in line
+    """
+    with persistent.command_scope() as db:
+        add_task('Parent', db=db)
+        add_task('Child', parent=1, db=db)
+        add_task('Grandchild', parent=2, db=db)
+        add_task('Kept', parent=1, db=db)
+    with persistent.command_scope() as db:
+        kept = get_task(4, db)
+        assert kept.parent.title == 'Parent'
+        delete_task(2, db=db, subtree=True)
+        delete_task(1, db=db)
+        assert kept.parent_id is None  # cleared by ON DELETE SET NULL, reloaded
+    assert count_tasks(db_path) == 1
+
+    engine = make_engine(db_path)
+    summary = run_batch(['add Done --tags q3', 'mark-done 5', 'delete --where status=done --tags q3'], bind=engine)
+    engine.dispose()
+    assert summary.failed == []
+    assert '1 tasks deleted' in capsys.readouterr().out
+    assert count_tasks(db_path) == 1
@@ -0,0 +1,70 @@
+# MODULES
+import sys
+import os
+import json
+import pytest
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+from task_tracker.config import PROFILES, load_settings  # noqa: E402
+from task_tracker.models import make_engine  # noqa: E402
+
+
+# TESTS
+def test_default_settings(tmp_path):
+    """
+    Test case for the defaults when nothing is configured
+    """
+    settings = load_settings({'TASK_TRACKER_CONFIG': str(tmp_path / 'missing.json')})
+    assert settings.db_path == './tasks.db'
+    assert settings.profile == 'default'
+    assert settings.pragmas == PROFILES['default']
+
+
+def test_env_overrides_config_file(tmp_path):
+    """
+    Test case for environment variables taking priority over the config file
+    """
+    config_path = tmp_path / 'task_tracker.json'
+    config_path.write_text(
+        json.dumps(
+            {'db_path': '/data/tasks.db', 'profile': 'small', 'profiles': {'small': {'cache_size': -2000}}}
+        )
+    )
+
+    settings = load_settings({'TASK_TRACKER_CONFIG': str(config_path)})
+    assert settings == ('/data/tasks.db', 'small', {'cache_size': -2000})
+
+    settings = load_settings(
+        {'TASK_TRACKER_CONFIG': str(config_path), 'TASK_TRACKER_PROFILE': 'performance', 'TASK_TRACKER_DB': 'x.db'}
+    )
+    assert settings.db_path == 'x.db'
+    assert settings.pragmas['journal_mode'] == 'WAL'
+
+
+def test_invalid_profiles(tmp_path):
+    """
+    Test case for unknown profiles and pragmas being rejected
+    """
+    with pytest.raises(ValueError):
+        load_settings({'TASK_TRACKER_CONFIG': str(tmp_path / 'missing.json'), 'TASK_TRACKER_PROFILE': 'nope'})
+
+    config_path = tmp_path / 'task_tracker.json'
+    config_path.write_text(json.dumps({'profile': 'bad', 'profiles': {'bad': {'foreign_keys; DROP': 1}}}))
+    with pytest.raises(ValueError):
+        load_settings({'TASK_TRACKER_CONFIG': str(config_path)})
+
+
+def test_engine_applies_profile_pragmas(tmp_path):
+    """
+    Test case for the performance profile's pragmas being set on each connection
+    """
+    engine = make_engine(str(tmp_path / 'tasks.db'), PROFILES['performance'])
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+        assert conn.exec_driver_sql('PRAGMA synchronous').scalar() == 1  # NORMAL
+        assert conn.exec_driver_sql('PRAGMA busy_timeout').scalar() == 5000
+        assert conn.exec_driver_sql('PRAGMA cache_size').scalar() == -65536
+        assert conn.exec_driver_sql('PRAGMA temp_store').scalar() == 2  # MEMORY
+    engine.dispose()
@@ -2,19 +2,39 @@
 import sys
 import os
 import pytest
-from sqlalchemy import create_engine  # estabilish database connection
+import datetime as dt
+from sqlalchemy import create_engine, event, select  # estabilish database connection
 from sqlalchemy.orm import sessionmaker  # create database session
 
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
-from task_tracker.models import Base, Task  # noqa: E402
+from task_tracker.models import Base, Task, Tag, init_db, task_counts, task_links, task_tags  # noqa: E402
 from task_tracker.core import (  # noqa: E402
     add_task,
+    add_tasks,
     get_task,
     update_task,
+    bulk_update,
     delete_task,
+    delete_tasks,
+    list_tasks,
+    iter_tasks,
+    iter_task_rows,
+    list_task_rows,
+    get_subtree,
+    get_ancestors,
+    subtree_rollup,
+    search_tasks,
+    calendar_days,
+    month_window,
+    week_window,
+    get_stats,
+    verify_stats,
+    rebuild_stats,
+    get_events,
 )
+from task_tracker.cli import display_task, DISPLAY_FIELDS  # noqa: E402
 
 # SQLite DB for Testing
 TEST_DB_URL = 'sqlite:///:memory:'
@@ -28,7 +48,8 @@ def test_engine():
     Fixture for a SQLAlchemy engine for testing
     """
     engine = create_engine(TEST_DB_URL)  # create database engine
-    Base.metadata.create_all(engine)  # create tables
+    event.listen(engine, 'connect', lambda dbapi_connection, _: dbapi_connection.execute('PRAGMA foreign_keys = ON'))  # as make_engine does
+    init_db(engine)  # create tables, and the objects added by migrations (search index, ...)
     yield engine  # provide the engine to the test functions that need it (test_session)
     Base.metadata.drop_all(
         engine
@@ -103,6 +124,54 @@ def test_delete_task(test_session):
     assert message == 'Task 1 not found in the database'
 
 
+def test_delete_cascades_in_sql(test_session):
+    """
+    Test case for deletes removing tag and link rows and orphaning subtasks in the database, with the session in line
+    """
+    add_task('Parent', tags=['work'], db=test_session)
+    add_task('Child', parent=1, tags=['work', 'home'], links=[1], db=test_session)
+    add_task('Grandchild', parent=2, links=[1, 2], db=test_session)
+    add_task('Other', links=[1], tags=['home'], db=test_session)
+    other = get_task(4, test_session)
+    assert [link.title for link in other.links] == ['Parent']
+
+    assert delete_task(1, db=test_session) == 'Task 1 deleted'
+    assert get_task(2, test_session).parent_id is None  # set to NULL by the database
+    assert other.links == []  # expired, reloaded without the deleted task
+    assert test_session.execute(select(task_links.c.linked_task_id).distinct()).scalars().all() == [2]
+
+    assert delete_task(2, db=test_session, subtree=True) == 'Task 2 and 1 subtasks deleted'
+    assert [task.id for task in list_tasks(test_session)] == [4]
+    assert test_session.execute(select(task_links)).all() == []
+    assert test_session.execute(select(task_tags.c.task_id)).scalars().all() == [4]
+    assert get_stats(test_session)['tags'] == {'home': 1}
+    assert verify_stats(test_session) == {}
+    assert search_tasks('child', test_session) == []
+    assert delete_task(2, db=test_session) == 'Task 2 not found in the database'
+
+
+def test_delete_tasks_by_filter(test_session):
+    """
+    Test case for deleting many tasks with one statement, by filter and by subtree
+    """
+    add_tasks(
+        [{'title': 'Done q3', 'tags': ['q3']}, {'title': 'Open q3', 'tags': ['q3']}, {'title': 'Done q4', 'tags': ['q4']}],
+        db=test_session,
+    )
+    add_task('Subtask of done q3', parent=1, db=test_session)
+    bulk_update({'status': 'done'}, test_session, task_ids=[1, 3])
+
+    assert delete_tasks(test_session, status='done', tags=['q3'], subtree=True) == [1, 4]
+    assert delete_tasks(test_session, task_ids=[3, 99], tags_none=['q4']) == []
+    assert [task.id for task in list_tasks(test_session)] == [2, 3]
+    assert verify_stats(test_session) == {}
+    with pytest.raises(ValueError):
+        delete_tasks(test_session)
+    with pytest.raises(ValueError):
+        delete_tasks(test_session, tags_all=[' '])  # normalises to no filter, so it can't delete every task
+    assert [task.id for task in list_tasks(test_session)] == [2, 3]
+
+
 def test_update_title(test_session):
     """
     Test case for updating a task's title
@@ -144,3 +213,424 @@ def test_update_description(test_session):
 
     update_task(1, description='new description', db=test_session)
     assert task.description == 'new description'
+
+
+def test_add_tasks_bulk(test_session):
+    """
+    Test case for adding many tasks at once, with shared tags and links
+    """
+    add_task('Existing task', tags=['work'], db=test_session)
+
+    result = add_tasks(
+        [
+            {'title': 'First', 'tags': ['Work', 'urgent']},
+            {'title': 'Second', 'tags': ['urgent', 'urgent'], 'links': [1, 999]},
+            {'title': 'Child', 'parent': 1},
+        ],
+        db=test_session,
+    )
+    assert result.added == [2, 3, 4]
+    assert result.failed == []
+
+    assert test_session.query(Tag).count() == 2  # 'work' reused, 'urgent' created once
+    first, second, child = (test_session.get(Task, task_id) for task_id in result.added)
+    assert sorted(tag.name for tag in first.tags) == ['urgent', 'work']
+    assert [tag.name for tag in second.tags] == ['urgent']
+    assert [task.id for task in second.links] == [1]  # missing link ignored
+    assert child.parent_id == 1
+    assert child.status == 'to-do'
+
+
+def test_add_tasks_reports_failed_rows(test_session):
+    """
+    Test case for invalid rows in a bulk add not aborting the rest of the batch
+    """
+    result = add_tasks(
+        [{'title': ''}, {'title': 'Valid'}, {'title': 'Orphan', 'parent': 42}],
+        db=test_session,
+    )
+    assert result.added == [1]
+    assert result.failed == [(0, 'Task requires a title'), (2, 'Parent task 42 not found')]
+    assert test_session.query(Task).count() == 1
+
+
+def test_add_tasks_reports_invalid_types(test_session):
+    """
+    Test case for rows with tags / links / parent of the wrong type being reported before anything is written
+    """
+    result = add_tasks(
+        [
+            {'title': 'ok'},
+            {'title': 'bad tags', 'tags': [1]},
+            {'title': 'bad links', 'links': ['2']},
+            {'title': 'bad parent', 'parent': '1'},
+            {'title': 'also ok', 'tags': ['Work']},
+        ],
+        db=test_session,
+    )
+    assert result.added == [1, 2]
+    assert [index for index, _ in result.failed] == [1, 2, 3]
+    assert result.failed[0][1] == 'Tag names must be strings, not 1'
+    assert not test_session.dirty and not test_session.new
+    assert [task.title for task in list_tasks(test_session)] == ['ok', 'also ok']
+
+
+def test_list_tasks_query_count_is_constant(test_engine, test_session, capsys):
+    """
+    Test case for listing and displaying tasks using the same number of queries whatever the number of tasks
+    """
+
+    def count_list_queries():
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(test_engine, 'before_cursor_execute', record)
+        try:
+            for task in list_tasks(db=test_session, load=DISPLAY_FIELDS):
+                display_task(task)
+        finally:
+            event.remove(test_engine, 'before_cursor_execute', record)
+        test_session.expunge_all()  # start each count with an empty identity map
+        return len(statements)
+
+    add_task('Parent', tags=['work'], db=test_session)
+    add_task('Child', tags=['work', 'home'], parent=1, links=[1], db=test_session)
+    few = count_list_queries()
+
+    add_tasks(
+        [{'title': f'Task {i}', 'tags': [f'tag{i % 7}'], 'parent': 1, 'links': [2]} for i in range(200)],
+        db=test_session,
+    )
+    many = count_list_queries()
+
+    assert few == many == 3  # tasks + parents, tags, links
+    assert 'Parent Task: Parent' in capsys.readouterr().out
+
+
+def test_iter_tasks_keyset_pages(test_session):
+    """
+    Test case for streaming tasks in small pages, resuming after a given task
+    """
+    add_tasks(
+        [{'title': title, 'tags': ['even'] if i % 2 == 0 else []} for i, title in enumerate('ccbbaa')],
+        db=test_session,
+    )
+
+    assert [task.id for task in iter_tasks(test_session, chunk_size=4)] == [1, 2, 3, 4, 5, 6]
+    assert [task.id for task in iter_tasks(test_session, after=4, chunk_size=1)] == [5, 6]
+    assert [task.id for task in iter_tasks(test_session, tags=['even'], chunk_size=1)] == [1, 3, 5]
+
+    # duplicate sort keys are split across pages by id
+    by_title = [task.id for task in iter_tasks(test_session, sort='title', chunk_size=1)]
+    assert by_title == [5, 6, 3, 4, 1, 2]
+    assert [task.id for task in iter_tasks(test_session, sort='title', after=3, chunk_size=2)] == [4, 1, 2]
+    assert list(iter_tasks(test_session, after=999)) == []
+
+    # a page size below 1 is refused before any query runs
+    for chunk_size in (0, -1):
+        with pytest.raises(ValueError):
+            iter_tasks(test_session, chunk_size=chunk_size)
+        with pytest.raises(ValueError):
+            iter_task_rows(test_session, chunk_size=chunk_size)
+
+
+def test_sorted_lists_with_limit(test_session):
+    """
+    Test case for sorting by due date, tasks without one last in either direction, and taking the first few
+    """
+    for day in (3, None, 1, 3, None, 2):
+        add_task(f'Task due {day}', dueDate=dt.datetime(2025, 6, day) if day else None, db=test_session)
+    update_task(6, status='done', db=test_session)
+
+    assert [task.id for task in list_tasks(test_session, sort='due')] == [3, 6, 1, 4, 2, 5]
+    assert [task.id for task in list_tasks(test_session, sort='due', desc=True)] == [4, 1, 6, 3, 5, 2]
+    assert [task.id for task in list_tasks(test_session, sort='due', limit=2)] == [3, 6]
+    assert [task.id for task in list_tasks(test_session, status='to-do', sort='due', limit=3)] == [3, 1, 4]
+    assert [row.id for row in list_task_rows(test_session, status='to-do', sort='due', limit=4)] == [3, 1, 4, 2]
+
+    # pages and resumes across the tasks with and without a due date
+    assert [task.id for task in iter_tasks(test_session, sort='due', chunk_size=1)] == [3, 6, 1, 4, 2, 5]
+    assert [task.id for task in iter_tasks(test_session, sort='due', after=4, chunk_size=2)] == [2, 5]
+    assert [task.id for task in iter_tasks(test_session, sort='due', after=2)] == [5]
+    assert [task.id for task in iter_tasks(test_session, sort='due', desc=True, after=6)] == [3, 5, 2]
+
+    update_task(3, title='Task due 1 (moved up)', db=test_session)
+    assert [row.id for row in list_task_rows(test_session, sort='updated', desc=True, limit=1)] == [3]
+    assert [task.id for task in list_tasks(test_session, sort='title', desc=True)][:3] == [5, 2, 4]
+
+
+def test_bulk_update(test_session):
+    """
+    Test case for updating many tasks in one statement by id list and by filter, with journal and counts kept right
+    """
+    add_tasks(
+        [
+            {'title': 'One', 'tags': ['q3']},
+            {'title': 'Two', 'tags': ['q3']},
+            {'title': 'Three', 'tags': ['q3']},
+            {'title': 'Four'},
+        ],
+        db=test_session,
+    )
+    test_session.expire_on_commit = False  # like the CLI's persistent session, loaded tasks must still be refreshed
+    one, four = get_task(1, test_session), get_task(4, test_session)
+
+    assert bulk_update({'status': 'in-progress'}, test_session, task_ids=[1, 2, 3, 99]) == [1, 2, 3]
+    assert bulk_update({'status': 'in-progress'}, test_session, task_ids=[1, 2]) == []  # nothing changes
+    assert bulk_update({'status': 'done'}, test_session, status='in-progress', tags=['q3']) == [1, 2, 3]
+    assert bulk_update({'dueDate': dt.datetime(2025, 6, 1)}, test_session, tags_none=['q3']) == [4]
+
+    assert (one.status, four.status, four.dueDate) == ('done', 'to-do', dt.datetime(2025, 6, 1))
+    assert [task.status for task in list_tasks(test_session)] == ['done', 'done', 'done', 'to-do']
+    assert get_task(4, test_session).dueDate == dt.datetime(2025, 6, 1)
+    assert get_task(1, test_session).updatedAt > get_task(1, test_session).createdAt
+    events = [(event.field, event.old_value, event.new_value) for event in get_events(test_session, task_id=3)]
+    assert events == [('status', 'to-do', 'in-progress'), ('status', 'in-progress', 'done')]
+    assert get_events(test_session, task_id=4)[0].new_value == '2025-06-01 00:00:00'
+    assert get_stats(test_session)['status'] == {'to-do': 1, 'done': 3}
+    assert verify_stats(test_session) == {}
+
+    with pytest.raises(ValueError):
+        bulk_update({}, test_session, task_ids=[1])
+    with pytest.raises(ValueError):
+        bulk_update({'parent_id': 2}, test_session, task_ids=[1])
+
+
+def test_tag_filter_modes(test_session):
+    """
+    Test case for listing tasks with any, all or none of some tags, alone and combined
+    """
+    add_tasks(
+        [
+            {'title': 'Work', 'tags': ['work']},
+            {'title': 'Urgent work', 'tags': ['work', 'urgent']},
+            {'title': 'Urgent work q3', 'tags': ['work', 'urgent', 'q3']},
+            {'title': 'Untagged'},
+        ],
+        db=test_session,
+    )
+
+    def ids(**filters):
+        return [task.id for task in list_tasks(test_session, **filters)]
+
+    assert ids(tags=['urgent', 'q3']) == [2, 3]
+    assert ids(tags_all=['work', 'urgent']) == [2, 3]
+    assert ids(tags_all=['Work', 'urgent', 'q3', 'work']) == [3]  # normalised, duplicates don't count twice
+    assert ids(tags_all=['work', 'missing']) == []
+    assert ids(tags_all=[' '], tags_none=['', ' ']) == [1, 2, 3, 4]  # no tags left after normalising, no filter
+    assert ids(tags_none=['urgent']) == [1, 4]
+    assert ids(tags=['work'], tags_none=['q3']) == [1, 2]
+    assert [row.id for row in list_task_rows(test_session, tags_all=['urgent'], tags_none=['q3'])] == [2]
+    update_task(2, status='done', db=test_session)
+    assert [task.id for task in iter_tasks(test_session, status='done', tags_all=['work', 'urgent'])] == [2]
+
+
+def test_task_rows_match_orm(test_engine, test_session, capsys):
+    """
+    Test case for the TaskRow projection having the same values as the ORM tasks, in one query per page
+    """
+    add_task('Parent', tags=['work'], db=test_session)
+    add_task('Child', tags=['work', 'home'], parent=1, links=[1], db=test_session)
+    add_tasks([{'title': f'Task {i}', 'tags': ['home'], 'parent': 2, 'links': [1, 2]} for i in range(5)], db=test_session)
+
+    tasks = list_tasks(test_session, load=DISPLAY_FIELDS)
+    rows = list_task_rows(test_session)
+    assert [row.id for row in rows] == [task.id for task in tasks]
+    for task, row in zip(tasks, rows):
+        assert (row.title, row.status, row.createdAt, row.parent_id) == (
+            task.title, task.status, task.createdAt, task.parent_id
+        )
+        assert (row.tag_names, row.link_titles, row.parent_title) == (
+            task.tag_names, task.link_titles, task.parent_title
+        )
+    assert [row.id for row in list_task_rows(test_session, tags=['work'])] == [1, 2]
+
+    statements = []
+    event.listen(test_engine, 'before_cursor_execute', lambda conn, cursor, statement, *args: statements.append(statement))
+    paged = [row.id for row in iter_task_rows(test_session, sort='title', chunk_size=3)]
+    assert paged == [task.id for task in iter_tasks(test_session, sort='title')]
+    assert len(statements) == 3 + 1  # three pages of rows, then the ORM query
+
+    display_task(rows[1])
+    output = capsys.readouterr().out
+    assert 'Tags: work, home' in output and 'Linked Tasks: Parent' in output and 'Parent Task: Parent' in output
+
+
+def build_tree(test_session):
+    """
+    1 -> 2 -> 4
+      -> 3
+    """
+    add_task('Root', db=test_session)
+    add_tasks([{'title': 'A', 'parent': 1}, {'title': 'B', 'parent': 1}], db=test_session)
+    add_task('A1', parent=2, db=test_session)
+    update_task(4, status='done', db=test_session)
+    update_task(3, status='done', db=test_session)
+
+
+def test_get_subtree(test_session):
+    """
+    Test case for getting a task's subtasks at any depth, depth first
+    """
+    build_tree(test_session)
+
+    assert [(task.id, depth) for task, depth in get_subtree(1, test_session)] == [(1, 0), (2, 1), (4, 2), (3, 1)]
+    assert [task.id for task, _ in get_subtree(1, test_session, max_depth=1)] == [1, 2, 3]
+    assert [task.id for task, _ in get_subtree(1, test_session, status='done')] == [4, 3]
+    assert get_subtree(99, test_session) == []
+
+
+def test_get_ancestors_and_rollup(test_session):
+    build_tree(test_session)
+
+    assert [(task.id, depth) for task, depth in get_ancestors(4, test_session)] == [(2, 1), (1, 2)]
+    assert get_ancestors(1, test_session) == []
+
+    rollup = subtree_rollup(1, test_session)
+    assert rollup['total'] == 3
+    assert rollup['by_status'] == {'to-do': 1, 'done': 2}
+    assert rollup['percent_done'] == 66.7
+
+
+def test_update_parent_rejects_cycles(test_session):
+    """
+    Test case for a task not being moved under one of its own subtasks
+    """
+    build_tree(test_session)
+
+    assert update_task(1, parent=4, db=test_session) == 'Task 4 is a subtask of task 1, it cannot be its parent'
+    assert update_task(1, parent=1, db=test_session) == 'A task cannot be its own parent'
+    assert test_session.get(Task, 1).parent_id is None
+
+    update_task(4, parent=0, db=test_session)  # detach
+    assert test_session.get(Task, 4).parent_id is None
+    update_task(1, parent=4, db=test_session)
+    assert test_session.get(Task, 1).parent_id == 4
+
+
+def test_subtree_survives_existing_cycle(test_session):
+    """
+    Test case for a parent cycle already in the data (written around update_task) not looping forever
+    """
+    build_tree(test_session)
+    test_session.get(Task, 1).parent_id = 4  # 1 -> 2 -> 4 -> 1
+    test_session.commit()
+
+    assert [task.id for task, _ in get_subtree(1, test_session)] == [1, 2, 4, 3]
+    assert [task.id for task, _ in get_ancestors(4, test_session)] == [2, 1]
+
+
+def test_search_tasks(test_session):
+    """
+    Test case for full text search, kept in sync with adds, updates and deletes
+    """
+    add_task('Write quarterly report', description='Include the sales charts', db=test_session)
+    add_task('Buy groceries', description='Milk for the report meeting', db=test_session)
+    add_task('Book dentist', db=test_session)
+
+    hits = search_tasks('report', test_session)
+    assert [hit.id for hit in hits] == [1, 2]  # title match ranks first
+    assert hits[0].title == 'Write quarterly [report]'
+    assert '[report]' in hits[1].snippet
+
+    assert [hit.id for hit in search_tasks('gro', test_session)] == [2]  # prefix
+    assert search_tasks('gro', test_session, prefix=False) == []
+    assert [hit.id for hit in search_tasks('report sales', test_session)] == [1]  # all words
+    assert search_tasks('"OR (', test_session) == []  # syntax characters are harmless
+
+    update_task(3, title='Book dentist for report', db=test_session)
+    assert {hit.id for hit in search_tasks('report', test_session)} == {1, 2, 3}
+    delete_task(1, db=test_session)
+    assert {hit.id for hit in search_tasks('report', test_session)} == {2, 3}
+
+
+def test_calendar_days(test_session):
+    """
+    Test case for tasks due in a month being counted per day
+    """
+    add_tasks(
+        [
+            {'title': 'Start of month', 'dueDate': dt.datetime(2025, 6, 1)},
+            {'title': 'Morning', 'dueDate': dt.datetime(2025, 6, 15, 9, 30)},
+            {'title': 'Evening', 'dueDate': dt.datetime(2025, 6, 15, 18)},
+            {'title': 'Next month', 'dueDate': dt.datetime(2025, 7, 1)},
+            {'title': 'No due date'},
+        ],
+        db=test_session,
+    )
+
+    assert month_window(2025, 6) == (dt.date(2025, 6, 1), dt.date(2025, 7, 1))
+    assert week_window(dt.date(2025, 6, 15)) == (dt.date(2025, 6, 9), dt.date(2025, 6, 16))
+
+    days = calendar_days(*month_window(2025, 6), test_session)
+    assert [(day['date'], day['count']) for day in days] == [('2025-06-01', 1), ('2025-06-15', 2)]
+    assert days[1]['tasks'] == [
+        {'id': 2, 'title': 'Morning', 'status': 'to-do'},
+        {'id': 3, 'title': 'Evening', 'status': 'to-do'},
+    ]
+    assert [day['date'] for day in calendar_days(*week_window(dt.date(2025, 6, 30)), test_session)] == ['2025-07-01']
+
+
+def test_stats_follow_writes(test_session):
+    """
+    Test case for the maintained counts staying correct through adds, updates, tag changes and deletes
+    """
+    today = dt.date(2025, 6, 15)
+    add_task('Late', dueDate=dt.datetime(2025, 6, 1), tags=['work'], db=test_session)
+    add_task('Today', dueDate=dt.datetime(2025, 6, 15, 17), tags=['work', 'home'], db=test_session)
+    add_tasks([{'title': 'Later', 'dueDate': dt.datetime(2025, 7, 1)}, {'title': 'Whenever'}], db=test_session)
+
+    stats = get_stats(test_session, today=today)
+    assert stats['total'] == 4
+    assert stats['status'] == {'to-do': 4}
+    assert stats['tags'] == {'work': 2, 'home': 1}
+    assert stats['due'] == {'overdue': 1, 'today': 1, 'upcoming': 1}
+
+    update_task(1, status='done', db=test_session)  # no longer overdue
+    update_task(3, dueDate=dt.datetime(2025, 6, 10), db=test_session)  # moved into the past
+    update_task(2, delete_tags=['work'], db=test_session)
+    delete_task(4, db=test_session)
+
+    stats = get_stats(test_session, today=today)
+    assert stats['status'] == {'to-do': 2, 'done': 1}
+    assert stats['tags'] == {'work': 1, 'home': 1}
+    assert stats['due'] == {'overdue': 1, 'today': 1, 'upcoming': 0}
+    assert verify_stats(test_session) == {}
+
+
+def test_stats_verify_and_rebuild(test_session):
+    add_task('Task', tags=['work'], db=test_session)
+    test_session.execute(task_counts.update().values(count=7))
+    test_session.commit()
+
+    assert verify_stats(test_session) == {('status', 'to-do'): (7, 1), ('tag', 'work'): (7, 1)}
+    rebuild_stats(test_session)
+    assert verify_stats(test_session) == {}
+
+
+def test_update_records_events(test_session):
+    """
+    Test case for update_task journaling each changed field with its old and new value
+    """
+    add_task('Draft', tags=['work'], db=test_session)
+    add_task('Other', db=test_session)
+
+    message = update_task(1, title='Final', status='done', tags=['urgent'], delete_tags=['work'], links=[2], db=test_session)
+    assert "'title': 'Final'" in message
+    update_task(1, status='done', db=test_session)  # unchanged, not journaled
+    update_task(2, description='Notes', db=test_session)
+
+    events = [(event.field, event.old_value, event.new_value) for event in get_events(test_session, task_id=1)]
+    assert events == [
+        ('title', 'Draft', 'Final'),
+        ('status', 'to-do', 'done'),
+        ('tags', None, 'urgent'),
+        ('tags', 'work', None),
+        ('links', None, '2'),
+    ]
+    assert [event.task_id for event in get_events(test_session, field='status')] == [1]
+    assert [event.field for event in get_events(test_session, field='description')] == ['description']
+    assert get_events(test_session, since=dt.datetime.now() + dt.timedelta(days=1)) == []
+    assert len(get_events(test_session, limit=2)) == 2
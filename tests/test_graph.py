@@ -0,0 +1,135 @@
+# MODULES
+import sys
+import os
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+from task_tracker.models import Base  # noqa: E402
+from task_tracker.core import add_task, add_tasks, delete_task, notify_rollback, update_task  # noqa: E402
+from task_tracker.graph import DependencyGraph  # noqa: E402
+
+
+# FIXTURES
+@pytest.fixture(scope='function')
+def test_session():
+    """
+    Fixture for a session on an in memory database
+    """
+    engine = create_engine('sqlite:///:memory:')
+    event.listen(engine, 'connect', lambda dbapi_connection, _: dbapi_connection.execute('PRAGMA foreign_keys = ON'))  # as make_engine does
+    Base.metadata.create_all(engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+@pytest.fixture(scope='function')
+def graph(test_session):
+    """
+    Fixture for an attached graph over: 3 -> 2 -> 1, 4 -> 1 (a -> b: a links to / depends on b)
+    """
+    add_task('Design', db=test_session)
+    add_task('Build', links=[1], db=test_session)
+    add_task('Ship', links=[2], db=test_session)
+    add_task('Docs', links=[1], db=test_session)
+    dependency_graph = DependencyGraph.load(test_session).attach()
+    yield dependency_graph
+    dependency_graph.detach()
+
+
+# TESTS
+def test_load(graph):
+    assert graph.ready() == [1]
+    assert graph.dependencies(3) == {1, 2}
+    assert graph.all_dependents(1) == {2, 3, 4}
+    assert graph.topological_order() == [1, 2, 4, 3]
+    assert graph.cycles() == []
+
+
+def test_status_changes_update_ready_queue(graph, test_session):
+    """
+    Test case for finishing tasks releasing the tasks that depend on them
+    """
+    update_task(1, status='done', db=test_session)
+    assert graph.ready() == [2, 4]
+
+    update_task(2, status='done', db=test_session)
+    assert graph.ready() == [3, 4]
+
+    update_task(1, status='to-do', db=test_session)  # reopened, blocks 4 again (2 stays done)
+    assert graph.ready() == [1, 3]
+
+
+def test_link_changes_and_deletes(graph, test_session):
+    update_task(4, delete_links=[1], db=test_session)
+    assert graph.ready() == [1, 4]
+
+    add_tasks([{'title': 'Review', 'links': [3]}], db=test_session)
+    assert graph.dependencies(5) == {1, 2, 3}
+    assert 5 not in graph.ready()
+
+    delete_task(3, db=test_session)
+    assert graph.dependencies(5) == set()
+    assert graph.ready() == [1, 4, 5]
+
+
+def test_incremental_matches_reload(graph, test_session):
+    """
+    Test case for the incrementally maintained graph agreeing with a fresh load
+    """
+    update_task(1, status='done', db=test_session)
+    update_task(4, links=[3], db=test_session)
+    update_task(2, status='in-progress', db=test_session)
+    delete_task(2, db=test_session)
+
+    fresh = DependencyGraph.load(test_session)
+    assert graph.ready() == fresh.ready()
+    assert graph.topological_order() == fresh.topological_order()
+    assert {task_id: graph.dependencies(task_id) for task_id in fresh.status} == {
+        task_id: fresh.dependencies(task_id) for task_id in fresh.status
+    }
+
+
+def test_cycles(graph, test_session):
+    update_task(1, links=[3], db=test_session)  # 1 -> 3 -> 2 -> 1
+    add_task('Self', db=test_session)
+    update_task(5, links=[5], db=test_session)
+
+    assert graph.cycles() == [[1, 2, 3], [5]]
+    assert graph.ready() == []
+    assert graph.topological_order() == []  # 4 waits on 1, which is in the cycle
+
+
+def test_sync_reloads_only_when_needed(test_session):
+    """
+    Test case for an attached graph being loaded on first sync and after a rollback, and otherwise kept current
+    """
+    loads = []
+    event.listen(
+        test_session.get_bind(),
+        'before_cursor_execute',
+        lambda conn, cursor, statement, *args: 'FROM task_links' in statement and loads.append(statement),
+    )
+    dependency_graph = DependencyGraph().attach()
+    try:
+        add_task('Design', db=test_session)
+        add_task('Build', links=[1], db=test_session)
+        assert dependency_graph.sync(test_session).ready() == [1]
+        assert len(loads) == 1
+
+        update_task(1, status='done', db=test_session)
+        assert dependency_graph.sync(test_session).ready() == [2]
+        assert len(loads) == 1
+
+        notify_rollback()
+        assert dependency_graph.sync(test_session).ready() == [2]
+        assert len(loads) == 2
+    finally:
+        dependency_graph.detach()
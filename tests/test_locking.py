@@ -0,0 +1,88 @@
+# MODULES
+import sys
+import os
+import sqlite3
+import threading
+import pytest
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+from task_tracker.models import init_db, make_engine  # noqa: E402
+from task_tracker.core import add_task, list_task_rows  # noqa: E402
+from task_tracker.locking import deferred, is_busy, lock_stats  # noqa: E402
+
+
+# FIXTURES
+@pytest.fixture(scope='function')
+def db_path(tmp_path):
+    """
+    Fixture for an initialised database file
+    """
+    path = str(tmp_path / 'tasks.db')
+    engine = make_engine(path)
+    init_db(engine)
+    engine.dispose()
+    return path
+
+
+@pytest.fixture(scope='function')
+def other_writer(db_path):
+    """
+    Fixture for a raw connection, like another process, that can hold the write lock
+    """
+    connection = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+    yield connection
+    if connection.in_transaction:
+        connection.execute('ROLLBACK')
+    connection.close()
+
+
+# TESTS
+def test_begin_retries_until_the_lock_is_free(db_path, other_writer):
+    """
+    Test case for a write waiting out another writer's transaction with retries, and the wait being counted
+    """
+    engine = make_engine(db_path, {'busy_timeout': 10})  # the busy handler gives up quickly, the retries take over
+    other_writer.execute('BEGIN IMMEDIATE')
+    threading.Timer(0.2, other_writer.execute, ['COMMIT']).start()
+
+    with Session(engine) as db:
+        assert add_task('Waited', db=db) == 'Task 1 added'
+    stats = lock_stats(engine).snapshot()
+    assert stats.contended == 1 and stats.retries >= 1 and stats.failures == 0
+    assert stats.max_wait_seconds >= 0.1
+    engine.dispose()
+
+
+def test_begin_gives_up_after_retries(db_path, other_writer):
+    """
+    Test case for a bounded number of retries, then the busy error, with the connection still usable after
+    """
+    engine = make_engine(db_path, {'busy_timeout': 0})
+    other_writer.execute('BEGIN IMMEDIATE')
+
+    with pytest.raises(OperationalError) as raised, Session(engine) as db:
+        add_task('Blocked', db=db)
+    assert is_busy(raised.value)
+    assert lock_stats(engine).snapshot().failures == 1
+
+    with Session(deferred(engine)) as db:  # a read doesn't need the write lock
+        assert list_task_rows(db) == []
+    other_writer.execute('ROLLBACK')
+    with Session(engine) as db:
+        assert add_task('Unblocked', db=db) == 'Task 1 added'
+    engine.dispose()
+
+
+def test_init_db_reads_the_schema_version_without_the_lock(db_path, other_writer):
+    """
+    Test case for starting against a current database while another process holds the write lock
+    """
+    engine = make_engine(db_path, {'busy_timeout': 0})
+    other_writer.execute('BEGIN IMMEDIATE')
+    assert init_db(engine) is False
+    assert lock_stats(engine).snapshot().contended == 0
+    engine.dispose()
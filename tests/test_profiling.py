@@ -0,0 +1,109 @@
+# MODULES
+import sys
+import os
+import json
+import pytest
+from sqlalchemy.orm import Session
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+from task_tracker.models import init_db, make_engine  # noqa: E402
+from task_tracker.core import add_task, list_task_rows, list_tasks  # noqa: E402
+from task_tracker.profiling import QueryProfiler, format_profile  # noqa: E402
+from task_tracker.cli import run_batch  # noqa: E402
+
+
+# FIXTURES
+@pytest.fixture(scope='function')
+def profiled_engine():
+    """
+    Fixture for an in memory database with two tasks
+    """
+    engine = make_engine(':memory:')
+    init_db(engine)
+    with Session(engine) as db:
+        add_task('First', tags=['work'], db=db)
+        add_task('Second', db=db)
+    yield engine
+    engine.dispose()
+
+
+def test_profiler_records_commands(profiled_engine, tmp_path):
+    """
+    Test case for statements, rows written and objects loaded being recorded per command
+    """
+    json_path = str(tmp_path / 'profile.jsonl')
+    profiler = QueryProfiler(bind=profiled_engine, slowest=2, json_path=json_path).start()
+    try:
+        with Session(profiled_engine) as db:
+            list_tasks(db)  # outside a command, not recorded
+            with profiler.command('add', ['Third']):
+                add_task('Third', tags=['work', 'home'], db=db)
+            added = profiler.last
+            db.expunge_all()  # load everything fresh
+            with profiler.command('list'):
+                list_tasks(db, load=('tags',))
+            listed = profiler.last
+    finally:
+        profiler.stop()
+
+    assert added.command == 'add' and added.args == ['Third']
+    assert added.queries > 0 and added.rows >= 3  # the task and its two tag rows
+    assert len(added.slowest) == 2
+    assert added.slowest[0][0] >= added.slowest[1][0]
+    assert listed.objects_loaded == 3 + 2  # three tasks, two distinct tags
+    assert listed.rows == 0
+    assert listed.rows_returned >= 3  # the tasks, and their tag rows
+    assert 'list: ' in format_profile(listed)
+
+    records = [json.loads(line) for line in open(json_path, encoding='utf-8')]
+    assert [record['command'] for record in records] == ['add', 'list']
+    assert set(records[0]['slowest'][0]) == {'seconds', 'statement'}
+
+
+def test_profile_command(tmp_path, capsys):
+    """
+    Test case for turning profiling on and off from a batch of commands
+    """
+    path = str(tmp_path / 'tasks.db')
+    engine = make_engine(path)
+    init_db(engine)
+    run_batch(['profile on', 'add Profiled', 'profile off', 'add Quiet'], bind=engine)
+    engine.dispose()
+
+    output = capsys.readouterr().out
+    assert output.count('[profile] add:') == 1
+    assert 'Profiling off' in output
+
+
+def test_rows_returned(profiled_engine):
+    """
+    Test case for rows fetched being counted for Core projections, which load no ORM objects
+    """
+    profiler = QueryProfiler(bind=profiled_engine).start()
+    try:
+        with Session(profiled_engine) as db:
+            with profiler.command('list'):
+                rows = list_task_rows(db)
+    finally:
+        profiler.stop()
+
+    assert len(rows) == 2
+    assert profiler.last.objects_loaded == 0
+    assert profiler.last.rows_returned == 2
+    assert '2 rows returned' in format_profile(profiler.last)
+
+
+def test_list_command_rows_returned(tmp_path, capsys):
+    """
+    Test case for the profile of the list command reporting the tasks it returned
+    """
+    path = str(tmp_path / 'tasks.db')
+    engine = make_engine(path)
+    init_db(engine)
+    run_batch(['add One', 'add Two', 'add Three', 'profile on', 'list'], bind=engine)
+    engine.dispose()
+
+    profile_line = [line for line in capsys.readouterr().out.splitlines() if line.startswith('[profile] list:')][0]
+    assert '3 rows returned' in profile_line
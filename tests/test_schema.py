@@ -0,0 +1,191 @@
+# MODULES
+import sys
+import os
+import pytest
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.orm import sessionmaker
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+from task_tracker.models import Task, init_db, task_links  # noqa: E402
+from task_tracker.core import _filter_tasks, _sort_order  # noqa: E402
+from task_tracker.migrations import SCHEMA_VERSION, get_schema_version, migrate  # noqa: E402
+
+# Schema as created by versions before migrations existed (no secondary indexes, user_version 0)
+LEGACY_SCHEMA = [
+    'CREATE TABLE tasks (id INTEGER NOT NULL, title VARCHAR NOT NULL, description VARCHAR, status VARCHAR, '
+    '"dueDate" DATETIME, "createdAt" DATETIME NOT NULL, "updatedAt" DATETIME NOT NULL, parent_id INTEGER, '
+    'PRIMARY KEY (id), FOREIGN KEY(parent_id) REFERENCES tasks (id))',
+    'CREATE TABLE tags (id INTEGER NOT NULL, name VARCHAR NOT NULL, PRIMARY KEY (id), UNIQUE (name))',
+    'CREATE TABLE task_tags (task_id INTEGER NOT NULL, tag_id INTEGER NOT NULL, PRIMARY KEY (task_id, tag_id), '
+    'FOREIGN KEY(task_id) REFERENCES tasks (id), FOREIGN KEY(tag_id) REFERENCES tags (id))',
+    'CREATE TABLE task_links (task_id INTEGER NOT NULL, linked_task_id INTEGER NOT NULL, '
+    'PRIMARY KEY (task_id, linked_task_id), FOREIGN KEY(task_id) REFERENCES tasks (id), '
+    'FOREIGN KEY(linked_task_id) REFERENCES tasks (id))',
+    "INSERT INTO tasks (title, status, \"createdAt\", \"updatedAt\") VALUES ('Old task', 'to-do', '2025-01-01 00:00:00', '2025-01-01 00:00:00')",
+]
+
+
+# FIXTURES
+@pytest.fixture(scope='function')
+def legacy_engine(tmp_path):
+    """
+    Fixture for an engine on a database file created by a pre-migration version
+    """
+    engine = create_engine(f'sqlite:///{tmp_path / "tasks.db"}')
+    with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.exec_driver_sql(statement)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(scope='function')
+def test_session(tmp_path):
+    """
+    Fixture for a session on a freshly initialised database
+    """
+    engine = create_engine(f'sqlite:///{tmp_path / "tasks.db"}')
+    event.listen(engine, 'connect', lambda dbapi_connection, _: dbapi_connection.execute('PRAGMA foreign_keys = ON'))  # as make_engine does
+    init_db(engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+# HELPERS
+def index_names(engine, table: str) -> set:
+    with engine.connect() as conn:
+        return {row[1] for row in conn.exec_driver_sql(f'PRAGMA index_list({table})')}
+
+
+def query_plan(session, statement) -> str:
+    """
+    Return the EXPLAIN QUERY PLAN details of a statement, joined into one string
+    """
+    compiled = statement.compile(
+        dialect=session.bind.dialect, compile_kwargs={'render_postcompile': True}  # expand IN lists
+    )
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    rows = session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', params)
+    return ' | '.join(row[3] for row in rows)
+
+
+# TESTS
+def test_migrate_adds_indexes_to_existing_database(legacy_engine):
+    """
+    Test case for an old database gaining the new indexes in place, keeping its data
+    """
+    assert 'ix_tasks_status' not in index_names(legacy_engine, 'tasks')
+
+    init_db(legacy_engine)
+
+    assert {'ix_tasks_dueDate', 'ix_tasks_parent_id'} <= index_names(legacy_engine, 'tasks')
+    assert 'ix_tasks_status' not in index_names(legacy_engine, 'tasks')  # added by version 1, dropped by version 8
+    assert {'ix_tasks_status_dueDate', 'ix_tasks_status_updatedAt', 'ix_tasks_title'} <= index_names(legacy_engine, 'tasks')
+    assert 'ix_task_links_linked_task_id' in index_names(legacy_engine, 'task_links')
+    with legacy_engine.connect() as conn:
+        assert get_schema_version(conn) == SCHEMA_VERSION
+        assert conn.exec_driver_sql('SELECT title FROM tasks').scalar() == 'Old task'
+
+    assert migrate(legacy_engine) == []  # nothing left to apply
+
+
+def test_init_db_skips_current_schema(legacy_engine):
+    """
+    Test case for init_db running no DDL once the database is stamped with the current schema version
+    """
+    assert init_db(legacy_engine) is True
+    with legacy_engine.begin() as conn:
+        conn.exec_driver_sql('DROP INDEX ix_tasks_title')
+
+    assert init_db(legacy_engine) is False
+    assert 'ix_tasks_title' not in index_names(legacy_engine, 'tasks')  # not recreated, create_all didn't run
+
+
+def test_migrate_adds_delete_actions(legacy_engine):
+    """
+    Test case for an old database gaining ON DELETE actions, dropping the rows orphaned before they were enforced
+    """
+    with legacy_engine.begin() as conn:
+        conn.exec_driver_sql(
+            'INSERT INTO tasks (title, status, "createdAt", "updatedAt", parent_id) '
+            "VALUES ('Orphan', 'to-do', '2025-01-01 00:00:00', '2025-01-01 00:00:00', 99)"
+        )
+        conn.exec_driver_sql("INSERT INTO tags (name) VALUES ('work')")
+        conn.exec_driver_sql('INSERT INTO task_tags (task_id, tag_id) VALUES (1, 1), (99, 1)')
+        conn.exec_driver_sql('INSERT INTO task_links (task_id, linked_task_id) VALUES (2, 1), (2, 99)')
+
+    init_db(legacy_engine)
+
+    with legacy_engine.connect() as conn:
+        actions = {row[3]: row[6] for row in conn.exec_driver_sql('PRAGMA foreign_key_list(task_tags)')}
+        assert actions == {'task_id': 'CASCADE', 'tag_id': 'CASCADE'}
+        assert conn.exec_driver_sql('PRAGMA foreign_key_list(tasks)').one()[6] == 'SET NULL'
+        assert conn.exec_driver_sql('SELECT id, parent_id FROM tasks').all() == [(1, None), (2, None)]
+        assert conn.exec_driver_sql('SELECT task_id FROM task_tags').scalars().all() == [1]
+        assert conn.exec_driver_sql('SELECT linked_task_id FROM task_links').scalars().all() == [1]
+        assert conn.exec_driver_sql("SELECT count FROM task_counts WHERE kind = 'tag'").scalar() == 1
+        assert conn.exec_driver_sql('PRAGMA foreign_key_check').all() == []
+    assert 'ix_task_tags_tag_id_task_id' in index_names(legacy_engine, 'task_tags')
+
+
+def test_status_filter_uses_index(test_session):
+    plan = query_plan(test_session, select(Task).where(Task.status == 'done'))
+    assert 'USING INDEX ix_tasks_status_' in plan  # a (status, sort key) index covers status on its own
+    assert 'ix_tasks_status' not in index_names(test_session.get_bind(), 'tasks')
+
+
+def test_due_date_range_uses_index(test_session):
+    plan = query_plan(
+        test_session,
+        select(Task).where(Task.dueDate >= '2025-06-01', Task.dueDate < '2025-07-01'),
+    )
+    assert 'USING INDEX ix_tasks_dueDate' in plan
+
+
+def test_subtask_lookup_uses_index(test_session):
+    plan = query_plan(test_session, select(Task).where(Task.parent_id == 1))
+    assert 'USING INDEX ix_tasks_parent_id' in plan
+
+
+def test_reverse_link_lookup_uses_index(test_session):
+    plan = query_plan(
+        test_session, select(task_links.c.task_id).where(task_links.c.linked_task_id == 1)
+    )
+    assert 'ix_task_links_linked_task_id' in plan
+
+
+def test_sorted_top_n_reads_an_index_in_order(test_session):
+    """
+    Test case for ORDER BY ... LIMIT of the sorted lists walking an index, without sorting every matching task
+    """
+    due_soon = _filter_tasks(select(Task.id), status='to-do').where(Task.dueDate.isnot(None))
+    plan = query_plan(test_session, due_soon.order_by(*_sort_order('due', False)).limit(20))
+    assert 'ix_tasks_status_dueDate' in plan
+    assert 'TEMP B-TREE' not in plan
+
+    recently_updated = _filter_tasks(select(Task.id), status='done').order_by(*_sort_order('updated', True))
+    plan = query_plan(test_session, recently_updated.limit(20))
+    assert 'ix_tasks_status_updatedAt' in plan
+    assert 'TEMP B-TREE' not in plan
+
+    for sort in ('created', 'title'):
+        plan = query_plan(test_session, select(Task.id).order_by(*_sort_order(sort, False)).limit(20))
+        assert 'TEMP B-TREE' not in plan
+
+
+def test_tag_filters_start_from_the_tags(test_session):
+    """
+    Test case for the tag filters reading task_tags through the (tag_id, task_id) index rather than scanning it
+    """
+    for filters in ({'tags': ['a']}, {'tags_all': ['a', 'b']}):
+        plan = query_plan(test_session, _filter_tasks(select(Task.id), **filters))
+        assert 'ix_task_tags_tag_id_task_id' in plan
+        assert 'SCAN task_tags' not in plan
+    plan = query_plan(test_session, _filter_tasks(select(Task.id), tags_none=['a']))
+    assert 'SEARCH task_tags USING COVERING INDEX' in plan  # the anti-join probes, one lookup per task
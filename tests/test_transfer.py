@@ -0,0 +1,105 @@
+# MODULES
+import sys
+import os
+import io
+import json
+import pytest
+from sqlalchemy.orm import Session
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+from task_tracker.models import Task, init_db, make_engine  # noqa: E402
+from task_tracker.core import add_task, get_task, update_task, verify_stats  # noqa: E402
+from task_tracker.transfer import export_tasks, import_tasks  # noqa: E402
+
+
+# FIXTURES
+@pytest.fixture(scope='function')
+def source_engine():
+    """
+    Fixture for an in memory database with a small task tree, tags and links
+    """
+    engine = make_engine(':memory:')
+    init_db(engine)
+    with Session(engine) as db:
+        add_task('Root', tags=['work'], db=db)
+        add_task('Child', description='with, a comma', parent=1, tags=['work', 'q3'], db=db)
+        add_task('Other', links=[1, 2], db=db)
+        update_task(2, status='done', db=db)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(scope='function')
+def target_engine():
+    """
+    Fixture for an empty in memory database, with a task already in it so the imported ids shift
+    """
+    engine = make_engine(':memory:')
+    init_db(engine)
+    with Session(engine) as db:
+        add_task('Existing', db=db)
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.parametrize('fmt', ['jsonl', 'csv'])
+def test_export_import_round_trip(source_engine, target_engine, fmt):
+    """
+    Test case for exporting tasks and importing them elsewhere, with ids remapped and edges resolved
+    """
+    out = io.StringIO()
+    assert export_tasks(out, fmt=fmt, bind=source_engine, chunk_size=2) == 3
+
+    result = import_tasks(io.StringIO(out.getvalue()), fmt=fmt, bind=target_engine, batch_size=2)
+    assert (result.imported, result.failed, result.unresolved) == (3, [], 0)
+
+    with Session(target_engine) as db:
+        root, child, other = (get_task(task_id, db) for task_id in (2, 3, 4))
+        assert [tag.name for tag in root.tags] == ['work']
+        assert child.parent_id == root.id
+        assert child.description == 'with, a comma'
+        assert child.status == 'done'
+        assert sorted(tag.name for tag in child.tags) == ['q3', 'work']
+        assert sorted(link.id for link in other.links) == [root.id, child.id]
+        assert not verify_stats(db)  # counters kept current by the triggers
+
+
+def test_export_jsonl_rows(source_engine):
+    """
+    Test case for the exported JSONL fields
+    """
+    out = io.StringIO()
+    export_tasks(out, bind=source_engine)
+    rows = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [row['id'] for row in rows] == [1, 2, 3]
+    assert rows[1]['parent_id'] == 1
+    assert rows[1]['tags'] == ['q3', 'work']
+    assert rows[2]['links'] == [1, 2]
+
+
+def test_import_forward_references_and_bad_rows(target_engine):
+    """
+    Test case for a parent later in the file, invalid lines (bad JSON, title, date, tags, links) being skipped and
+    unknown ids being dropped
+    """
+    lines = [
+        json.dumps({'id': 10, 'title': 'Child', 'parent_id': 20, 'links': [99]}),
+        'not json',
+        json.dumps({'id': 11, 'description': 'no title'}),
+        json.dumps({'id': 30, 'title': 'Bad date', 'dueDate': 'soon'}),
+        json.dumps({'id': 31, 'title': 'Bad tags', 'tags': [1]}),
+        json.dumps({'id': 32, 'title': 'Bad links', 'links': {'id': 10}}),
+        json.dumps({'id': 20, 'title': 'Parent', 'links': [10]}),
+    ]
+    result = import_tasks(io.StringIO('\n'.join(lines)), bind=target_engine, batch_size=1)
+    assert result.imported == 2
+    assert [line for line, _ in result.failed] == [2, 3, 4, 5, 6]
+    assert result.unresolved == 1  # link to 99
+
+    with Session(target_engine) as db:
+        titles = {task.title: task for task in db.query(Task)}
+        assert titles['Child'].parent_id == titles['Parent'].id
+        assert titles['Parent'].links == [titles['Child']]
+        assert titles['Child'].links == []